@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import json
+import argparse
+from ware_api import WareAPI, DEFAULT_HOST
+from scan_order_planner import (
+    DEFAULT_MAX_BINS_PER_ORDER,
+    bin_aisles_from_records,
+    create_planned_scan_orders,
+    plan_scan_orders,
+    zone_aisles,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Split a large list of bins into aisle ordered location scan orders via the Ware GraphQL API
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+
+    parser.add_argument(
+        "--endpoint", type=str, help="Optional endpoint value to override the default", default=DEFAULT_HOST
+    )
+    parser.add_argument("--zone-id", help="Zone ID for the scan orders", required=True)
+    parser.add_argument("--bins-file", help="File with one bin name per line", required=True)
+    parser.add_argument("--max-bins", type=int, help="Maximum bins per order", default=DEFAULT_MAX_BINS_PER_ORDER)
+    parser.add_argument("--user-tracking-token", help="Optional base user tracking token", default=None)
+    parser.add_argument(
+        "--snapshot", help="Optional JSON file with zoneLocationsPageV2 records used to map bins to aisles"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without creating orders")
+
+    args = parser.parse_args()
+
+    with open(args.bins_file) as f:
+        bins = [line.strip() for line in f if line.strip()]
+
+    api = WareAPI(host=args.endpoint)
+
+    my_info_result = api.my_info()
+    if my_info_result["status"] != "success":
+        print(f"Error calling myInfo: {my_info_result['message']}.")
+        return
+
+    bin_aisles = {}
+    if args.snapshot:
+        with open(args.snapshot) as f:
+            bin_aisles = bin_aisles_from_records(json.load(f))
+
+    planned_orders = plan_scan_orders(
+        bins, zone_aisles(my_info_result["data"], args.zone_id), bin_aisles, args.max_bins
+    )
+
+    if args.dry_run:
+        print(json.dumps(planned_orders, indent=2))
+        return
+
+    batch = create_planned_scan_orders(api, args.zone_id, planned_orders, args.user_tracking_token)
+    print(json.dumps({"baseToken": batch.base_token, "orders": batch.orders}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
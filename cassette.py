@@ -0,0 +1,457 @@
+import io
+import re
+import gzip
+import json
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.response import HTTPResponse
+
+from ware_api import DEFAULT_HOST, DEFAULT_REGION, WareAPI, root_fields
+
+CASSETTE_VERSION = 1
+# Presigned URLs and upload fields grant access on their own, user ids identify people. Their values are masked
+DEFAULT_REDACTED_KEYS = frozenset({
+    "uploadUrl",
+    "uploadFields",
+    "zoneInventoryReportUrl",
+    "sharedLocationViewUrl",
+    "original",
+    "large",
+    "thumbnail",
+    "userId",
+})
+# Any string carrying a presigned URL's signature is masked too, whatever field it is in
+PRESIGNED_MARKERS = ("X-Amz-Signature", "X-Amz-Credential")
+# Frames handed to the subscription client on replay. connection_ack would make it sign a start message
+DEFAULT_REPLAYED_FRAMES = ("data", "ka", "error")
+# Access key the replay client signs with; nothing checks the signatures
+REPLAY_ACCESS_KEY = "AKIDREPLAY"
+REPLAY_SECRET_KEY = "replay-secret"
+
+_OPERATION_NAME = re.compile(r"\b(?:query|mutation|subscription)\s+(\w+)")
+
+
+def redact(value: Any, keys: Iterable[str] = DEFAULT_REDACTED_KEYS) -> Any:
+    """
+    A copy of a JSON value with the values of the given keys, and any presigned URL, masked. Strings keep their length
+    """
+    keys = keys if isinstance(keys, frozenset) else frozenset(keys)
+    if isinstance(value, dict):
+        return {
+            key: _mask(item) if key in keys else redact(item, keys)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, keys) for item in value]
+    if isinstance(value, str) and any(marker in value for marker in PRESIGNED_MARKERS):
+        return _mask(value)
+    return value
+
+
+def _mask(value: Any) -> Any:
+    return "*" * len(value) if isinstance(value, str) else None
+
+
+def operation_name(query: str) -> Optional[str]:
+    if (match := _OPERATION_NAME.search(query)) is not None:
+        return match.group(1)
+    return None
+
+
+def _decode_body(data: bytes) -> Tuple[Any, bool]:
+    # (body, is_json) of a response. GraphQL responses are stored as JSON, anything else as text
+    try:
+        return json.loads(data), True
+    except ValueError:
+        return data.decode("utf-8", "replace"), False
+
+
+class Cassette:
+    """
+    A recorded session: the GraphQL documents sent, the HTTP exchanges in order with their start offset and duration,
+    and the realtime subscription frames received. Stored as gzipped JSON lines, each document once.
+    """
+
+    def __init__(self, meta: Dict, queries: List[str], exchanges: List[Dict], frames: List[Dict]):
+        self.meta = meta
+        self.queries = queries
+        self.exchanges = exchanges
+        self.frames = frames
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        meta = {}
+        queries: List[str] = []
+        exchanges: List[Dict] = []
+        frames: List[Dict] = []
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                entry = json.loads(line)
+                kind = entry.pop("kind")
+                if kind == "meta":
+                    meta = entry
+                    if meta.get("version") != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version: {meta.get('version')}")
+                elif kind == "query":
+                    queries.append(entry["text"])
+                elif kind == "http":
+                    exchanges.append(entry)
+                elif kind == "frame":
+                    frames.append(entry)
+        return cls(meta, queries, exchanges, frames)
+
+    @property
+    def redacted_keys(self) -> frozenset:
+        """ Keys masked when the cassette was recorded; requests are masked the same way to match them """
+        return frozenset(self.meta.get("redactedKeys", DEFAULT_REDACTED_KEYS))
+
+    @property
+    def duration(self) -> float:
+        """ Seconds from the start of the recording to the end of its last exchange or frame """
+        ends = [exchange["t"] + exchange["elapsed"] for exchange in self.exchanges]
+        ends += [frame["t"] for frame in self.frames]
+        return max(ends, default=0.0)
+
+    def summary(self) -> Dict:
+        operations = defaultdict(int)
+        for exchange in self.exchanges:
+            operations[operation_name(self.queries[exchange["query"]]) or "unnamed"] += 1
+        return {
+            "exchanges": len(self.exchanges),
+            "frames": len(self.frames),
+            "seconds": round(self.duration, 3),
+            "operations": dict(operations),
+        }
+
+
+class _RecordingAdapter(BaseAdapter):
+    # Sends through the adapter it replaces and hands each completed exchange to the recorder
+    def __init__(self, inner: BaseAdapter, recorder: "CassetteRecorder"):
+        super().__init__()
+        self.inner = inner
+        self.recorder = recorder
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        started = time.monotonic()
+        response = self.inner.send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        compressed = response.headers.get("Content-Encoding") == "gzip"
+        content = response.content
+        getattr(response.raw, "release_conn", response.raw.close)()
+        self.recorder.record_exchange(request, response.status_code, content, compressed, started, time.monotonic())
+
+        # The caller reads the decoded body from a fresh raw stream, so streaming decoders still work
+        response.headers.pop("Content-Encoding", None)
+        response.headers["Content-Length"] = str(len(content))
+        response.raw = HTTPResponse(
+            body=io.BytesIO(content), headers=dict(response.headers), status=response.status_code, preload_content=False
+        )
+        response._content = False
+        response._content_consumed = False
+        return response
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class CassetteRecorder:
+    """
+    Records a session to a cassette. attach(api) captures every GraphQL exchange of a WareAPI, and
+    record_subscription(client) every frame a ware_subscription_client.SubscriptionClient receives. Headers are
+    never stored, and the values of redacted_keys are masked in variables, responses and frames. Close the recorder
+    to finish the file. While attached, responses reach the client decoded, so its wire byte metrics show decoded
+    sizes.
+    """
+
+    def __init__(self, path: str, redacted_keys: Iterable[str] = DEFAULT_REDACTED_KEYS, host: str = DEFAULT_HOST):
+        self.path = path
+        self.redacted_keys = frozenset(redacted_keys)
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.queries: Dict[str, int] = {}
+        self.counts = {"exchanges": 0, "frames": 0}
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({
+            "kind": "meta",
+            "version": CASSETTE_VERSION,
+            "host": host,
+            "recorded": time.time(),
+            "redactedKeys": sorted(self.redacted_keys),
+        })
+
+    def _write(self, entry: Dict) -> None:
+        self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def attach(self, api: WareAPI) -> None:
+        """ Record the exchanges of a client. Every thread of a thread_safe client shares the mounted adapter """
+        inner = api.shared_session.get_adapter(api.ware_api_url)
+        api.shared_session.mount(api.ware_api_url, _RecordingAdapter(inner, self))
+
+    def record_exchange(
+        self, request: requests.PreparedRequest, status: int, content: bytes, compressed: bool, started: float, ended: float
+    ) -> None:
+        body = request.body or b""
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        operation = json.loads(body)
+        response, is_json = _decode_body(content)
+        entry = {
+            "kind": "http",
+            "t": round(started - self.started, 6),
+            "elapsed": round(ended - started, 6),
+            "variables": redact(operation.get("variables") or {}, self.redacted_keys),
+            "status": status,
+            "gzip": compressed,
+            "body" if is_json else "text": redact(response, self.redacted_keys) if is_json else response,
+        }
+        with self.lock:
+            if (index := self.queries.get(operation["query"])) is None:
+                index = self.queries[operation["query"]] = len(self.queries)
+                self._write({"kind": "query", "text": operation["query"]})
+            entry["query"] = index
+            self._write(entry)
+            self.counts["exchanges"] += 1
+
+    def record_frame(self, subscription_id: str, message: str) -> None:
+        entry = {
+            "kind": "frame",
+            "t": round(time.monotonic() - self.started, 6),
+            "subscription": subscription_id,
+            "frame": redact(json.loads(message), self.redacted_keys),
+        }
+        with self.lock:
+            self._write(entry)
+            self.counts["frames"] += 1
+
+    def record_subscription(self, client) -> None:
+        """ Record the frames a SubscriptionClient receives, before it handles them. Call before client.run() """
+        on_message = client.on_message
+
+        def recording_on_message(ws, message: str) -> None:
+            self.record_frame(client.subscription_id, message)
+            on_message(ws, message)
+
+        client.on_message = recording_on_message
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def __enter__(self) -> "CassetteRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter answering GraphQL requests from a cassette, so a WareAPI runs without network or credentials.
+    A request gets the recorded response of the same document and variables, the recordings of a repeated request
+    in turn. A request that was never recorded (e.g. with a freshly generated userTrackingToken) gets the next
+    recording of the same document. Each response takes its recorded duration divided by speed; with speed None it
+    is returned at once. Responses recorded compressed are served gzip encoded, compressed when the cassette is loaded.
+    """
+
+    def __init__(self, cassette: Cassette, speed: Optional[float] = 1.0):
+        super().__init__()
+        self.cassette = cassette
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.exact: Dict[Tuple[int, str], List[int]] = defaultdict(list)
+        self.by_query: Dict[int, List[int]] = defaultdict(list)
+        self.positions: Dict[Any, int] = defaultdict(int)
+        self.query_index = {query: index for index, query in enumerate(cassette.queries)}
+        self.redacted_keys = cassette.redacted_keys
+        self.payloads: List[Tuple[bytes, Dict[str, str]]] = []
+        for position, exchange in enumerate(cassette.exchanges):
+            self.exact[(exchange["query"], self._variables_key(exchange["variables"]))].append(position)
+            self.by_query[exchange["query"]].append(position)
+            self.payloads.append(self._payload(exchange))
+        # Requests answered by their own recording, by another recording of the document, or not at all
+        self.stats = {"exact": 0, "inexact": 0, "unmatched": 0}
+
+    @staticmethod
+    def _variables_key(variables: Dict) -> str:
+        return json.dumps(variables, sort_keys=True, separators=(",", ":"))
+
+    @staticmethod
+    def _payload(exchange: Dict) -> Tuple[bytes, Dict[str, str]]:
+        if "body" in exchange:
+            data = json.dumps(exchange["body"], separators=(",", ":")).encode("utf-8")
+            headers = {"Content-Type": "application/json"}
+        else:
+            data = exchange["text"].encode("utf-8")
+            headers = {"Content-Type": "text/plain; charset=utf-8"}
+        if exchange.get("gzip"):
+            data = gzip.compress(data, compresslevel=6, mtime=0)
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(data))
+        return data, headers
+
+    def _next(self, key: Tuple, positions: List[int], exact: bool) -> int:
+        # Exact recordings are served in order and the last one again once they run out; others cycle
+        with self.lock:
+            turn = self.positions[key]
+            self.positions[key] = turn + 1
+            self.stats["exact" if exact else "inexact"] += 1
+        return positions[min(turn, len(positions) - 1)] if exact else positions[turn % len(positions)]
+
+    def match(self, request: requests.PreparedRequest) -> Optional[int]:
+        """ Position in the cassette of the exchange answering a request, None when its document was never recorded """
+        body = request.body or b""
+        if request.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        operation = json.loads(body)
+        if (query := self.query_index.get(operation["query"])) is None:
+            with self.lock:
+                self.stats["unmatched"] += 1
+            return None
+        variables_key = self._variables_key(redact(operation.get("variables") or {}, self.redacted_keys))
+        if (positions := self.exact.get((query, variables_key))) is not None:
+            return self._next((query, variables_key), positions, True)
+        return self._next((query,), self.by_query[query], False)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        started = time.monotonic()
+        position = self.match(request)
+        if position is None:
+            data = json.dumps({"message": "No recorded exchange for this request"}).encode("utf-8")
+            status, headers, elapsed = 501, {"Content-Type": "application/json", "Content-Length": str(len(data))}, 0.0
+        else:
+            exchange = self.cassette.exchanges[position]
+            data, headers = self.payloads[position]
+            status, elapsed = exchange["status"], exchange["elapsed"]
+
+        if self.speed and (remaining := elapsed / self.speed - (time.monotonic() - started)) > 0:
+            time.sleep(remaining)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = HTTPResponse(body=io.BytesIO(data), headers=headers, status=status, preload_content=False)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def replay_client(cassette: Cassette, speed: Optional[float] = 1.0, **client_options) -> WareAPI:
+    """ A WareAPI answered by a ReplayAdapter, with placeholder credentials. client_options go to WareAPI """
+    api = WareAPI(
+        host=cassette.meta.get("host", DEFAULT_HOST),
+        region=client_options.pop("region", DEFAULT_REGION),
+        access_key=REPLAY_ACCESS_KEY,
+        secret_key=REPLAY_SECRET_KEY,
+        **client_options,
+    )
+    api.shared_session.mount(api.ware_api_url, ReplayAdapter(cassette, speed))
+    return api
+
+
+def replay_load(api: WareAPI, cassette: Cassette, speed: Optional[float] = 1.0, threads: int = 8) -> Dict:
+    """
+    Send the recorded requests again through a client, each at its recorded start offset divided by speed (with
+    speed None as fast as the threads allow), so the original load pattern is reproduced against any backend. Returns
+    throughput, errors and how far sending fell behind the schedule.
+    """
+    lags: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    data_keys = {}
+    for index, query in enumerate(cassette.queries):
+        fields = root_fields(query)
+        data_keys[index] = fields[0][0] if len(fields) == 1 else None
+
+    started = time.monotonic()
+
+    def send(exchange: Dict) -> None:
+        nonlocal errors
+        if speed:
+            due = started + exchange["t"] / speed
+            if (wait := due - time.monotonic()) > 0:
+                time.sleep(wait)
+            lag = time.monotonic() - due
+        else:
+            lag = 0.0
+        try:
+            result = api.query(cassette.queries[exchange["query"]], data_keys[exchange["query"]], exchange["variables"])
+            failed = result["status"] != "success"
+        except Exception:
+            failed = True
+        with lock:
+            lags.append(lag)
+            errors += failed
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(send, cassette.exchanges))
+    elapsed = time.monotonic() - started
+
+    return {
+        "exchanges": len(cassette.exchanges),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "exchangesPerSecond": round(len(cassette.exchanges) / elapsed, 1) if elapsed else None,
+        "maxLagSeconds": round(max(lags, default=0.0), 4),
+    }
+
+
+class ReplaySocket:
+    """ Stands in for the websocket a subscription client is given; keeps what the client sends """
+
+    def __init__(self):
+        self.sent: List[str] = []
+        self.closed = False
+
+    def send(self, message: str) -> None:
+        self.sent.append(message)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def replay_frames(
+    cassette: Cassette,
+    on_message: Callable[[Any, str], None],
+    speed: Optional[float] = 1.0,
+    frame_types: Iterable[str] = DEFAULT_REPLAYED_FRAMES,
+    subscription_id: Optional[str] = None,
+) -> Dict:
+    """
+    Deliver recorded realtime frames to a handler taking (web_socket, message), e.g. SubscriptionClient.on_message
+    or a data_handler, at their recorded offsets divided by speed (speed None: back to back). Frames of other types,
+    and of other subscriptions when subscription_id is given, are skipped.
+    """
+    frame_types = set(frame_types)
+    frames = [
+        frame for frame in cassette.frames
+        if frame["frame"].get("type") in frame_types and subscription_id in (None, frame["subscription"])
+    ]
+    messages = [json.dumps(frame["frame"], separators=(",", ":")) for frame in frames]
+    socket = ReplaySocket()
+    first = frames[0]["t"] if frames else 0.0
+
+    started = time.monotonic()
+    for frame, message in zip(frames, messages):
+        if speed and (wait := started + (frame["t"] - first) / speed - time.monotonic()) > 0:
+            time.sleep(wait)
+        on_message(socket, message)
+    elapsed = time.monotonic() - started
+
+    return {
+        "frames": len(frames),
+        "seconds": round(elapsed, 3),
+        "framesPerSecond": round(len(frames) / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+import io
+import os
+import sys
+import json
+import argparse
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Dict, List
+
+import subscriptions
+from cassette import Cassette, CassetteRecorder, replay_client, replay_frames, replay_load
+from local_stand_in import LocalStandIn
+from ware_api import WareAPI
+from ware_subscription_client import SubscriptionClient
+
+ZONE_ID = "zone-1"
+# Throughput figures compared against a baseline
+RATES = ("pagination.recordsPerSecond", "load.exchangesPerSecond", "frames.framesPerSecond")
+
+
+def crawl(api: WareAPI, zone_id: str, limit: int) -> int:
+    return sum(1 for _ in api.iter_zone_locations(zone_id, limit=limit))
+
+
+def scan_order_frames(api: WareAPI, client: SubscriptionClient, zone_id: str, token: str) -> None:
+    """
+    The stand-in has no realtime endpoint, so the frames AppSync would push for a zone's scan orders are built from
+    getLocationScanOrders and delivered to the client's on_message, with keep-alives between them
+    """
+    socket = type("Socket", (), {"send": lambda self, message: None, "close": lambda self: None})()
+    for _ in range(3):
+        orders = api.get_location_scan_orders(zone_id, user_tracking_token=token)["data"]
+        frame = {"id": client.subscription_id, "type": "data", "payload": {"data": {"subscribeLocationScanOrders": orders}}}
+        client.on_message(socket, json.dumps(frame))
+        client.on_message(socket, json.dumps({"type": "ka"}))
+
+
+def record_session(path: str, zone_size: int, limit: int, orders: int) -> None:
+    """ Record a session against the local stand-in: a zone crawl, scan orders with status polls, a WMS upload """
+    with LocalStandIn(zones={ZONE_ID: zone_size}, latency=0.002) as stand_in, CassetteRecorder(path) as recorder:
+        api = stand_in.client()
+        recorder.attach(api)
+        api.my_info()
+        crawl(api, ZONE_ID, limit)
+
+        token = "cassette-benchmark"
+        ids = [
+            api.create_location_scan_order(ZONE_ID, [stand_in.bin_name(index)], token)["data"]["id"]
+            for index in range(orders)
+        ]
+        for _ in range(3):
+            for order_id in ids:
+                api.get_location_scan_order(order_id)
+
+        upload = api.create_wms_location_history_records(
+            ZONE_ID, [{"Location": stand_in.bin_name(index), "LPN": f"LPN{index:010d}"} for index in range(100)]
+        )["data"]
+        api.get_wms_location_history_upload_record(upload["id"])
+
+        client = SubscriptionClient(
+            stand_in.access_key, stand_in.secret_key, api.ware_api_url, subscriptions.location_scan_orders,
+            {"zoneId": ZONE_ID}, lambda ws, message: None,
+        )
+        recorder.record_subscription(client)
+        with redirect_stdout(io.StringIO()):
+            scan_order_frames(api, client, ZONE_ID, token)
+
+
+def run_replays(cassette: Cassette, zone_size: int, limit: int, threads: int, speed: float) -> Dict:
+    report = {"cassette": cassette.summary()}
+
+    api = replay_client(cassette, speed=None)
+    started = time.perf_counter()
+    records = crawl(api, ZONE_ID, limit)
+    elapsed = time.perf_counter() - started
+    report["pagination"] = {
+        "records": records,
+        "seconds": round(elapsed, 3),
+        "recordsPerSecond": round(records / elapsed, 1),
+        "complete": records == zone_size,
+    }
+
+    api = replay_client(cassette, speed=None, thread_safe=True)
+    report["load"] = replay_load(api, cassette, speed=None, threads=threads)
+    report["load"]["unmatched"] = api.session.get_adapter(api.ware_api_url).stats["unmatched"]
+
+    # At the recorded pace, a faithful replay takes about the recorded time divided by speed
+    api = replay_client(cassette, speed=speed, thread_safe=True)
+    report["paced"] = replay_load(api, cassette, speed=speed, threads=threads)
+    report["paced"]["expectedSeconds"] = round(cassette.duration / speed, 3)
+
+    received: List[str] = []
+    client = SubscriptionClient(
+        "AKIDREPLAY", "replay-secret", api.ware_api_url, subscriptions.location_scan_orders, {"zoneId": ZONE_ID},
+        lambda ws, message: received.append(message),
+    )
+    # Keep-alives arm the client's timeout timer, so the replay goes through the real handler but repeats the frames
+    frames = Cassette(cassette.meta, cassette.queries, cassette.exchanges, cassette.frames * 200)
+    with redirect_stdout(io.StringIO()):
+        report["frames"] = replay_frames(frames, client.on_message, speed=None)
+    if client.timeout_timer is not None:
+        client.timeout_timer.cancel()
+    report["frames"]["dataFrames"] = len(received)
+    return report
+
+
+def rate(report: Dict, name: str) -> float:
+    section, field = name.split(".")
+    return report[section][field]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Record a session against the local stand-in to a cassette (cassette.py), or load one recorded against the real
+    # API, then replay it with no network or credentials: a zone crawl, every recorded request at maximum speed and
+    # at the recorded pace, and the recorded subscription frames through SubscriptionClient.on_message. Prints
+    # throughput. With --baseline, exits non-zero when a throughput figure falls more than --tolerance below it, so
+    # the replays can run in CI.
+    # """
+    )
+
+    parser.add_argument("--cassette", help="Replay this cassette instead of recording one")
+    parser.add_argument("--record", help="Keep the recorded cassette at this path")
+    parser.add_argument("--zone-size", type=int, help="Bins in the recorded zone", default=5000)
+    parser.add_argument("--limit", type=int, help="Page size of the zone crawl", default=100)
+    parser.add_argument("--orders", type=int, help="Scan orders created and polled", default=20)
+    parser.add_argument("--threads", type=int, help="Threads sending the recorded requests", default=8)
+    parser.add_argument("--speed", type=float, help="Speed of the paced replay, 2 is twice as fast", default=1.0)
+    parser.add_argument("--baseline", help="JSON report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, help="Allowed throughput drop against the baseline", default=0.25)
+    parser.add_argument("--write-baseline", help="Save the report as a baseline to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.cassette
+        if path is None:
+            path = args.record or os.path.join(directory, "session.jsonl.gz")
+            record_session(path, args.zone_size, args.limit, args.orders)
+        report = run_replays(Cassette.load(path), args.zone_size, args.limit, args.threads, args.speed)
+        report["cassette"]["bytes"] = os.path.getsize(path)
+
+    print(json.dumps(report, indent=2))
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as file:
+            json.dump(report, file, indent=2)
+
+    failures = []
+    if report["load"]["errors"] or report["load"]["unmatched"]:
+        failures.append("replayed requests failed")
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        for name in RATES:
+            if rate(report, name) < rate(baseline, name) * (1 - args.tolerance):
+                failures.append(f"{name} dropped from {rate(baseline, name)} to {rate(report, name)}")
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+DEFAULT_SAMPLE_LIMIT = 1000
+
+
+def _percentile(samples, percentile: float) -> Optional[float]:
+    samples = sorted(samples)
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+class ClientMetrics:
+    """
+    Thread-safe request metrics kept by WareAPI: per operation counts, errors, bytes and a window of recent latencies,
+    per scheduler lane queue waits, plus named counters. last_exchange() returns the most recent request made by the
+    calling thread.
+    """
+
+    def __init__(self, sample_limit: int = DEFAULT_SAMPLE_LIMIT):
+        self.sample_limit = sample_limit
+        self.lock = threading.Lock()
+        self.operations: Dict[str, Dict] = {}
+        self.counters: Dict[str, float] = {}
+        self.queue_waits: Dict[str, Deque[float]] = {}
+        self.local = threading.local()
+
+    def _operation(self, operation: str) -> Dict:
+        if operation not in self.operations:
+            self.operations[operation] = {
+                "requests": 0,
+                "errors": 0,
+                "requestBytes": 0,
+                "responseBytes": 0,
+                "wireRequestBytes": 0,
+                "wireResponseBytes": 0,
+                "compressionSeconds": 0.0,
+                "seconds": 0.0,
+                "latencies": deque(maxlen=self.sample_limit),
+            }
+        return self.operations[operation]
+
+    def record(
+        self,
+        operation: str,
+        elapsed: float,
+        request_bytes: int,
+        response_bytes: int,
+        error: bool = False,
+        wire_request_bytes: Optional[int] = None,
+        wire_response_bytes: Optional[int] = None,
+        compression_seconds: float = 0.0,
+    ) -> None:
+        """
+        Record one request. request_bytes and response_bytes are the uncompressed JSON sizes, the wire sizes are what
+        was transferred (the same unless compressed) and compression_seconds the time spent compressing the request
+        """
+        wire_request_bytes = request_bytes if wire_request_bytes is None else wire_request_bytes
+        wire_response_bytes = response_bytes if wire_response_bytes is None else wire_response_bytes
+        exchange = {
+            "operation": operation,
+            "elapsed": elapsed,
+            "requestBytes": request_bytes,
+            "responseBytes": response_bytes,
+            "wireRequestBytes": wire_request_bytes,
+            "wireResponseBytes": wire_response_bytes,
+            "error": error,
+        }
+        self.local.last_exchange = exchange
+        with self.lock:
+            stats = self._operation(operation)
+            stats["requests"] += 1
+            stats["errors"] += int(error)
+            stats["requestBytes"] += request_bytes
+            stats["responseBytes"] += response_bytes
+            stats["wireRequestBytes"] += wire_request_bytes
+            stats["wireResponseBytes"] += wire_response_bytes
+            stats["compressionSeconds"] += compression_seconds
+            stats["seconds"] += elapsed
+            stats["latencies"].append(elapsed)
+
+    def record_queue_wait(self, lane: str, wait: float) -> None:
+        with self.lock:
+            if lane not in self.queue_waits:
+                self.queue_waits[lane] = deque(maxlen=self.sample_limit)
+            self.queue_waits[lane].append(wait)
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def last_exchange(self) -> Optional[Dict]:
+        return getattr(self.local, "last_exchange", None)
+
+    def set_last_exchange(self, exchange: Optional[Dict]) -> None:
+        """ Make an exchange recorded on another thread the calling thread's last one """
+        self.local.last_exchange = exchange
+
+    def latencies(self, operation: str) -> Deque[float]:
+        with self.lock:
+            return deque(self._operation(operation)["latencies"])
+
+    def percentile(self, operation: str, percentile: float) -> Optional[float]:
+        """ Latency percentile (0-100) over the recent window of an operation, or None without samples """
+        return _percentile(self.latencies(operation), percentile)
+
+    def queue_wait_percentile(self, lane: str, percentile: float) -> Optional[float]:
+        with self.lock:
+            samples = deque(self.queue_waits.get(lane, ()))
+        return _percentile(samples, percentile)
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            operations = {
+                operation: {key: value for key, value in stats.items() if key != "latencies"}
+                for operation, stats in self.operations.items()
+            }
+            counters = dict(self.counters)
+            lanes = {lane: {"requests": len(waits)} for lane, waits in self.queue_waits.items()}
+        for operation, stats in operations.items():
+            stats["p50"] = self.percentile(operation, 50)
+            stats["p99"] = self.percentile(operation, 99)
+            # Uncompressed bytes per byte transferred, 1.0 without compression
+            for direction in ("request", "response"):
+                wire = stats[f"wire{direction.title()}Bytes"]
+                stats[f"{direction}CompressionRatio"] = stats[f"{direction}Bytes"] / wire if wire else None
+        for lane in lanes:
+            lanes[lane]["p50Wait"] = self.queue_wait_percentile(lane, 50)
+            lanes[lane]["p99Wait"] = self.queue_wait_percentile(lane, 99)
+        return {"operations": operations, "lanes": lanes, "counters": counters}
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import hashlib
+import requests
+from typing import Dict, Iterator, List, Optional
+
+from ware_api import LocationFilterV2, RecordSort, WareAPI, WareAPIError, transient_error
+from local_storage import atomic_write_json, read_json
+
+DEFAULT_CRAWL_PAGE_SIZE = 100
+# Attempts at a page that fails with a throttling, server or connection error, and the first backoff between them
+DEFAULT_PAGE_ATTEMPTS = 4
+DEFAULT_RETRY_SECONDS = 0.5
+
+
+def _cursor_error(result: Dict) -> bool:
+    # A GraphQL error about the cursor itself, the only error that means a saved cursor can no longer be used
+    messages = [result.get("message") or ""]
+    messages += [error.get("message") or "" for error in (result.get("response") or {}).get("errors") or []]
+    return any("cursor" in message.lower() for message in messages)
+
+
+def crawl_key(zone_id: str, record_filter: Optional[Dict], sort: RecordSort, shard: Optional[str] = None) -> str:
+    """ Stable identifier of a crawl, derived from everything that determines which records it returns """
+    canonical = json.dumps(
+        {"zoneId": zone_id, "filter": record_filter or {}, "sort": sort.value, "shard": shard},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class ResumableCrawl:
+    """
+    A zoneLocationsPageV2 crawl that persists its progress after every page: zone, filter, sort, endCursor,
+    startIndex and the number of records emitted. Iterating a crawl that was interrupted resumes from its last
+    checkpoint and drops records of the page it had already delivered. If the saved cursor has gone stale (the
+    server rejects the cursor, or the page does not start at the expected index) the crawl restarts from the first
+    page and skips every record id it already emitted, which are kept in an append-only file next to the checkpoint.
+    Throttling, server and connection errors are retried with backoff on every page, so they never cause a restart.
+    Records of the page being processed when the process died may be delivered again.
+    """
+
+    def __init__(
+        self,
+        api: WareAPI,
+        zone_id: str,
+        checkpoint_dir: str,
+        sort: RecordSort = RecordSort.AISLE,
+        record_filter: Optional[LocationFilterV2] = None,
+        limit: int = DEFAULT_CRAWL_PAGE_SIZE,
+        include_images: bool = False,
+        include_inventory: bool = True,
+        shard: Optional[str] = None,
+        page_attempts: int = DEFAULT_PAGE_ATTEMPTS,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+    ):
+        self.api = api
+        self.zone_id = zone_id
+        self.sort = sort
+        self.record_filter = record_filter
+        self.limit = limit
+        self.include_images = include_images
+        self.include_inventory = include_inventory
+        self.shard = shard
+        self.page_attempts = page_attempts
+        self.retry_seconds = retry_seconds
+        self.key = crawl_key(zone_id, record_filter, sort, shard)
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"{self.key}.json")
+        self.ids_path = os.path.join(checkpoint_dir, f"{self.key}.ids")
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def progress(self) -> Dict:
+        """ The saved checkpoint, or an empty one if the crawl has not started """
+        return read_json(self.checkpoint_path) or {
+            "zoneId": self.zone_id,
+            "filter": self.record_filter,
+            "sort": self.sort.value,
+            "shard": self.shard,
+            "endCursor": None,
+            "startIndex": None,
+            "nextIndex": 0,
+            "emitted": 0,
+            "lastPageIds": [],
+            "complete": False,
+        }
+
+    def reset(self) -> None:
+        for path in (self.checkpoint_path, self.ids_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _emitted_ids(self) -> set:
+        if not os.path.exists(self.ids_path):
+            return set()
+        with open(self.ids_path, encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f}
+
+    def _page(self, cursor: Optional[str]) -> Dict:
+        attempt = 1
+        while True:
+            try:
+                result = self.api.zone_locations_page(
+                    self.zone_id,
+                    limit=self.limit,
+                    cursor=cursor,
+                    sort=self.sort,
+                    record_filter=self.record_filter,
+                    include_images=self.include_images,
+                    include_inventory=self.include_inventory,
+                )
+            except requests.RequestException:
+                if attempt >= self.page_attempts:
+                    raise
+            else:
+                if result["status"] == "success" or not transient_error(result) or attempt >= self.page_attempts:
+                    return result
+            time.sleep(self.retry_seconds * 2 ** (attempt - 1))
+            attempt += 1
+
+    def __iter__(self) -> Iterator[Dict]:
+        checkpoint = self.progress()
+        if checkpoint["complete"]:
+            return
+
+        cursor = checkpoint["endCursor"]
+        # Overlap with the page delivered before the restart, only relevant to the first page fetched
+        overlap_ids = set(checkpoint["lastPageIds"])
+        emitted_ids: set = set()
+        result = self._page(cursor)
+        if cursor is not None:
+            page_info = (result.get("data") or {}).get("pageInfo") or {}
+            start_index = page_info.get("startIndex")
+            if result["status"] == "success":
+                stale = start_index is not None and start_index != checkpoint["nextIndex"]
+            else:
+                # Other errors are raised below rather than throwing the crawl's progress away
+                stale = _cursor_error(result)
+            if stale:
+                # Start over and skip every record id already emitted instead
+                emitted_ids = self._emitted_ids()
+                checkpoint["nextIndex"] = 0
+                result = self._page(None)
+
+        while True:
+            if result["status"] != "success":
+                raise WareAPIError(result)
+
+            page = result["data"]
+            page_ids = []
+            for item in page["records"] or []:
+                record_id = item["record"]["id"]
+                page_ids.append(record_id)
+                if record_id in overlap_ids or record_id in emitted_ids:
+                    continue
+                yield item
+                checkpoint["emitted"] += 1
+
+            page_info = page["pageInfo"]
+            self._save(checkpoint, page_info, page_ids)
+            if not page_info["hasNextPage"]:
+                return
+
+            overlap_ids = set()
+            result = self._page(page_info["endCursor"])
+
+    def _save(self, checkpoint: Dict, page_info: Dict, page_ids: List[str]) -> None:
+        with open(self.ids_path, "a", encoding="utf-8") as f:
+            f.writelines(record_id + "\n" for record_id in page_ids)
+            f.flush()
+            os.fsync(f.fileno())
+
+        start_index = page_info.get("startIndex")
+        checkpoint.update(
+            endCursor=page_info["endCursor"],
+            startIndex=start_index,
+            nextIndex=(start_index if start_index is not None else checkpoint["nextIndex"]) + len(page_ids),
+            lastPageIds=page_ids,
+            complete=not page_info["hasNextPage"],
+            updated=time.time(),
+        )
+        atomic_write_json(self.checkpoint_path, checkpoint)
+
+
+def aisle_shards(aisles: List[str], shard_count: int) -> List[Dict[str, str]]:
+    """ Split a zone's ordered aisles into contiguous aisleStart/aisleEnd ranges for sharded crawls """
+    if not aisles:
+        return []
+    shard_count = max(1, min(shard_count, len(aisles)))
+    size, remainder = divmod(len(aisles), shard_count)
+    shards = []
+    start = 0
+    for index in range(shard_count):
+        end = start + size + (1 if index < remainder else 0)
+        shards.append({"aisleStart": aisles[start], "aisleEnd": aisles[end - 1]})
+        start = end
+    return shards
+
+
+def sharded_crawls(
+    api: WareAPI,
+    zone_id: str,
+    checkpoint_dir: str,
+    aisles: List[str],
+    shard_count: int,
+    record_filter: Optional[LocationFilterV2] = None,
+    **options,
+) -> List[ResumableCrawl]:
+    """ One independently checkpointed crawl per aisle range. Run them from separate threads or processes """
+    crawls = []
+    for shard in aisle_shards(aisles, shard_count):
+        shard_filter = dict(record_filter or {"statusFilter": []}, **shard)
+        crawls.append(
+            ResumableCrawl(
+                api,
+                zone_id,
+                checkpoint_dir,
+                record_filter=shard_filter,
+                shard=f"{shard['aisleStart']}-{shard['aisleEnd']}",
+                **options,
+            )
+        )
+    return crawls
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 import json
 import argparse
+from datetime import timedelta
 from ware_api import WareAPI, DEFAULT_HOST
+from scan_order_filter import filter_scan_order_bins
 
 
 def main() -> None:
@@ -19,12 +21,29 @@ def main() -> None:
     parser.add_argument("--zone-id", help="Zone ID for the query", required=True)
     parser.add_argument("--user-tracking-token", help="Optional user tracking token", default=None)
     parser.add_argument("--bins", nargs="+", help="List of bin names to scan")
+    parser.add_argument(
+        "--freshness-minutes",
+        type=int,
+        help="Optional: skip bins scanned within this many minutes or already queued in an open order",
+        default=None,
+    )
 
     args = parser.parse_args()
 
     api = WareAPI(host=args.endpoint)
 
-    response = api.create_location_scan_order(args.zone_id, args.bins, args.user_tracking_token)
+    bins = args.bins
+    if args.freshness_minutes is not None:
+        filter_result = filter_scan_order_bins(
+            api, args.zone_id, bins, freshness_window=timedelta(minutes=args.freshness_minutes)
+        )
+        print(json.dumps({"skipped": filter_result.skipped}, indent=2))
+        bins = filter_result.bins
+        if not bins:
+            print("No bins left to scan")
+            return
+
+    response = api.create_location_scan_order(args.zone_id, bins, args.user_tracking_token)
 
     print(json.dumps(response, indent=2))
 
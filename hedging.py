@@ -0,0 +1,155 @@
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Optional, Tuple
+
+from requests import Response
+
+from client_metrics import ClientMetrics
+
+# Operations that only read, so sending one twice is harmless
+READ_ONLY_OPERATIONS = frozenset({
+    "myInfo",
+    "zoneLocationsPageV2",
+    "zoneLocationsReport",
+    "getLocationScanOrder",
+    "getLocationScanOrders",
+    "wmsLocationHistoryUploadRecord",
+})
+# Status checks are small and latency sensitive. Pages and reports are left out by default, a duplicate costs more
+DEFAULT_HEDGED_OPERATIONS = ("myInfo", "getLocationScanOrder", "getLocationScanOrders", "wmsLocationHistoryUploadRecord")
+DEFAULT_PERCENTILE = 95
+DEFAULT_BUDGET = 0.05
+# Hedges allowed in a burst once the budget has accumulated
+DEFAULT_MAX_BURST = 10
+# Latency samples an operation needs before it is hedged
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MIN_DELAY = 0.005
+# Seconds a computed hedge delay is reused before the percentile is taken again
+DELAY_REFRESH_SECONDS = 1.0
+DEFAULT_MAX_WORKERS = 64
+
+
+class HedgingPolicy:
+    """
+    Hedged requests for read-only operations. A request still unanswered after the given percentile of the
+    operation's recent latencies (from WareAPI.metrics) is sent a second time. The first successful reply is used. The
+    other attempt is cancelled if it is still waiting for a scheduler slot, and otherwise abandoned, with its response
+    closed when it arrives. Each request earns `budget` hedges, up to max_burst, so duplicates stay below that
+    share of the traffic. Counters in the client metrics: hedge.fired, hedge.won (the duplicate answered first) and
+    hedge.overBudget (a hedge was due but the budget was spent).
+    """
+
+    def __init__(
+        self,
+        percentile: float = DEFAULT_PERCENTILE,
+        budget: float = DEFAULT_BUDGET,
+        operations: Iterable[str] = DEFAULT_HEDGED_OPERATIONS,
+        min_samples: int = DEFAULT_MIN_SAMPLES,
+        min_delay: float = DEFAULT_MIN_DELAY,
+        max_burst: float = DEFAULT_MAX_BURST,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.operations = frozenset(operations)
+        if not self.operations <= READ_ONLY_OPERATIONS:
+            raise ValueError(f"Only read-only operations can be hedged: {sorted(self.operations - READ_ONLY_OPERATIONS)}")
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_burst = max_burst
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+        self.delays: Dict[str, Tuple[float, Optional[float]]] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ware-hedge")
+
+    def applies(self, data_key: Optional[str]) -> bool:
+        return data_key in self.operations
+
+    def delay(self, metrics: ClientMetrics, operation: str) -> Optional[float]:
+        """ Seconds to wait before hedging an operation, None while it has too few latency samples """
+        now = time.monotonic()
+        with self.lock:
+            refreshed, delay = self.delays.get(operation, (0.0, None))
+        if now - refreshed < DELAY_REFRESH_SECONDS:
+            return delay
+
+        latencies = metrics.latencies(operation)
+        delay = None
+        if len(latencies) >= self.min_samples:
+            delay = max(self.min_delay, metrics.percentile(operation, self.percentile))
+        with self.lock:
+            self.delays[operation] = (now, delay)
+        return delay
+
+    def _earn(self) -> None:
+        with self.lock:
+            self.tokens = min(self.max_burst, self.tokens + self.budget)
+
+    def _spend(self) -> bool:
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    @staticmethod
+    def _discard(future: Future) -> None:
+        # Releases the connection of an attempt that lost
+        if not future.cancelled() and future.exception() is None and (response := future.result()[0]) is not None:
+            response.close()
+
+    def post(self, api, query: str, data_key: str, variables: Optional[Dict]) -> Response:
+        """ Send a request for WareAPI._post, hedging it when it is slow """
+        self._earn()
+        if (delay := self.delay(api.metrics, data_key)) is None:
+            return api._attempt(query, data_key, variables)
+
+        # Attempts run on the executor, so the lane the caller chose is passed along explicitly
+        lane = getattr(api.local, "lane", None)
+        cancelled = threading.Event()
+
+        def attempt() -> Tuple[Optional[Response], Optional[Dict]]:
+            response = api._attempt(query, data_key, variables, lane=lane, cancelled=cancelled)
+            return response, api.metrics.last_exchange()
+
+        primary = self.executor.submit(attempt)
+        attempts = [primary]
+        if not wait(attempts, timeout=delay).done:
+            if self._spend():
+                api.metrics.increment("hedge.fired")
+                attempts.append(self.executor.submit(attempt))
+            else:
+                api.metrics.increment("hedge.overBudget")
+
+        fallback = None
+        error = None
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in [candidate for candidate in attempts if candidate in done]:
+                try:
+                    response, exchange = future.result()
+                except Exception as attempt_error:
+                    error = error or attempt_error
+                    continue
+                if response is None:
+                    continue
+                if response.ok:
+                    cancelled.set()
+                    for other in pending:
+                        other.add_done_callback(self._discard)
+                    if future is not primary:
+                        api.metrics.increment("hedge.won")
+                    api.metrics.set_last_exchange(exchange)
+                    return response
+                # An error reply is only used when no attempt succeeds
+                fallback = fallback or (response, exchange)
+
+        if fallback is not None:
+            api.metrics.set_last_exchange(fallback[1])
+            return fallback[0]
+        raise error
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False)
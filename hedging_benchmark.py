@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from client_metrics import _percentile
+from hedging import HedgingPolicy
+from local_stand_in import LocalStandIn
+
+
+def observed_latencies(api, order_id: str, calls: int, threads: int) -> List[float]:
+    """ Latency of each get_location_scan_order call as the caller sees it """
+    def timed(_) -> float:
+        started = time.perf_counter()
+        if api.get_location_scan_order(order_id)["status"] != "success":
+            raise RuntimeError("get_location_scan_order failed")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(timed, range(calls)))
+
+
+def summary(latencies: List[float], stand_in: LocalStandIn, requests_before: int, counters: Dict) -> Dict:
+    def milliseconds(percentile: float) -> Optional[float]:
+        return round(_percentile(latencies, percentile) * 1000, 1)
+
+    return {
+        "p50Ms": milliseconds(50),
+        "p99Ms": milliseconds(99),
+        "p999Ms": milliseconds(99.9),
+        "extraRequests": round((stand_in.stats["requests"] - requests_before) / len(latencies) - 1, 3),
+        "hedgesFired": counters.get("hedge.fired", 0),
+        "hedgesWon": counters.get("hedge.won", 0),
+        "overBudget": counters.get("hedge.overBudget", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Compare caller-observed get_location_scan_order latency with and without a HedgingPolicy against the local
+    # stand-in, which answers a share of requests slowly. Prints the percentiles, the extra load and how often hedges
+    # fired and won.
+    # """
+    )
+
+    parser.add_argument("--calls", type=int, help="Status checks per case", default=3000)
+    parser.add_argument("--threads", type=int, help="Concurrent callers", default=8)
+    parser.add_argument("--latency", type=float, help="Stand-in base latency in seconds", default=0.005)
+    parser.add_argument("--slow-rate", type=float, help="Share of slow stand-in responses", default=0.02)
+    parser.add_argument("--slow-latency", type=float, help="Extra seconds of a slow response", default=0.25)
+    parser.add_argument("--percentile", type=float, help="Hedge after this latency percentile", default=95)
+    parser.add_argument("--budget", type=float, help="Hedges allowed per request", default=0.05)
+    args = parser.parse_args()
+
+    report = {}
+    with LocalStandIn(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency) as stand_in:
+        for name, hedging in (
+            ("plain", None), ("hedged", HedgingPolicy(percentile=args.percentile, budget=args.budget))
+        ):
+            api = stand_in.client(thread_safe=True, hedging=hedging)
+            order_id = api.create_location_scan_order("zone-1", [stand_in.bin_name(0)])["data"]["id"]
+            # Warm up the connections and the latency window the hedge delay is taken from
+            observed_latencies(api, order_id, 100, args.threads)
+            requests_before = stand_in.stats["requests"]
+            counters_before = api.metrics.snapshot()["counters"]
+            latencies = observed_latencies(api, order_id, args.calls, args.threads)
+            counters = {
+                name: value - counters_before.get(name, 0)
+                for name, value in api.metrics.snapshot()["counters"].items()
+            }
+            report[name] = summary(latencies, stand_in, requests_before, counters)
+            if hedging is not None:
+                hedging.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+import os
+import time
+import hashlib
+import itertools
+import threading
+from enum import Enum
+from queue import Empty, PriorityQueue
+from urllib.parse import urlsplit, urlunsplit
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from local_storage import atomic_write_bytes, atomic_write_json, read_json
+
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 30
+INDEX_FILE = "index.json"
+INDEX_SAVE_INTERVAL = 50
+
+
+class ImageVariant(str, Enum):  # same as the RecordImage fields, in download priority order
+    THUMBNAIL = "thumbnail"
+    LARGE = "large"
+    ORIGINAL = "original"
+
+
+VARIANT_PRIORITY = {variant: priority for priority, variant in enumerate(ImageVariant)}
+
+
+def image_cache_key(url: str) -> str:
+    # Image URLs are pre-signed, so the query string changes between responses while the object stays the same
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+def _record_images(record: Dict) -> Iterator[Tuple[str, Dict]]:
+    images = record.get("images") or []
+    if isinstance(images, dict):
+        images = [images]
+    for image in images:
+        yield record.get("id") or record.get("recordId"), image
+    for inventory in record.get("inventory") or []:
+        for image in inventory.get("images") or []:
+            yield inventory.get("id") or inventory.get("recordId"), image
+
+
+def iter_record_images(
+    items: Iterable[Dict], variants: Iterable[ImageVariant] = (ImageVariant.THUMBNAIL,)
+) -> Iterator[Tuple[str, ImageVariant, str]]:
+    """
+    Yield (record id, variant, url) for every image of the selected variants found in a record stream. Accepts
+    zoneLocationsPageV2 page items, location scan order bins and bare records, including their inventory images.
+    """
+    variants = list(variants)
+    for item in items:
+        record = item.get("record", item) if isinstance(item, dict) else None
+        if not record:
+            continue
+        for record_id, image in _record_images(record):
+            for variant in variants:
+                if url := image.get(variant.value):
+                    yield record_id, variant, url
+
+
+class DiskImageCache:
+    """
+    Size bounded, content addressed image store. Blobs are stored once per distinct content under their SHA-256 and
+    an index maps each image URL (without its signature) to a blob. The least recently used entries are evicted once
+    the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending_saves = 0
+
+        index = read_json(os.path.join(directory, INDEX_FILE), {})
+        self.entries: Dict[str, Dict] = index.get("entries", {})
+        self.blobs: Dict[str, int] = index.get("blobs", {})
+        self.size = sum(self.blobs.values())
+        self.references: Dict[str, int] = {}
+        for entry in self.entries.values():
+            self.references[entry["digest"]] = self.references.get(entry["digest"], 0) + 1
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def get(self, url: str) -> Optional[str]:
+        """ Path of the cached image for url, or None """
+        with self.lock:
+            entry = self.entries.get(image_cache_key(url))
+            if entry is None:
+                return None
+            path = self._blob_path(entry["digest"])
+            if not os.path.exists(path):
+                self._remove_entry(image_cache_key(url))
+                return None
+            entry["accessed"] = time.time()
+            return path
+
+    def put(self, url: str, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            atomic_write_bytes(path, content)
+
+        with self.lock:
+            # Blobs are only deleted under the lock, so one removed since the check above is written again here
+            if not os.path.exists(path):
+                atomic_write_bytes(path, content)
+            key = image_cache_key(url)
+            if key in self.entries and self.entries[key]["digest"] != digest:
+                self._remove_entry(key)
+            if key not in self.entries:
+                self.references[digest] = self.references.get(digest, 0) + 1
+            self.entries[key] = {"digest": digest, "accessed": time.time()}
+            if digest not in self.blobs:
+                self.blobs[digest] = len(content)
+                self.size += len(content)
+            self._evict(keep=key)
+            self.pending_saves += 1
+            if self.pending_saves >= INDEX_SAVE_INTERVAL:
+                self._save()
+        return path
+
+    def _remove_entry(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        digest = entry["digest"]
+        self.references[digest] -= 1
+        if self.references[digest] <= 0:
+            del self.references[digest]
+            self.size -= self.blobs.pop(digest, 0)
+            try:
+                os.unlink(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        # keep is the entry just stored, whose path the caller is about to return
+        if self.size <= self.max_bytes:
+            return
+        for key, _ in sorted(self.entries.items(), key=lambda item: item[1]["accessed"]):
+            if key == keep:
+                continue
+            self._remove_entry(key)
+            if self.size <= self.max_bytes:
+                break
+
+    def _save(self) -> None:
+        atomic_write_json(os.path.join(self.directory, INDEX_FILE), {"entries": self.entries, "blobs": self.blobs})
+        self.pending_saves = 0
+
+    def flush(self) -> None:
+        with self.lock:
+            self._save()
+
+
+class PrefetchJob:
+    """ A group of image downloads submitted together. Results map each url to its cached file path """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.results: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        if total == 0:
+            self.done.set()
+
+    def _finish(self, url: str, path: Optional[str] = None, error: Optional[str] = None) -> None:
+        with self.lock:
+            if path is not None:
+                self.results[url] = path
+            else:
+                self.errors[url] = error
+            if len(self.results) + len(self.errors) >= self.total:
+                self.done.set()
+
+    def cancel(self) -> None:
+        """ Drop the downloads of this job that have not started yet """
+        self.cancelled.set()
+        self.done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+
+class ImagePrefetcher:
+    """
+    Downloads record images into a DiskImageCache with a pool of worker threads sharing one pooled HTTP session.
+    Work from every job goes through a single priority queue so thumbnails are always fetched before larger variants.
+    """
+
+    def __init__(
+        self,
+        cache: DiskImageCache,
+        max_workers: int = DEFAULT_WORKERS,
+        session: Optional[requests.Session] = None,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.timeout = timeout
+        if session is None:
+            # Image URLs are pre-signed, so they are fetched without the WareAPI request signing
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self.queue: PriorityQueue = PriorityQueue()
+        self.sequence = itertools.count()
+        self.workers: List[threading.Thread] = []
+        self.closed = threading.Event()
+
+    def _start_workers(self) -> None:
+        while len(self.workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _work(self) -> None:
+        while not self.closed.is_set():
+            try:
+                _, _, url, job = self.queue.get(timeout=0.5)
+            except Empty:
+                continue
+            try:
+                if job.cancelled.is_set():
+                    continue
+                job._finish(url, path=self.fetch(url))
+            except Exception as e:
+                job._finish(url, error=str(e))
+            finally:
+                self.queue.task_done()
+
+    def fetch(self, url: str) -> str:
+        """ Return the cached path for url, downloading it first if needed """
+        if (path := self.cache.get(url)) is not None:
+            return path
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return self.cache.put(url, response.content)
+
+    def prefetch(
+        self, items: Iterable[Dict], variants: Iterable[ImageVariant] = (ImageVariant.THUMBNAIL,)
+    ) -> PrefetchJob:
+        """ Queue the selected image variants of a record stream for download. Cached images complete immediately """
+        urls: Dict[str, ImageVariant] = {}
+        for _, variant, url in iter_record_images(items, variants):
+            urls.setdefault(url, variant)
+
+        job = PrefetchJob(len(urls))
+        queued = False
+        for url, variant in urls.items():
+            if (path := self.cache.get(url)) is not None:
+                job._finish(url, path=path)
+                continue
+            self.queue.put((VARIANT_PRIORITY[variant], next(self.sequence), url, job))
+            queued = True
+
+        if queued:
+            self._start_workers()
+        return job
+
+    def close(self) -> None:
+        self.closed.set()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.cache.flush()
+        self.session.close()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+DEFAULT_MODULES = ["ware_api"]
+# Modules only needed for realtime subscriptions, which must not be loaded by a plain query client
+DEFAULT_FORBIDDEN = ["boto3", "botocore", "websocket", "ware_subscription_client"]
+DEFAULT_RUNS = 5
+DEFAULT_MAX_MS = 300.0
+
+
+def import_time_ms(module: str) -> float:
+    """ Cumulative import time of module in a fresh interpreter, as reported by python -X importtime """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in reversed(completed.stderr.splitlines()):
+        # import time: self [us] | cumulative | imported package
+        parts = [part.strip() for part in line.split(":", 1)[-1].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def loaded_modules(module: str, candidates: List[str]) -> List[str]:
+    """ The candidates that importing module pulls into sys.modules """
+    code = f"import sys, json, {module}; print(json.dumps([m for m in {candidates!r} if m in sys.modules]))"
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Measure the cold import time of the client modules and fail when it exceeds a threshold or when a module loads
+    # dependencies that are only needed for subscriptions. Meant to run in CI to guard command line startup latency.
+    # """
+    )
+
+    parser.add_argument("--module", type=str, action="append", help="Module to measure, repeatable", default=None)
+    parser.add_argument("--runs", type=int, help="Fresh interpreter runs per module", default=DEFAULT_RUNS)
+    parser.add_argument("--max-ms", type=float, help="Maximum median import time in ms", default=DEFAULT_MAX_MS)
+    parser.add_argument(
+        "--forbid", type=str, action="append", help="Module that must not be imported, repeatable", default=None
+    )
+    args = parser.parse_args()
+
+    forbidden = args.forbid or DEFAULT_FORBIDDEN
+    report: Dict[str, Dict] = {}
+    failed = False
+    for module in args.module or DEFAULT_MODULES:
+        samples = [import_time_ms(module) for _ in range(args.runs)]
+        median = statistics.median(samples)
+        loaded = loaded_modules(module, forbidden)
+        report[module] = {"medianMs": round(median, 1), "minMs": round(min(samples), 1), "forbiddenLoaded": loaded}
+        failed = failed or median > args.max_ms or bool(loaded)
+
+    print(json.dumps(report, indent=2))
+    if failed:
+        print(f"Import time above {args.max_ms} ms or forbidden modules loaded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,536 @@
+#!/usr/bin/env python
+import re
+import gzip
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+from sigv4 import PAYLOAD_HASH_HEADER, SigV4Signer
+from ware_api import AWS_SERVICE, DEFAULT_REGION, WareAPI, root_fields
+
+# Credentials the stand-in accepts by default. They only sign requests to the local server
+STAND_IN_ACCESS_KEY = "AKIDSTANDIN"
+STAND_IN_SECRET_KEY = "stand-in-secret"
+DEFAULT_ZONES = {"zone-1": 500}
+BINS_PER_AISLE = 50
+# Responses smaller than this are not worth compressing
+COMPRESS_RESPONSES_ABOVE = 1024
+
+_CREDENTIAL = re.compile(r"Credential=([^/]+)/")
+
+
+def _timestamp(seconds: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(seconds))
+
+
+class StandInError(Exception):
+    pass
+
+
+class LocalStandIn:
+    """
+    A local HTTP server answering the Ware GraphQL operations used by WareAPI with generated, deterministic data, so
+    clients, benchmarks and examples can run offline. Requests are checked like the real endpoint would: gzip
+    request bodies are decoded, the payload hash must match the bytes received and the SigV4 signature must verify.
+    Responses are gzip encoded when the client accepts it. Supports myInfo, zoneLocationsPageV2, zoneLocationsReport,
+    scan orders, resetDroneRequiredAction and WMS uploads, including batched (aliased) documents.
+    """
+
+    def __init__(
+        self,
+        zones: Optional[Dict[str, int]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        access_key: str = STAND_IN_ACCESS_KEY,
+        secret_key: str = STAND_IN_SECRET_KEY,
+        region: str = DEFAULT_REGION,
+        tenants: Optional[Dict[str, str]] = None,
+        latency: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        compress_responses: bool = True,
+        verify_signatures: bool = True,
+    ):
+        self.zones = dict(zones or DEFAULT_ZONES)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        # Further access key: secret key pairs accepted, one per tenant (see tenant_pool.py)
+        self.signers = {
+            key: SigV4Signer(key, secret, region, AWS_SERVICE)
+            for key, secret in {access_key: secret_key, **(tenants or {})}.items()
+        }
+        self.latency = latency
+        # A slow_rate share of GraphQL requests take slow_latency seconds longer, a latency tail
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.compress_responses = compress_responses
+        self.verify_signatures = verify_signatures
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.scan_orders: Dict[str, Dict] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.stats = {"requests": 0, "rejected": 0, "gzipRequests": 0, "gzipResponses": 0, "operations": {}, "accessKeys": {}}
+
+        self.server = ThreadingHTTPServer((host, port), _StandInHandler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+    def start(self) -> "LocalStandIn":
+        self.thread = threading.Thread(target=self.server.serve_forever, name="ware-stand-in", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self) -> "LocalStandIn":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def client(self, **kwargs) -> WareAPI:
+        """ A WareAPI pointed at the stand-in and signing with its credentials. kwargs go to WareAPI """
+        kwargs.setdefault("access_key", self.access_key)
+        kwargs.setdefault("secret_key", self.secret_key)
+        api = WareAPI(**kwargs)
+        api.ware_api_url = self.url
+        return api
+
+    # Request checks
+
+    def verify(self, method: str, url: str, headers: Dict[str, str], body: bytes) -> None:
+        """ Raise StandInError unless the payload hash and signature of a request are valid """
+        if headers.get(PAYLOAD_HASH_HEADER) != hashlib.sha256(body).hexdigest():
+            raise StandInError("Payload hash does not match the request body")
+        access_key = _CREDENTIAL.search(headers.get("authorization", ""))
+        signer = self.signers.get(access_key.group(1)) if access_key else None
+        if signer is None:
+            raise StandInError("Unknown access key")
+        with self.lock:
+            counts = self.stats["accessKeys"]
+            counts[signer.access_key] = counts.get(signer.access_key, 0) + 1
+        if not self.verify_signatures:
+            return
+        signed = {
+            name: value for name, value in headers.items()
+            if (name.startswith("x-amz-") and name != "x-amz-date") or name in ("content-type", "content-encoding")
+        }
+        expected = signer.sign(method, url, signed, body, amz_date=headers.get("x-amz-date"))
+        if expected["Authorization"] != headers.get("authorization"):
+            raise StandInError("The request signature does not match")
+
+    # Operations
+
+    def execute(self, payload: Dict) -> Dict:
+        """ Run a GraphQL request payload and return the response document """
+        variables = payload.get("variables") or {}
+        data: Dict[str, Any] = {}
+        errors = []
+        for alias, field, bindings in root_fields(payload.get("query") or ""):
+            arguments = {argument: variables.get(variable) for argument, variable in bindings.items()}
+            resolver = getattr(self, f"_resolve_{field}", None)
+            with self.lock:
+                operations = self.stats["operations"]
+                operations[field] = operations.get(field, 0) + 1
+            try:
+                if resolver is None:
+                    raise StandInError(f"Unknown field {field}")
+                data[alias] = resolver(variables=variables, **arguments)
+            except StandInError as error:
+                data[alias] = None
+                errors.append({"message": str(error), "path": [alias], "errorType": "StandInError"})
+
+        response: Dict[str, Any] = {"data": data}
+        if errors:
+            response["errors"] = errors
+        return response
+
+    def _zone_size(self, zone_id: str) -> int:
+        if zone_id not in self.zones:
+            raise StandInError(f"Zone not found: {zone_id}")
+        return self.zones[zone_id]
+
+    @staticmethod
+    def bin_name(index: int) -> str:
+        return f"{index // BINS_PER_AISLE + 1:02d}-{index % BINS_PER_AISLE + 1:03d}-A"
+
+    def _record(self, zone_id: str, index: int, include_images: bool, include_inventory: bool) -> Dict:
+        # Every seventh bin has a missing LPN, every third holds no pallet
+        lpn = None if index % 3 == 0 else f"LPN{index:010d}"
+        timestamp = _timestamp(self.started_at - index * 60)
+        exceptions = []
+        if index % 7 == 0:
+            exceptions.append({
+                "id": f"{zone_id}-exception-{index}",
+                "type": "MISSING_LPN",
+                "exceptionHistory": [],
+                "parameters": {"lpn": None, "sku": None, "binLocation": self.bin_name(index), "binLocations": None,
+                               "lpnPresentInWms": None, "skuPresentInWms": None, "locationPresentInWms": True,
+                               "wmsReportedLpns": [f"LPN{index:010d}"], "wmsReportedBinLocation": None},
+            })
+        record: Dict[str, Any] = {
+            "id": f"{zone_id}-record-{index}",
+            "aisle": str(index // BINS_PER_AISLE + 1),
+            "binName": self.bin_name(index),
+            "timestamp": timestamp,
+            "sharedLocationViewUrl": f"https://app.example.invalid/location/{zone_id}/{index}",
+            "exceptions": exceptions,
+            "wmsRecords": [{"lpn": lpn, "sku": None, "updatedAt": timestamp, "wmsData": "{}"}] if lpn else [],
+        }
+        if include_images:
+            image = f"https://images.example.invalid/{zone_id}/{index}"
+            record["images"] = [{
+                "large": f"{image}/large.jpg",
+                "original": f"{image}/original.jpg",
+                "thumbnail": f"{image}/thumbnail.jpg",
+                "binLocationOverlay": {"label": self.bin_name(index), "polygon": [{"x": 0.1, "y": 0.1}, {"x": 0.9, "y": 0.9}]},
+                "detectionOverlays": [],
+            }]
+        if include_inventory:
+            record["inventory"] = [
+                {"id": f"{zone_id}-inventory-{index}", "type": "LPN", "text": lpn, "exceptions": []}
+            ] if lpn else []
+        return record
+
+    def _matching_bins(self, zone_id: str, record_filter: Optional[Dict]) -> List[int]:
+        indexes = range(self._zone_size(zone_id))
+        record_filter = record_filter or {}
+        if search := record_filter.get("searchString"):
+            if record_filter.get("searchType", "LOCATION") == "LPN":
+                indexes = [index for index in indexes if index % 3 and search in f"LPN{index:010d}"]
+            else:
+                indexes = [index for index in indexes if search in self.bin_name(index)]
+        if "EXCEPTION" in (record_filter.get("statusFilter") or []):
+            indexes = [index for index in indexes if index % 7 == 0]
+        return list(indexes)
+
+    def _resolve_myInfo(self, variables: Dict) -> Dict:
+        # Aisle names match the "aisle" the records of the zone carry
+        zones = [
+            {"id": zone_id, "name": zone_id, "aisles": [str(aisle + 1) for aisle in range(-(-size // BINS_PER_AISLE))]}
+            for zone_id, size in self.zones.items()
+        ]
+        return {"organizations": [
+            {"name": "Stand-in", "warehouses": [{"id": "warehouse-1", "name": "Stand-in warehouse", "zones": zones}]}
+        ]}
+
+    def _resolve_zoneLocationsPageV2(
+        self,
+        variables: Dict,
+        zoneId: str = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        paginate: Optional[str] = None,
+        filter: Optional[Dict] = None,
+        sort: Optional[str] = None,
+    ) -> Dict:
+        # Cursors are offsets into the matching bins, in bin order whatever the sort
+        bins = self._matching_bins(zoneId, filter)
+        limit = limit or 10
+        offset = int(cursor or 0)
+        if paginate == "PREV":
+            offset = max(0, offset - limit)
+        page = bins[offset:offset + limit]
+        end = offset + len(page)
+        return {
+            "pageInfo": {
+                "endCursor": str(end),
+                "hasNextPage": end < len(bins),
+                "hasPrevPage": offset > 0,
+                "startCursor": str(offset),
+                "startIndex": offset,
+                "totalRecords": len(bins),
+            },
+            "timezone": "UTC",
+            "zoneId": zoneId,
+            "records": [
+                {
+                    "record": self._record(
+                        zoneId, index, variables.get("includeImages", False), variables.get("includeInventory", True)
+                    ),
+                    "cursor": str(offset + position + 1),
+                }
+                for position, index in enumerate(page)
+            ],
+        }
+
+    def _resolve_zoneLocationsReport(self, variables: Dict, zoneId: str = None, **arguments) -> Dict:
+        self._zone_size(zoneId)
+        base = self.url.rsplit("/", 1)[0]
+        return {"zoneInventoryReportUrl": f"{base}/reports/{zoneId}.csv"}
+
+    def report_csv(self, zone_id: str) -> bytes:
+        lines = ["Location,LPN,Exception,Status"]
+        for index in range(self._zone_size(zone_id)):
+            lpn = "" if index % 3 == 0 else f"LPN{index:010d}"
+            exception = "MISSING_LPN" if index % 7 == 0 else ""
+            lines.append(f"{self.bin_name(index)},{lpn},{exception},")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _scan_order(self, order_id: str) -> Dict:
+        # Orders move on one state each time they are read: QUEUED, IN_PROGRESS, then SUCCEEDED
+        with self.lock:
+            if (order := self.scan_orders.get(order_id)) is None:
+                raise StandInError(f"Location scan order not found: {order_id}")
+            order["reads"] += 1
+            status = ("QUEUED", "IN_PROGRESS", "SUCCEEDED")[min(order["reads"] - 1, 2)]
+        bins = order["bins"]
+        names = {state: bins if status == state else [] for state in ("QUEUED", "IN_PROGRESS", "SUCCEEDED")}
+        return {
+            "id": order_id,
+            "name": None,
+            "status": status,
+            "zoneId": order["zoneId"],
+            "createdAt": order["createdAt"],
+            "startTime": order["createdAt"] if status != "QUEUED" else None,
+            "endTime": _timestamp(time.time()) if status == "SUCCEEDED" else None,
+            "userTrackingToken": order["userTrackingToken"],
+            "summary": {
+                "totalBins": len(bins),
+                "queuedBinCount": len(names["QUEUED"]),
+                "queuedBinNames": names["QUEUED"],
+                "inProgressBinCount": len(names["IN_PROGRESS"]),
+                "inProgressBinNames": names["IN_PROGRESS"],
+                "succeededBinCount": len(names["SUCCEEDED"]),
+                "succeededBinNames": names["SUCCEEDED"],
+                "errorBinCount": 0,
+                "errorBinNames": [],
+                "canceledBinCount": 0,
+                "canceledBinNames": [],
+            },
+            "bins": [{"id": f"{order_id}-{name}", "status": status, "error": None, "record": None} for name in bins],
+        }
+
+    def _resolve_createLocationScanOrder(
+        self, variables: Dict, zoneId: str = None, bins: Optional[List[str]] = None, userTrackingToken: str = None
+    ) -> Dict:
+        self._zone_size(zoneId)
+        if not bins:
+            raise StandInError("A location scan order needs at least one bin")
+        order = {
+            "id": str(uuid.uuid4()),
+            "zoneId": zoneId,
+            "bins": list(bins),
+            "userTrackingToken": userTrackingToken,
+            "createdAt": _timestamp(time.time()),
+            "reads": 0,
+        }
+        with self.lock:
+            self.scan_orders[order["id"]] = order
+        return {"id": order["id"], "createdAt": order["createdAt"], "userTrackingToken": userTrackingToken}
+
+    def _resolve_getLocationScanOrder(self, variables: Dict, id: str = None) -> Dict:
+        return self._scan_order(id)
+
+    def _resolve_getLocationScanOrders(
+        self, variables: Dict, zoneId: str = None, userTrackingToken: str = None, status: Optional[List[str]] = None
+    ) -> Dict:
+        with self.lock:
+            order_ids = [
+                order_id for order_id, order in self.scan_orders.items()
+                if order["zoneId"] == zoneId and userTrackingToken in (None, order["userTrackingToken"])
+            ]
+        orders = [self._scan_order(order_id) for order_id in order_ids]
+        if status:
+            statuses = [status] if isinstance(status, str) else status
+            orders = [order for order in orders if order["status"] in statuses]
+        return {"status": "SUCCEEDED", "userTrackingToken": userTrackingToken, "zoneId": zoneId, "orders": orders}
+
+    def _resolve_resetDroneRequiredAction(self, variables: Dict, requiredActionId: str = None) -> Dict:
+        return {"nests": [{"drone": {"id": "drone-1", "requiredActions": []}}]}
+
+    def _create_upload(self, zone_id: str, total_records: Optional[int]) -> Dict:
+        self._zone_size(zone_id)
+        upload_id = str(uuid.uuid4())
+        now = _timestamp(time.time())
+        with self.lock:
+            self.uploads[upload_id] = {
+                "id": upload_id,
+                "zoneId": zone_id,
+                "userId": "stand-in",
+                "status": "SUCCESS" if total_records is not None else "PENDING_UPLOAD",
+                "totalRecords": total_records,
+                "processedRecords": total_records,
+                "skippedRecords": 0 if total_records is not None else None,
+                "failedRecords": 0 if total_records is not None else None,
+                "created": now,
+                "updated": now,
+            }
+        return {
+            "id": upload_id,
+            "uploadFields": json.dumps({"key": f"uploads/{upload_id}"}),
+            "uploadUrl": f"{self.url.rsplit('/', 1)[0]}/uploads/{upload_id}",
+        }
+
+    def _resolve_createWMSLocationHistoryUpload(self, variables: Dict, zoneId: str = None, **arguments) -> Dict:
+        return self._create_upload(zoneId, None)
+
+    def _resolve_createWMSLocationHistoryRecords(
+        self, variables: Dict, zoneId: str = None, records: Optional[List[Dict]] = None
+    ) -> Dict:
+        return self._create_upload(zoneId, len(records or []))
+
+    def _resolve_wmsLocationHistoryUploadRecord(self, variables: Dict, id: str = None) -> Dict:
+        with self.lock:
+            if (upload := self.uploads.get(id)) is None:
+                raise StandInError(f"Upload not found: {id}")
+            return dict(upload)
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.stats[name] += 1
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; with Nagle's algorithm the body waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Dict = None) -> None:
+        stand_in: LocalStandIn = self.server.stand_in
+        headers = dict(headers or {})
+        accepts_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        if stand_in.compress_responses and accepts_gzip and len(body) > COMPRESS_RESPONSES_ABOVE:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+            stand_in._count("gzipResponses")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, document: Dict) -> None:
+        self._send(status, json.dumps(document).encode("utf-8"))
+
+    def do_POST(self) -> None:
+        stand_in: LocalStandIn = self.server.stand_in
+        stand_in._count("requests")
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        if stand_in.slow_rate and random.random() < stand_in.slow_rate:
+            time.sleep(stand_in.slow_latency)
+
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        url = f"http://{self.headers.get('Host')}{self.path}"
+        try:
+            stand_in.verify("POST", url, headers, body)
+        except StandInError as error:
+            stand_in._count("rejected")
+            self._send_json(403, {"errors": [{"errorType": "UnauthorizedException", "message": str(error)}]})
+            return
+
+        try:
+            if headers.get("content-encoding") == "gzip":
+                stand_in._count("gzipRequests")
+                body = gzip.decompress(body)
+            payload = json.loads(body)
+        except (OSError, ValueError) as error:
+            self._send_json(400, {"errors": [{"errorType": "BadRequestException", "message": str(error)}]})
+            return
+        self._send_json(200, stand_in.execute(payload))
+
+    def do_GET(self) -> None:
+        # Report downloads, with Range support like the presigned S3 URLs they stand in for
+        stand_in: LocalStandIn = self.server.stand_in
+        match = re.fullmatch(r"/reports/([^/]+)\.csv", self.path)
+        try:
+            report = stand_in.report_csv(match.group(1)) if match else None
+        except StandInError:
+            report = None
+        if report is None:
+            self._send(404, b"Not found", content_type="text/plain")
+            return
+
+        if ranged := re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", "")):
+            first = int(ranged.group(1))
+            last = min(int(ranged.group(2) or len(report) - 1), len(report) - 1)
+            self.send_response(206)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Range", f"bytes {first}-{last}/{len(report)}")
+            self.send_header("Content-Length", str(last - first + 1))
+            self.end_headers()
+            self.wfile.write(report[first:last + 1])
+            return
+        self._send(200, report, content_type="text/csv", headers={"Accept-Ranges": "bytes"})
+
+
+def iter_stand_in_pages(api: WareAPI, zone_id: str, limit: int) -> Iterator[Dict]:
+    """ Page through a stand-in zone with api, yielding each records page result """
+    cursor = None
+    while True:
+        result = api.zone_locations_page(zone_id, limit=limit, cursor=cursor)
+        yield result
+        if result["status"] != "success" or not result["data"]["pageInfo"]["hasNextPage"]:
+            return
+        cursor = result["data"]["pageInfo"]["endCursor"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Run the local Ware stand-in server. Point WareAPI at it with ware_api_url = the printed URL and the stand-in
+    # credentials, or use LocalStandIn.client() from Python. With --compare the same zone is paged with and without
+    # request and response compression and the transferred bytes are printed.
+    # """
+    )
+
+    parser.add_argument("--port", type=int, help="Port to listen on (0 picks a free port)", default=8765)
+    parser.add_argument("--bins", type=int, help="Bins in the stand-in zone", default=DEFAULT_ZONES["zone-1"])
+    parser.add_argument("--latency", type=float, help="Seconds added to every GraphQL request", default=0.0)
+    parser.add_argument("--compare", action="store_true", help="Compare transfers with and without compression")
+    args = parser.parse_args()
+
+    stand_in = LocalStandIn(zones={"zone-1": args.bins}, port=args.port, latency=args.latency)
+    if not args.compare:
+        print(f"Serving {stand_in.url} (access key {stand_in.access_key}, secret key {stand_in.secret_key})")
+        try:
+            stand_in.server.serve_forever()
+        except KeyboardInterrupt:
+            stand_in.server.server_close()
+        return
+
+    report = {}
+    with stand_in:
+        for name, compress in (("plain", False), ("gzip", True)):
+            stand_in.compress_responses = compress
+            api = stand_in.client(compress_requests_above=1024 if compress else None)
+            records = [{"Location": stand_in.bin_name(index), "LPN": f"LPN{index:010d}"} for index in range(args.bins)]
+            api.create_wms_location_history_records("zone-1", records)
+            for _ in iter_stand_in_pages(api, "zone-1", limit=250):
+                pass
+            report[name] = {
+                operation: {key: stats[key] for key in (
+                    "requests", "requestBytes", "wireRequestBytes", "responseBytes", "wireResponseBytes",
+                    "requestCompressionRatio", "responseCompressionRatio", "compressionSeconds",
+                )}
+                for operation, stats in api.metrics.snapshot()["operations"].items()
+            }
+    report["server"] = stand_in.stats
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+import json
+import tempfile
+from typing import Any
+
+
+def atomic_write_bytes(path: str, content: bytes) -> None:
+    """ Write a file so that readers only ever see the old or the new content, never a partial write """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    atomic_write_bytes(path, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """ Read a JSON file, returning default if it does not exist or is unreadable """
+    try:
+        with open(path, "rb") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return default
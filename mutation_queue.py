@@ -0,0 +1,404 @@
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ware_api import WareAPI, transient_error
+
+WMS_RECORDS = "wmsRecords"
+SCAN_ORDER = "scanOrder"
+
+DEFAULT_MAX_BATCH_RECORDS = 1000
+DEFAULT_MAX_BATCH_ORDERS = 25
+# Seconds the flusher waits after new work arrives, so items enqueued close together share a mutation
+DEFAULT_LINGER = 0.05
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_RETRY_SECONDS = 0.5
+DEFAULT_MAX_RETRY_SECONDS = 60.0
+DEFAULT_CONFIRM_INTERVAL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    zone_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    token TEXT,
+    state TEXT NOT NULL DEFAULT 'queued',
+    batch_id INTEGER,
+    result TEXT,
+    created REAL NOT NULL,
+    completed REAL
+);
+CREATE INDEX IF NOT EXISTS items_queued ON items (state, kind, zone_id, id);
+CREATE INDEX IF NOT EXISTS items_batch ON items (batch_id);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    zone_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    upload_id TEXT,
+    error TEXT
+);
+"""
+
+# Item states: queued, batched, done, failed. Batch states: ready (to send), sending (a request is in flight),
+# unknown (a request may or may not have been applied), uploaded (waiting for a WMS upload to be processed), done,
+# failed. A batch found in sending when the queue opens was interrupted by a crash and is treated as unknown.
+_OPEN_BATCH_STATES = ("ready", "sending", "unknown", "uploaded")
+
+
+class MutationQueue:
+    """
+    Durable write-behind queue for createWMSLocationHistoryRecords and createLocationScanOrder. Enqueueing writes
+    the item to a SQLite database in WAL mode and returns at once; a background flusher coalesces queued items per
+    zone into batched mutations (all queued WMS records of a zone in one upload, scan orders in one aliased request)
+    and reports each item's result to its callback and to on_complete, as {"id", "kind", "zoneId", "status", "data"
+    or "message"}. Work survives restarts: items still open when the process stopped are sent when the queue is
+    opened again, and callbacks registered with enqueue are replaced by on_complete for them.
+
+    Retries are idempotent. Every scan order carries a userTrackingToken, and before an order whose request may have
+    been applied is sent again, the orders with its token are looked up and an existing one is used. WMS record
+    uploads keep the upload id they were given; with confirm_uploads the batch completes only once the upload has
+    been processed, and is only sent again if processing failed. A record batch whose request failed without an
+    upload id is sent again, a repeated location snapshot leaves the same state.
+    """
+
+    def __init__(
+        self,
+        api: WareAPI,
+        path: str,
+        on_complete: Optional[Callable[[Dict], None]] = None,
+        max_batch_records: int = DEFAULT_MAX_BATCH_RECORDS,
+        max_batch_orders: int = DEFAULT_MAX_BATCH_ORDERS,
+        linger: float = DEFAULT_LINGER,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+        max_retry_seconds: float = DEFAULT_MAX_RETRY_SECONDS,
+        confirm_uploads: bool = False,
+        confirm_interval: float = DEFAULT_CONFIRM_INTERVAL,
+        synchronous: str = "NORMAL",
+        start: bool = True,
+    ):
+        self.api = api
+        self.path = path
+        self.on_complete = on_complete
+        self.max_batch_records = max_batch_records
+        self.max_batch_orders = max_batch_orders
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.confirm_uploads = confirm_uploads
+        self.confirm_interval = confirm_interval
+        self.callbacks: Dict[int, Callable[[Dict], None]] = {}
+
+        # One connection, used under the lock. In WAL mode with synchronous=NORMAL a commit survives a process crash
+        # without waiting for fsync; synchronous="FULL" also survives power loss, at the cost of an fsync per enqueue
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={synchronous}")
+        self.db.executescript(SCHEMA)
+        self.db.execute("UPDATE batches SET state = 'unknown' WHERE state = 'sending'")
+
+        self.wake = threading.Condition(self.lock)
+        self.stopped = False
+        self.thread: Optional[threading.Thread] = None
+        if start:
+            self.start()
+
+    # Producers
+
+    def _enqueue(
+        self, kind: str, zone_id: str, payload: Dict, size: int, token: Optional[str], callback: Optional[Callable]
+    ) -> int:
+        with self.lock:
+            item_id = self.db.execute(
+                "INSERT INTO items (kind, zone_id, payload, size, token, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, zone_id, json.dumps(payload, separators=(",", ":")), size, token, time.time()),
+            ).lastrowid
+            if callback is not None:
+                self.callbacks[item_id] = callback
+            self.wake.notify()
+        return item_id
+
+    def enqueue_wms_records(
+        self, zone_id: str, records: List[Dict], callback: Optional[Callable[[Dict], None]] = None
+    ) -> int:
+        """ Queue WMS location history records for a zone. Returns the item id """
+        return self._enqueue(WMS_RECORDS, zone_id, {"records": records}, len(records), None, callback)
+
+    def enqueue_scan_order(
+        self,
+        zone_id: str,
+        bins: List[str],
+        user_tracking_token: Optional[str] = None,
+        callback: Optional[Callable[[Dict], None]] = None,
+    ) -> int:
+        """ Queue a location scan order. A userTrackingToken is generated when none is given. Returns the item id """
+        token = user_tracking_token or str(uuid.uuid4())
+        return self._enqueue(SCAN_ORDER, zone_id, {"bins": bins}, 1, token, callback)
+
+    def status(self, item_id: int) -> Optional[Dict]:
+        """ State of an item: queued, batched, done or failed, with its result once completed """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT kind, zone_id, token, state, result FROM items WHERE id = ?", (item_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        kind, zone_id, token, state, result = row
+        return {"id": item_id, "kind": kind, "zoneId": zone_id, "userTrackingToken": token, "state": state,
+                "result": json.loads(result) if result else None}
+
+    def pending(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM items WHERE state IN ('queued', 'batched')").fetchone()[0]
+
+    # Flushing
+
+    def _form_batches(self) -> None:
+        # Groups the queued items of each kind and zone into batches, oldest first
+        with self.lock:
+            groups = self.db.execute("SELECT DISTINCT kind, zone_id FROM items WHERE state = 'queued'").fetchall()
+            for kind, zone_id in groups:
+                limit = self.max_batch_records if kind == WMS_RECORDS else self.max_batch_orders
+                rows = self.db.execute(
+                    "SELECT id, size FROM items WHERE state = 'queued' AND kind = ? AND zone_id = ? ORDER BY id",
+                    (kind, zone_id),
+                ).fetchall()
+                self.db.execute("BEGIN")
+                batch: List[int] = []
+                size = 0
+                for item_id, item_size in rows:
+                    if batch and size + item_size > limit:
+                        self._insert_batch(kind, zone_id, batch)
+                        batch, size = [], 0
+                    batch.append(item_id)
+                    size += item_size
+                if batch:
+                    self._insert_batch(kind, zone_id, batch)
+                self.db.execute("COMMIT")
+
+    def _insert_batch(self, kind: str, zone_id: str, item_ids: List[int]) -> None:
+        batch_id = self.db.execute(
+            "INSERT INTO batches (kind, zone_id, state) VALUES (?, ?, 'ready')", (kind, zone_id)
+        ).lastrowid
+        self.db.executemany(
+            "UPDATE items SET state = 'batched', batch_id = ? WHERE id = ?", [(batch_id, item_id) for item_id in item_ids]
+        )
+
+    def _due_batches(self, now: float) -> List[Tuple]:
+        with self.lock:
+            return self.db.execute(
+                f"SELECT id, kind, zone_id, state, attempts, upload_id FROM batches "
+                f"WHERE state IN {_OPEN_BATCH_STATES} AND next_attempt <= ? ORDER BY id",
+                (now,),
+            ).fetchall()
+
+    def _open_items(self, batch_id: int) -> List[Tuple[int, Dict, Optional[str]]]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, payload, token FROM items WHERE batch_id = ? AND state = 'batched' ORDER BY id", (batch_id,)
+            ).fetchall()
+        return [(item_id, json.loads(payload), token) for item_id, payload, token in rows]
+
+    def _set_batch(self, batch_id: int, **columns) -> None:
+        with self.lock:
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            self.db.execute(f"UPDATE batches SET {assignments} WHERE id = ?", (*columns.values(), batch_id))
+
+    def _retry(self, batch_id: int, attempts: int, state: str, error: str, items: List[Tuple]) -> List[Dict]:
+        # Backs a batch off exponentially, or fails its items once it is out of attempts
+        attempts += 1
+        if attempts >= self.max_attempts:
+            self._set_batch(batch_id, state="failed", attempts=attempts, error=error)
+            return self._complete(items, {"status": "error", "message": error})
+        delay = min(self.max_retry_seconds, self.retry_seconds * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        self._set_batch(batch_id, state=state, attempts=attempts, error=error, next_attempt=time.time() + delay)
+        return []
+
+    def _complete(self, items: List[Tuple], result: Dict, results: Optional[List[Dict]] = None) -> List[Dict]:
+        # Stores the outcome of items and returns the notifications to deliver
+        notifications = []
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            for index, (item_id, _, _) in enumerate(items):
+                item_result = results[index] if results is not None else result
+                # The raw response kept with batched errors is not stored
+                item_result = {key: item_result[key] for key in ("status", "data", "message") if key in item_result}
+                self.db.execute(
+                    "UPDATE items SET state = ?, result = ?, completed = ? WHERE id = ?",
+                    ("done" if item_result["status"] == "success" else "failed", json.dumps(item_result), now, item_id),
+                )
+                notifications.append((item_id, item_result))
+            self.db.execute("COMMIT")
+            rows = {
+                item_id: (kind, zone_id) for item_id, kind, zone_id in self.db.execute(
+                    f"SELECT id, kind, zone_id FROM items WHERE id IN ({','.join('?' * len(items))})",
+                    [item[0] for item in items],
+                )
+            } if items else {}
+        return [
+            {"id": item_id, "kind": rows[item_id][0], "zoneId": rows[item_id][1], **item_result}
+            for item_id, item_result in notifications
+        ]
+
+    def _flush_scan_orders(self, batch_id: int, zone_id: str, state: str, attempts: int) -> List[Dict]:
+        items = self._open_items(batch_id)
+        completed: List[Dict] = []
+        if state == "unknown":
+            # The previous request may have created some orders: those found by token are not created again
+            remaining = []
+            for item in items:
+                try:
+                    result = self.api.get_location_scan_orders(zone_id, user_tracking_token=item[2])
+                except Exception as error:
+                    return completed + self._retry(batch_id, attempts, "unknown", repr(error), items)
+                orders = (result.get("data") or {}).get("orders") or [] if result["status"] == "success" else None
+                if orders is None:
+                    return completed + self._retry(batch_id, attempts, "unknown", result.get("message", ""), items)
+                if orders:
+                    existing = orders[0]
+                    completed += self._complete([item], {"status": "success", "data": {
+                        "id": existing["id"], "createdAt": existing["createdAt"], "userTrackingToken": item[2]
+                    }})
+                else:
+                    remaining.append(item)
+            items = remaining
+        if not items:
+            self._set_batch(batch_id, state="done")
+            return completed
+
+        self._set_batch(batch_id, state="sending")
+        try:
+            results = self.api.create_location_scan_orders(zone_id, [(item[1]["bins"], item[2]) for item in items])
+        except Exception as error:
+            return completed + self._retry(batch_id, attempts, "unknown", repr(error), items)
+        if any(result["status"] != "success" and transient_error(result) for result in results):
+            # A throttled or failed request may still have been applied in part
+            return completed + self._retry(batch_id, attempts, "unknown", results[0].get("message", ""), items)
+        self._set_batch(batch_id, state="done")
+        return completed + self._complete(items, {}, results)
+
+    def _flush_wms_records(self, batch_id: int, zone_id: str, state: str, attempts: int, upload_id: Optional[str]) -> List[Dict]:
+        items = self._open_items(batch_id)
+        if state == "uploaded":
+            try:
+                result = self.api.get_wms_location_history_upload_record(upload_id)
+            except Exception as error:
+                self._set_batch(batch_id, error=repr(error), next_attempt=time.time() + self.confirm_interval)
+                return []
+            upload_status = (result.get("data") or {}).get("status") if result["status"] == "success" else None
+            if upload_status == "SUCCESS":
+                self._set_batch(batch_id, state="done")
+                return self._complete(items, result)
+            if upload_status == "FAILURE":
+                self._set_batch(batch_id, upload_id=None)
+                return self._retry(batch_id, attempts, "ready", f"Upload {upload_id} failed", items)
+            self._set_batch(batch_id, next_attempt=time.time() + self.confirm_interval)
+            return []
+
+        records = [record for _, payload, _ in items for record in payload["records"]]
+        self._set_batch(batch_id, state="sending")
+        try:
+            result = self.api.create_wms_location_history_records(zone_id, records)
+        except Exception as error:
+            return self._retry(batch_id, attempts, "ready", repr(error), items)
+        if result["status"] != "success":
+            if transient_error(result):
+                return self._retry(batch_id, attempts, "ready", result.get("message", ""), items)
+            self._set_batch(batch_id, state="failed", error=result.get("message"))
+            return self._complete(items, result)
+
+        upload_id = result["data"]["id"]
+        if self.confirm_uploads:
+            self._set_batch(batch_id, state="uploaded", upload_id=upload_id, next_attempt=time.time() + self.confirm_interval)
+            return []
+        self._set_batch(batch_id, state="done", upload_id=upload_id)
+        return self._complete(items, result)
+
+    def _notify(self, notifications: List[Dict]) -> None:
+        for notification in notifications:
+            with self.lock:
+                callback = self.callbacks.pop(notification["id"], None)
+            for handler in (callback, self.on_complete):
+                if handler is None:
+                    continue
+                try:
+                    handler(notification)
+                except Exception as e:
+                    print(f"Mutation queue callback failed for item {notification['id']}: {e}")
+
+    def flush(self) -> int:
+        """ Send everything that is due now. Returns the number of items completed or failed """
+        self._form_batches()
+        completed = 0
+        for batch_id, kind, zone_id, state, attempts, upload_id in self._due_batches(time.time()):
+            if kind == SCAN_ORDER:
+                notifications = self._flush_scan_orders(batch_id, zone_id, state, attempts)
+            else:
+                notifications = self._flush_wms_records(batch_id, zone_id, state, attempts, upload_id)
+            self._notify(notifications)
+            completed += len(notifications)
+        return completed
+
+    def _next_wakeup(self) -> Optional[float]:
+        # Seconds until the next batch retry or confirmation, None when there is nothing scheduled
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT MIN(next_attempt) FROM batches WHERE state IN {_OPEN_BATCH_STATES}"
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _run(self) -> None:
+        while True:
+            timeout = self._next_wakeup()
+            with self.wake:
+                if self.stopped:
+                    return
+                queued = self.db.execute("SELECT 1 FROM items WHERE state = 'queued' LIMIT 1").fetchone()
+                if queued is None and timeout != 0:
+                    self.wake.wait(timeout)
+                if self.stopped:
+                    return
+            time.sleep(self.linger)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Mutation queue flush failed: {e}")
+                time.sleep(self.retry_seconds)
+
+    def start(self) -> None:
+        """ Start the background flusher """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="ware-mutation-queue", daemon=True)
+            self.thread.start()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """ Wait until no item is queued or in flight. Returns False on timeout """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            if self.thread is None:
+                self.flush()
+            time.sleep(0.01)
+        return True
+
+    def close(self) -> None:
+        """ Stop the flusher and close the database. Items not yet sent stay queued for the next run """
+        with self.wake:
+            self.stopped = True
+            self.wake.notify()
+        if self.thread is not None:
+            self.thread.join()
+        self.db.close()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List
+
+from client_metrics import _percentile
+from local_stand_in import LocalStandIn
+from mutation_queue import MutationQueue
+
+ZONE_IDS = ["zone-1", "zone-2"]
+
+
+def enqueue_all(queue: MutationQueue, stand_in: LocalStandIn, items: int, completed: List[Dict]) -> List[float]:
+    """ Enqueue a mix of WMS records and scan orders, returning the seconds each enqueue call took """
+    timings = []
+    for index in range(items):
+        zone_id = ZONE_IDS[index % len(ZONE_IDS)]
+        bin_name = stand_in.bin_name(index % stand_in.zones[zone_id])
+        started = time.perf_counter()
+        if index % 4 == 3:
+            queue.enqueue_scan_order(zone_id, [bin_name], callback=completed.append)
+        else:
+            queue.enqueue_wms_records(zone_id, [{"Location": bin_name, "LPN": f"LPN{index:010d}"}], callback=completed.append)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Measure the durable mutation queue (mutation_queue.py) against the local stand-in: how long an enqueue call
+    # takes, how many requests the flusher needs for the items, and whether items left behind by a stopped process
+    # are delivered when the queue is opened again, including scan orders whose request was in flight. Exits non-zero
+    # when an item is lost or a scan order is created twice.
+    # """
+    )
+
+    parser.add_argument("--items", type=int, help="Items enqueued", default=5000)
+    parser.add_argument("--latency", type=float, help="Stand-in seconds per GraphQL request", default=0.005)
+    parser.add_argument("--synchronous", help="SQLite synchronous setting", default="NORMAL")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory, LocalStandIn(zones={zone_id: 500 for zone_id in ZONE_IDS}, latency=args.latency) as stand_in:
+        api = stand_in.client()
+
+        # Enqueue latency and coalescing while the flusher runs
+        completed: List[Dict] = []
+        queue = MutationQueue(api, os.path.join(directory, "live.db"), synchronous=args.synchronous)
+        requests_before = stand_in.stats["requests"]
+        started = time.perf_counter()
+        timings = enqueue_all(queue, stand_in, args.items, completed)
+        queue.drain()
+        elapsed = time.perf_counter() - started
+        queue.close()
+        report["live"] = {
+            "items": args.items,
+            "enqueueP50Us": round(_percentile(timings, 50) * 1e6, 1),
+            "enqueueP99Us": round(_percentile(timings, 99) * 1e6, 1),
+            "requests": stand_in.stats["requests"] - requests_before,
+            "seconds": round(elapsed, 2),
+            "succeeded": sum(result["status"] == "success" for result in completed),
+        }
+
+        # A process that stops before its queue is flushed, with one scan order batch in flight
+        path = os.path.join(directory, "restart.db")
+        queue = MutationQueue(api, path, start=False)
+        enqueue_all(queue, stand_in, 400, [])
+        queue._form_batches()
+        batch_id, _, zone_id, _, _, _ = next(batch for batch in queue._due_batches(time.time()) if batch[1] == "scanOrder")
+        in_flight = queue._open_items(batch_id)
+        api.create_location_scan_orders(zone_id, [(payload["bins"], token) for _, payload, token in in_flight])
+        queue._set_batch(batch_id, state="sending")
+        queue.close()
+
+        recovered: List[Dict] = []
+        orders_before = len(stand_in.scan_orders)
+        queue = MutationQueue(api, path, on_complete=recovered.append)
+        queue.drain()
+        queue.close()
+        tokens = [order["userTrackingToken"] for order in stand_in.scan_orders.values()]
+        report["restart"] = {
+            "items": 400,
+            "delivered": sum(result["status"] == "success" for result in recovered),
+            "inFlightOrders": len(in_flight),
+            "ordersCreated": len(stand_in.scan_orders) - orders_before,
+            "duplicateOrders": len(tokens) - len(set(tokens)),
+        }
+
+    print(json.dumps(report, indent=2))
+    if (report["live"]["succeeded"] != args.items or report["restart"]["delivered"] != 400
+            or report["restart"]["duplicateOrders"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -45,3 +45,6 @@ create_location_scan_order = """
       }
     }
 """
+
+# Selection used when several createLocationScanOrder calls are batched into one request
+location_scan_order_creation_fields = "id createdAt userTrackingToken"
@@ -0,0 +1,286 @@
+from enum import Enum
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+class OverlayKind(str, Enum):  # same as the RecordImage overlay fields
+    BIN_LOCATION = "binLocationOverlay"
+    DETECTION = "detectionOverlays"
+    LPN = "lpnOverlays"
+
+
+OVERLAY_KIND_CODES = {kind: code for code, kind in enumerate(OverlayKind)}
+
+
+class PolygonPack:
+    """
+    Ragged polygons stored as one contiguous (points, 2) float array. Polygon i owns the points
+    xy[offsets[i]:offsets[i + 1]]. For record overlays, image_index, kinds and labels describe each polygon and
+    record_ids maps image_index back to the record (or inventory item) the image belongs to.
+    """
+
+    def __init__(
+        self,
+        xy: np.ndarray,
+        offsets: np.ndarray,
+        image_index: Optional[np.ndarray] = None,
+        kinds: Optional[np.ndarray] = None,
+        labels: Optional[List[str]] = None,
+        record_ids: Optional[List[str]] = None,
+    ):
+        self.xy = xy
+        self.offsets = offsets
+        count = len(offsets) - 1
+        self.image_index = image_index if image_index is not None else np.zeros(count, dtype=np.int64)
+        self.kinds = kinds if kinds is not None else np.zeros(count, dtype=np.int8)
+        self.labels = labels if labels is not None else [None] * count
+        self.record_ids = record_ids if record_ids is not None else []
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.offsets[:-1]
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def of_kind(self, kind: OverlayKind) -> np.ndarray:
+        """ Indices of the polygons of one overlay kind """
+        return np.flatnonzero(self.kinds == OVERLAY_KIND_CODES[kind])
+
+
+def pack_polygons(polygons: Iterable[List[Dict]]) -> PolygonPack:
+    """ Pack polygons given as lists of {"x", "y"} points. Polygons without points are skipped """
+    points: List[float] = []
+    offsets = [0]
+    for polygon in polygons:
+        if not polygon:
+            continue
+        for point in polygon:
+            points.append(point["x"])
+            points.append(point["y"])
+        offsets.append(len(points) // 2)
+    return PolygonPack(np.asarray(points, dtype=np.float64).reshape(-1, 2), np.asarray(offsets, dtype=np.int64))
+
+
+def _image_overlays(image: Dict):
+    for kind in OverlayKind:
+        overlays = image.get(kind.value) or []
+        if isinstance(overlays, dict):
+            overlays = [overlays]
+        for overlay in overlays:
+            if overlay and overlay.get("polygon"):
+                yield kind, overlay.get("label"), overlay["polygon"]
+
+
+def pack_record_overlays(items: Iterable[Dict]) -> PolygonPack:
+    """
+    Pack every overlay polygon of a page or snapshot at once. Accepts zoneLocationsPageV2 page items, location scan
+    order bins and bare records, including inventory images. Polygons are grouped per image since overlays only
+    share a coordinate space with the other overlays of the same image.
+    """
+    points: List[float] = []
+    offsets = [0]
+    image_index: List[int] = []
+    kinds: List[int] = []
+    labels: List[str] = []
+    record_ids: List[str] = []
+
+    def add_images(record_id: str, images) -> None:
+        if isinstance(images, dict):
+            images = [images]
+        for image in images or []:
+            for kind, label, polygon in _image_overlays(image):
+                for point in polygon:
+                    points.append(point["x"])
+                    points.append(point["y"])
+                offsets.append(len(points) // 2)
+                image_index.append(len(record_ids))
+                kinds.append(OVERLAY_KIND_CODES[kind])
+                labels.append(label)
+            record_ids.append(record_id)
+
+    for item in items:
+        record = item.get("record", item)
+        if not record:
+            continue
+        add_images(record.get("id") or record.get("recordId"), record.get("images"))
+        for inventory in record.get("inventory") or []:
+            add_images(inventory.get("id") or inventory.get("recordId"), inventory.get("images"))
+
+    return PolygonPack(
+        np.asarray(points, dtype=np.float64).reshape(-1, 2),
+        np.asarray(offsets, dtype=np.int64),
+        np.asarray(image_index, dtype=np.int64),
+        np.asarray(kinds, dtype=np.int8),
+        labels,
+        record_ids,
+    )
+
+
+def _next_point_index(pack: PolygonPack) -> np.ndarray:
+    # Index of the following vertex of every point, wrapping around at the end of each polygon
+    following = np.arange(1, len(pack.xy) + 1)
+    following[pack.offsets[1:] - 1] = pack.starts
+    return following
+
+
+def _signed_areas(pack: PolygonPack) -> np.ndarray:
+    if len(pack) == 0:
+        return np.zeros(0)
+    x, y = pack.xy[:, 0], pack.xy[:, 1]
+    following = _next_point_index(pack)
+    cross = x * y[following] - x[following] * y
+    return 0.5 * np.add.reduceat(cross, pack.starts)
+
+
+def polygon_areas(pack: PolygonPack) -> np.ndarray:
+    """ Area of every polygon (shoelace formula), regardless of vertex winding """
+    return np.abs(_signed_areas(pack))
+
+
+def polygon_centroids(pack: PolygonPack) -> np.ndarray:
+    """ (polygons, 2) centroids. Degenerate polygons fall back to the mean of their vertices """
+    if len(pack) == 0:
+        return np.zeros((0, 2))
+    x, y = pack.xy[:, 0], pack.xy[:, 1]
+    following = _next_point_index(pack)
+    cross = x * y[following] - x[following] * y
+    signed = 0.5 * np.add.reduceat(cross, pack.starts)
+    cx = np.add.reduceat((x + x[following]) * cross, pack.starts)
+    cy = np.add.reduceat((y + y[following]) * cross, pack.starts)
+
+    mean = np.add.reduceat(pack.xy, pack.starts, axis=0) / pack.counts[:, None]
+    centroids = mean.copy()
+    valid = signed != 0
+    centroids[valid, 0] = cx[valid] / (6 * signed[valid])
+    centroids[valid, 1] = cy[valid] / (6 * signed[valid])
+    return centroids
+
+
+def polygon_bounding_boxes(pack: PolygonPack) -> np.ndarray:
+    """ (polygons, 4) boxes as min x, min y, max x, max y """
+    if len(pack) == 0:
+        return np.zeros((0, 4))
+    minimum = np.minimum.reduceat(pack.xy, pack.starts, axis=0)
+    maximum = np.maximum.reduceat(pack.xy, pack.starts, axis=0)
+    return np.hstack([minimum, maximum])
+
+
+def _padded_vertices(pack: PolygonPack, indices: np.ndarray) -> np.ndarray:
+    # (len(indices), max vertices + 1, 2) where every polygon is closed and padded by repeating its first vertex,
+    # which only adds zero length edges
+    counts = pack.counts[indices]
+    width = int(counts.max()) + 1 if len(indices) else 1
+    columns = np.arange(width)[None, :]
+    point_index = pack.starts[indices][:, None] + np.where(columns < counts[:, None], columns, 0)
+    return pack.xy[point_index]
+
+
+def _clip_areas(clip: np.ndarray, subject: np.ndarray, subject_counts: np.ndarray) -> np.ndarray:
+    # Sutherland-Hodgman: each subject polygon is clipped against every edge of its convex clip polygon in turn,
+    # all pairs at once. clip is closed and padded (see _padded_vertices), so padding edges have zero length and keep
+    # every point. subject is (pairs, width, 2) with subject_counts valid vertices per row. Returns the clipped areas
+    orientation = np.sign(_closed_signed_areas(clip))[:, None]
+    rows = np.arange(len(subject))[:, None]
+    points, counts = subject, subject_counts
+    for edge in range(clip.shape[1] - 1):
+        start = clip[:, edge][:, None, :]
+        direction = clip[:, edge + 1][:, None, :] - start
+        columns = np.arange(points.shape[1])[None, :]
+        valid = columns < counts[:, None]
+        following = points[rows, np.where(columns + 1 < counts[:, None], columns + 1, 0)]
+
+        def side(vertices: np.ndarray) -> np.ndarray:
+            # Positive inside the clip edge whatever the winding of the clip polygon
+            relative = vertices - start
+            return orientation * (direction[..., 0] * relative[..., 1] - direction[..., 1] * relative[..., 0])
+
+        current_side, following_side = side(points), side(following)
+        current_in, following_in = current_side >= 0, following_side >= 0
+        crosses = valid & (current_in != following_in)
+        t = np.divide(current_side, current_side - following_side, out=np.zeros_like(current_side), where=crosses)
+        crossing = points + t[..., None] * (following - points)
+
+        # Every subject edge emits its crossing with the clip edge, then its end point when that is inside
+        candidates = np.stack([crossing, following], axis=2).reshape(len(points), -1, 2)
+        keep = np.stack([crosses, valid & following_in], axis=2).reshape(len(points), -1)
+        order = np.argsort(~keep, axis=1, kind="stable")
+        counts = np.count_nonzero(keep, axis=1)
+        width = max(int(counts.max()) if len(counts) else 0, 1)
+        points = candidates[rows, order[:, :width]]
+
+    columns = np.arange(points.shape[1])[None, :]
+    valid = columns < counts[:, None]
+    following = points[rows, np.where(columns + 1 < counts[:, None], columns + 1, 0)]
+    cross = points[..., 0] * following[..., 1] - following[..., 0] * points[..., 1]
+    return np.abs(0.5 * np.sum(np.where(valid, cross, 0.0), axis=1))
+
+
+def _closed_signed_areas(vertices: np.ndarray) -> np.ndarray:
+    # Shoelace over (polygons, vertices, 2) closed, padded polygons
+    start, end = vertices[:, :-1], vertices[:, 1:]
+    return 0.5 * np.sum(start[..., 0] * end[..., 1] - end[..., 0] * start[..., 1], axis=1)
+
+
+def bin_detection_pairs(pack: PolygonPack, detection_kind: OverlayKind = OverlayKind.DETECTION) -> np.ndarray:
+    """ (pairs, 2) polygon indices of every bin location overlay and detection overlay that share an image """
+    bins = pack.of_kind(OverlayKind.BIN_LOCATION)
+    detections = pack.of_kind(detection_kind)
+    if not len(bins) or not len(detections):
+        return np.zeros((0, 2), dtype=np.int64)
+
+    order = np.argsort(pack.image_index[detections], kind="stable")
+    detections = detections[order]
+    detection_images = pack.image_index[detections]
+    first = np.searchsorted(detection_images, pack.image_index[bins], side="left")
+    last = np.searchsorted(detection_images, pack.image_index[bins], side="right")
+    counts = last - first
+    bin_column = np.repeat(bins, counts)
+    detection_position = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return np.stack([bin_column, detections[detection_position]], axis=1)
+
+
+def intersection_over_union(pack: PolygonPack, pairs: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Intersection over union and coverage (intersection over the area of the second polygon) for polygon index pairs.
+    The first polygon of each pair must be convex, as bin location overlays are; the second may be any simple
+    polygon. Intersections are exact: the second polygon is clipped to the first (Sutherland-Hodgman) and measured
+    with the shoelace formula. Pairs whose bounding boxes do not overlap are zero without clipping.
+    """
+    count = len(pairs)
+    intersection = np.zeros(count)
+    areas = polygon_areas(pack)
+    first_areas = areas[pairs[:, 0]] if count else np.zeros(0)
+    second_areas = areas[pairs[:, 1]] if count else np.zeros(0)
+    if count:
+        boxes = polygon_bounding_boxes(pack)
+        first, second = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+        overlapping = np.flatnonzero(
+            (np.minimum(first[:, 2], second[:, 2]) > np.maximum(first[:, 0], second[:, 0]))
+            & (np.minimum(first[:, 3], second[:, 3]) > np.maximum(first[:, 1], second[:, 1]))
+        )
+        if len(overlapping):
+            subjects = pairs[overlapping, 1]
+            intersection[overlapping] = _clip_areas(
+                _padded_vertices(pack, pairs[overlapping, 0]),
+                _padded_vertices(pack, subjects)[:, :-1],
+                pack.counts[subjects],
+            )
+
+    union = first_areas + second_areas - intersection
+    return {
+        "pairs": pairs,
+        "intersection": intersection,
+        "iou": np.divide(intersection, union, out=np.zeros(count), where=union > 0),
+        "coverage": np.divide(intersection, second_areas, out=np.zeros(count), where=second_areas > 0),
+    }
+
+
+def bin_detection_iou(pack: PolygonPack, detection_kind: OverlayKind = OverlayKind.DETECTION) -> Dict[str, np.ndarray]:
+    """ Intersection over union of every bin location overlay against each detection in the same image """
+    return intersection_over_union(pack, bin_detection_pairs(pack, detection_kind))
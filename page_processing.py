@@ -0,0 +1,188 @@
+import os
+import json
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+from ware_api import LocationFilterV2, RecordSort, WareAPI, WareAPIError
+from streaming_decode import leading_page_info
+
+DEFAULT_LIMIT = 100
+# Pages submitted ahead of the one being returned, per worker process
+DEFAULT_PAGES_PER_WORKER = 2
+
+
+def flatten_records(records: List[Dict]) -> Dict[str, List]:
+    """
+    Default transform: one column batch per page with a row per record, holding the id, bin, aisle, timestamp,
+    LPNs and exception types. Much smaller to send back from a worker than the nested records.
+    """
+    columns: Dict[str, List] = {
+        "id": [], "binName": [], "aisle": [], "timestamp": [], "lpns": [], "exceptionTypes": []
+    }
+    for item in records:
+        record = item.get("record") or {}
+        inventory = record.get("inventory") or []
+        exceptions = list(record.get("exceptions") or [])
+        for entry in inventory:
+            exceptions.extend(entry.get("exceptions") or [])
+        columns["id"].append(record.get("id"))
+        columns["binName"].append(record.get("binName"))
+        columns["aisle"].append(record.get("aisle"))
+        columns["timestamp"].append(record.get("timestamp"))
+        columns["lpns"].append([entry["text"] for entry in inventory if entry.get("type", "LPN") == "LPN"])
+        columns["exceptionTypes"].append(sorted({exception["type"] for exception in exceptions}))
+    return columns
+
+
+def decode_page(
+    body: bytes, transform: Callable[[List[Dict]], Any] = flatten_records, data_key: str = "zoneLocationsPageV2"
+) -> Any:
+    """ Runs in a worker process: decode a raw page body and apply the transform to its records """
+    response = json.loads(body)
+    page = (response.get("data") or {}).get(data_key)
+    if page is None:
+        raise WareAPIError({"status": "error", "message": response.get("message"), "response": response})
+    return transform(page["records"] or [])
+
+
+def iter_zone_page_bodies(
+    api: WareAPI,
+    zone_id: str,
+    limit: int = DEFAULT_LIMIT,
+    sort: RecordSort = RecordSort.LATEST,
+    record_filter: Optional[LocationFilterV2] = None,
+    include_images: bool = False,
+    include_inventory: bool = True,
+) -> Iterator[bytes]:
+    """ Raw response bodies of every page of a zone. Only the pageInfo prefix of each body is decoded here """
+    cursor = None
+    while True:
+        body = api.zone_locations_page_body(
+            zone_id,
+            limit=limit,
+            cursor=cursor,
+            sort=sort,
+            record_filter=record_filter,
+            include_images=include_images,
+            include_inventory=include_inventory,
+        )
+        page_info = leading_page_info(body)
+        if page_info is None:
+            response = json.loads(body)
+            raise WareAPIError({"status": "error", "message": response.get("message"), "response": response})
+
+        yield body
+        if not page_info["hasNextPage"]:
+            return
+        cursor = page_info["endCursor"]
+
+
+def fetch_ahead(bodies: Iterable[bytes], depth: int) -> Iterator[bytes]:
+    """
+    Pull bodies on a background thread, up to depth ahead of the consumer, so the network stays busy while pages are
+    submitted and results handed back. Errors of the source are raised to the consumer in order.
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=depth)
+    done = object()
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        # Gives up once the consumer has stopped, so the thread never blocks on a buffer nobody reads
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch() -> None:
+        try:
+            for body in bodies:
+                if not put(body):
+                    break
+            else:
+                put(done)
+        except BaseException as e:
+            put(e)
+        finally:
+            # Releases the response of a page that was being fetched when the consumer stopped
+            if hasattr(bodies, "close"):
+                bodies.close()
+
+    threading.Thread(target=fetch, daemon=True).start()
+    try:
+        while (item := buffer.get()) is not done:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def default_executor(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    # spawn, because forking a process that holds pooled connections and threads is unsafe
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+
+
+def process_pages(
+    bodies: Iterable[bytes],
+    executor: Executor,
+    transform: Callable[[List[Dict]], Any] = flatten_records,
+    max_pending: Optional[int] = None,
+    data_key: str = "zoneLocationsPageV2",
+) -> Iterator[Any]:
+    """
+    Decode and transform raw page bodies on the executor's worker processes while the next pages are fetched, and
+    yield the transformed pages in their original order. transform must be picklable, i.e. a module level function.
+    At most max_pending pages are in flight, which bounds memory when the consumer is slower than the fetcher.
+    """
+    max_pending = max_pending or DEFAULT_PAGES_PER_WORKER * os.cpu_count()
+    pending: Deque[Future] = deque()
+    for body in bodies:
+        pending.append(executor.submit(decode_page, body, transform, data_key))
+        # Hand back finished pages early, in order, without waiting for the pipeline to fill
+        while pending and (len(pending) >= max_pending or pending[0].done()):
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def process_zone(
+    api: WareAPI,
+    zone_id: str,
+    executor: Optional[Executor] = None,
+    transform: Callable[[List[Dict]], Any] = flatten_records,
+    limit: int = DEFAULT_LIMIT,
+    sort: RecordSort = RecordSort.LATEST,
+    record_filter: Optional[LocationFilterV2] = None,
+    include_images: bool = False,
+    include_inventory: bool = True,
+    workers: Optional[int] = None,
+) -> Iterator[Any]:
+    """
+    Crawl a zone, decoding and transforming its pages on worker processes. Yields one transformed page at a time.
+    workers sizes the default executor and the read-ahead; pass the worker count of a given executor too
+    """
+    owned = executor is None
+    workers = workers or os.cpu_count()
+    executor = executor or default_executor(workers)
+    depth = DEFAULT_PAGES_PER_WORKER * workers
+    bodies = iter_zone_page_bodies(
+        api,
+        zone_id,
+        limit=limit,
+        sort=sort,
+        record_filter=record_filter,
+        include_images=include_images,
+        include_inventory=include_inventory,
+    )
+    try:
+        yield from process_pages(fetch_ahead(bodies, depth), executor, transform=transform, max_pending=depth)
+    finally:
+        if owned:
+            executor.shutdown(cancel_futures=True)
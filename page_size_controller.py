@@ -0,0 +1,135 @@
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+import requests
+
+from local_storage import atomic_write_json, read_json
+
+DEFAULT_TARGET_SECONDS = 2.0
+DEFAULT_MIN_LIMIT = 10
+DEFAULT_MAX_LIMIT = 500
+DEFAULT_INITIAL_LIMIT = 50
+DEFAULT_MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+DEFAULT_RETRIES = 3
+SMOOTHING = 0.3
+# Largest factor the limit may grow by between two pages
+MAX_GROWTH = 2.0
+# Error rate above which the limit is held below the size that last failed
+ERROR_RATE_THRESHOLD = 0.1
+
+
+def projection_key(
+    zone_id: str, include_images: bool = False, include_inventory: bool = True, record_filter: Optional[Dict] = None
+) -> str:
+    """ Key under which a tuned limit is remembered. Payload size per record depends on what is selected """
+    filtered = bool(record_filter and any(value for key, value in record_filter.items() if key != "statusFilter"))
+    return f"{zone_id}:images={int(include_images)}:inventory={int(include_inventory)}:filtered={int(filtered)}"
+
+
+class AdaptivePageSize:
+    """
+    Tunes the zoneLocationsPageV2 limit between pages so each request takes about target_seconds and its response
+    stays under max_response_bytes. It keeps smoothed per-record latency and size estimates from the observed pages,
+    halves the limit when a page fails and stays below the failing size while errors are frequent. With a state_path
+    the tuned limit is stored per (zone, projection) key and used as the starting point of the next run.
+    """
+
+    def __init__(
+        self,
+        key: Optional[str] = None,
+        state_path: Optional[str] = None,
+        target_seconds: float = DEFAULT_TARGET_SECONDS,
+        min_limit: int = DEFAULT_MIN_LIMIT,
+        max_limit: int = DEFAULT_MAX_LIMIT,
+        initial_limit: int = DEFAULT_INITIAL_LIMIT,
+        max_response_bytes: int = DEFAULT_MAX_RESPONSE_BYTES,
+        retries: int = DEFAULT_RETRIES,
+    ):
+        self.key = key
+        self.state_path = state_path
+        self.target_seconds = target_seconds
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_response_bytes = max_response_bytes
+        self.retries = retries
+        self.lock = threading.Lock()
+
+        saved = (read_json(state_path, {}) if state_path else {}).get(key, {}) if key else {}
+        self.limit = self._clamp(saved.get("limit", initial_limit))
+        self.seconds_per_record: Optional[float] = saved.get("secondsPerRecord")
+        self.bytes_per_record: Optional[float] = saved.get("bytesPerRecord")
+        self.error_rate = 0.0
+        self.failed_limit: Optional[int] = None
+
+    def _clamp(self, limit: float) -> int:
+        return int(max(self.min_limit, min(self.max_limit, limit)))
+
+    @staticmethod
+    def _smooth(current: Optional[float], observed: float) -> float:
+        return observed if current is None else SMOOTHING * observed + (1 - SMOOTHING) * current
+
+    def observe(self, records: int, elapsed: float, response_bytes: int, error: bool = False) -> int:
+        """ Record the outcome of a page request made with the current limit. Returns the limit for the next page """
+        with self.lock:
+            self.error_rate = self._smooth(self.error_rate, 1.0 if error else 0.0)
+            if error:
+                self.failed_limit = self.limit
+                self.limit = self._clamp(self.limit / 2)
+                return self.limit
+
+            if records > 0:
+                self.seconds_per_record = self._smooth(self.seconds_per_record, elapsed / records)
+                self.bytes_per_record = self._smooth(self.bytes_per_record, response_bytes / records)
+            if self.seconds_per_record is None or records < self.limit:
+                # A short (last) page says nothing about how far the limit could go
+                return self.limit
+
+            desired = self.target_seconds / self.seconds_per_record
+            if self.bytes_per_record:
+                desired = min(desired, self.max_response_bytes / self.bytes_per_record)
+            desired = min(desired, self.limit * MAX_GROWTH)
+            if self.failed_limit is not None and self.error_rate > ERROR_RATE_THRESHOLD:
+                desired = min(desired, self.failed_limit * 0.75)
+            self.limit = self._clamp(desired)
+            return self.limit
+
+    def fetch(self, api, request: Callable[[int], Dict]) -> Dict:
+        """
+        Run request(limit) with the current limit and learn from the outcome, retrying failed pages with the smaller
+        limit chosen after each failure. Latency and bytes are read from api.metrics.
+        """
+        result: Dict = {}
+        for _ in range(self.retries + 1):
+            limit = self.limit
+            started = time.perf_counter()
+            try:
+                result = request(limit)
+            except requests.RequestException as e:
+                result = {"status": "error", "message": str(e)}
+            exchange = api.metrics.last_exchange() or {}
+            elapsed = exchange.get("elapsed", time.perf_counter() - started)
+
+            if result["status"] == "success":
+                records = len(result["data"]["records"] or [])
+                self.observe(records, elapsed, exchange.get("responseBytes", 0))
+                self.save()
+                return result
+
+            self.observe(0, elapsed, 0, error=True)
+            if limit <= self.min_limit:
+                break
+        self.save()
+        return result
+
+    def save(self) -> None:
+        if not (self.state_path and self.key):
+            return
+        with self.lock:
+            state = read_json(self.state_path, {})
+            state[self.key] = {
+                "limit": self.limit,
+                "secondsPerRecord": self.seconds_per_record,
+                "bytesPerRecord": self.bytes_per_record,
+            }
+            atomic_write_json(self.state_path, state)
@@ -338,3 +338,39 @@ get_wms_location_history_upload_record = """
       }
     }
 """
+
+# Selection used when several getLocationScanOrder calls are batched into one request
+location_scan_order_status_fields = """
+        id
+        status
+        zoneId
+        createdAt
+        startTime
+        endTime
+        userTrackingToken
+        summary {
+          totalBins
+          queuedBinCount
+          inProgressBinCount
+          succeededBinCount
+          errorBinCount
+          errorBinNames
+          canceledBinCount
+        }
+"""
+
+# Selection used when several zoneLocationsPageV2 bin lookups are batched into one request
+zone_location_timestamp_fields = """
+        timezone
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        records {
+          record {
+            id
+            binName
+            timestamp
+          }
+        }
+"""
@@ -0,0 +1,206 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from ware_api import LocationFilterV2, RecordSort, WareAPI, WareAPIError
+from local_storage import atomic_write_json, read_json
+from scan_order_filter import parse_record_timestamp
+
+DEFAULT_PAGE_SIZE = 25
+DEFAULT_MIN_INTERVAL = 2.0
+DEFAULT_MAX_INTERVAL = 60.0
+# Number of recently delivered record ids remembered per zone to drop duplicates across polls
+DEFAULT_SEEN_LIMIT = 5000
+RATE_SMOOTHING = 0.3
+
+# Fields left out of the change fingerprint because they differ between responses for the same data
+VOLATILE_FIELDS = ("sharedLocationViewUrl", "images")
+
+
+def record_fingerprint(record: Dict) -> str:
+    stable = {key: value for key, value in record.items() if key not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class NdjsonSink:
+    """ Subscriber that appends every delivered record to a newline delimited JSON file """
+
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def __call__(self, zone_id: str, item: Dict) -> None:
+        line = json.dumps({"zoneId": zone_id, **item}, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _ZoneState:
+    def __init__(self, saved: Dict, min_interval: float):
+        self.watermark: Optional[str] = saved.get("watermark")
+        self.seen: "OrderedDict[str, str]" = OrderedDict(saved.get("seen", []))
+        self.interval = min_interval
+        self.rate = 0.0
+        self.next_poll = 0.0
+        self.last_poll: Optional[float] = None
+
+    def to_json(self) -> Dict:
+        return {"watermark": self.watermark, "seen": list(self.seen.items())}
+
+
+class RecordFeed:
+    """
+    Change data capture over zoneLocationsPageV2. Each poll reads a zone from its newest record (RecordSort.LATEST)
+    until it reaches the persisted watermark, drops record ids that were already delivered with the same content and
+    publishes the rest, oldest first, to every subscriber. The poll interval of each zone follows its observed scan
+    rate: busy zones are polled every min_interval seconds, quiet ones back off towards max_interval and cost a single
+    small page request per poll.
+    """
+
+    def __init__(
+        self,
+        api: WareAPI,
+        zone_ids: List[str],
+        state_path: str,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        record_filter: Optional[LocationFilterV2] = None,
+        include_inventory: bool = True,
+        backfill: bool = False,
+        seen_limit: int = DEFAULT_SEEN_LIMIT,
+    ):
+        self.api = api
+        self.state_path = state_path
+        self.page_size = page_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.record_filter = record_filter
+        self.include_inventory = include_inventory
+        # Without a saved watermark a zone either starts at its current head (default) or delivers its whole history
+        self.backfill = backfill
+        self.seen_limit = seen_limit
+        self.subscribers: List[Callable[[str, Dict], None]] = []
+        self.stopped = threading.Event()
+
+        saved = read_json(state_path, {})
+        self.zones = {zone_id: _ZoneState(saved.get(zone_id, {}), min_interval) for zone_id in zone_ids}
+
+    def subscribe(self, callback: Callable[[str, Dict], None]) -> Callable[[], None]:
+        """ Register callback(zone_id, page_item) for new or changed records. Returns a function that unsubscribes """
+        self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+    def _publish(self, zone_id: str, item: Dict) -> None:
+        for callback in list(self.subscribers):
+            try:
+                callback(zone_id, item)
+            except Exception as e:
+                print(f"Record feed subscriber failed for zone {zone_id}: {e}")
+
+    def _save(self) -> None:
+        atomic_write_json(self.state_path, {zone_id: state.to_json() for zone_id, state in self.zones.items()})
+
+    def poll_zone(self, zone_id: str) -> List[Dict]:
+        """ Read a zone from its head down to the watermark and publish what is new. Returns the published items """
+        state = self.zones[zone_id]
+        watermark = parse_record_timestamp(state.watermark) if state.watermark else None
+        first_run = watermark is None and not state.seen
+        fresh: List[Dict] = []
+        # Fingerprints are kept in state.seen only once their records are published, so a failed poll retries them
+        seen: Dict[str, str] = {}
+        newest: Optional[datetime] = watermark
+        cursor = None
+
+        while True:
+            result = self.api.zone_locations_page(
+                zone_id,
+                limit=self.page_size,
+                cursor=cursor,
+                sort=RecordSort.LATEST,
+                record_filter=self.record_filter,
+                include_inventory=self.include_inventory,
+            )
+            if result["status"] != "success":
+                raise WareAPIError(result)
+
+            page = result["data"]
+            reached_watermark = False
+            for item in page["records"] or []:
+                record = item["record"]
+                timestamp = parse_record_timestamp(record["timestamp"], page.get("timezone"))
+                if watermark is not None and timestamp < watermark:
+                    reached_watermark = True
+                    break
+                if newest is None or timestamp > newest:
+                    newest = timestamp
+
+                fingerprint = record_fingerprint(record)
+                if seen.get(record["id"], state.seen.get(record["id"])) == fingerprint:
+                    continue
+                seen[record["id"]] = fingerprint
+                fresh.append(item)
+
+            if first_run and not self.backfill:
+                # Only establish the watermark, starting at the current head of the zone
+                fresh = []
+                break
+            if reached_watermark or not page["pageInfo"]["hasNextPage"]:
+                break
+            cursor = page["pageInfo"]["endCursor"]
+
+        # Pages are newest first, subscribers get records in the order they were scanned
+        for item in reversed(fresh):
+            self._publish(zone_id, item)
+
+        for record_id, fingerprint in seen.items():
+            state.seen[record_id] = fingerprint
+            state.seen.move_to_end(record_id)
+        while len(state.seen) > self.seen_limit:
+            state.seen.popitem(last=False)
+        if newest is not None:
+            state.watermark = newest.isoformat()
+
+        self._adapt_interval(state, len(fresh))
+        self._save()
+        return fresh
+
+    def _adapt_interval(self, state: _ZoneState, delivered: int) -> None:
+        now = time.monotonic()
+        if state.last_poll is not None:
+            observed = delivered / max(now - state.last_poll, 1e-3)
+            state.rate = RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * state.rate
+        state.last_poll = now
+
+        if delivered:
+            # Poll often enough that the records arriving between polls fit in about half a page
+            target = (self.page_size / 2) / state.rate if state.rate > 0 else self.min_interval
+        else:
+            target = state.interval * 1.5
+        state.interval = min(self.max_interval, max(self.min_interval, target))
+        state.next_poll = now + state.interval
+
+    def run(self) -> None:
+        """ Poll every zone as it comes due until stop() is called. Zone errors are reported and retried later """
+        while not self.stopped.is_set():
+            zone_id, state = min(self.zones.items(), key=lambda zone: zone[1].next_poll)
+            delay = state.next_poll - time.monotonic()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+            try:
+                self.poll_zone(zone_id)
+            except Exception as e:
+                print(f"Error polling zone {zone_id}: {e}")
+                state.interval = min(self.max_interval, state.interval * 2)
+                state.next_poll = time.monotonic() + state.interval
+
+    def stop(self) -> None:
+        self.stopped.set()
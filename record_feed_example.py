@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+import json
+import argparse
+from ware_api import WareAPI, DEFAULT_HOST
+from record_feed import NdjsonSink, RecordFeed
+
+
+def print_record(zone_id: str, item: dict) -> None:
+    record = item["record"]
+    print(json.dumps({
+        "zoneId": zone_id,
+        "binName": record["binName"],
+        "id": record["id"],
+        "timestamp": record["timestamp"],
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Follow newly scanned location records of one or more zones via the Ware GraphQL API
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+
+    parser.add_argument(
+        "--endpoint", type=str, help="Optional endpoint value to override the default", default=DEFAULT_HOST
+    )
+    parser.add_argument("--zone-id", nargs="+", help="Zone IDs to follow", required=True)
+    parser.add_argument("--state", type=str, help="File used to persist the watermark of each zone", required=True)
+    parser.add_argument("--output", type=str, help="Optional NDJSON file receiving the full records", default=None)
+    parser.add_argument(
+        "--backfill", action="store_true", help="Deliver existing records of zones seen for the first time"
+    )
+    args = parser.parse_args()
+
+    api = WareAPI(host=args.endpoint)
+
+    feed = RecordFeed(api, args.zone_id, args.state, backfill=args.backfill)
+    feed.subscribe(print_record)
+    if args.output:
+        feed.subscribe(NdjsonSink(args.output))
+
+    try:
+        feed.run()
+    except KeyboardInterrupt:
+        feed.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from uuid import uuid4
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from ware_api import LocationFilterV2, RecordSort, ReportFormat, WareAPI, WareAPIError
+from local_storage import atomic_write_json, read_json
+from report_pipeline import download_report, request_report
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_AGE = 3600
+# Pre-signed report URLs eventually expire, entries without a downloaded file are not served past this age
+DEFAULT_URL_TTL = 3600
+DEFAULT_CACHE_BYTES = 5 * 1024 ** 3
+INDEX_FILE = "index.json"
+# Cache hits only update access times, the index is saved after this many of them and by flush()
+INDEX_SAVE_INTERVAL = 50
+
+
+def report_cache_key(
+    zone_id: str, sort: RecordSort, report_format: ReportFormat, record_filter: Optional[LocationFilterV2]
+) -> str:
+    """ Identical requests map to the same key regardless of filter key order, empty values or enum types """
+    canonical_filter = {}
+    for key, value in (record_filter or {}).items():
+        if value is None or value == [] or value == "":
+            continue
+        if isinstance(value, list):
+            value = sorted(str(getattr(item, "value", item)) for item in value)
+        canonical_filter[key] = getattr(value, "value", value)
+    canonical = json.dumps(
+        {"zoneId": zone_id, "sort": sort.value, "format": report_format.value, "filter": canonical_filter},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def latest_record_timestamp(
+    api: WareAPI, zone_id: str, record_filter: Optional[LocationFilterV2] = None
+) -> Optional[str]:
+    """ Timestamp of the most recently scanned record of a zone, using a single one record page """
+    result = api.zone_locations_page(
+        zone_id, limit=1, sort=RecordSort.LATEST, record_filter=record_filter, include_inventory=False
+    )
+    if result["status"] != "success":
+        raise WareAPIError(result)
+    records = result["data"]["records"] or []
+    return records[0]["record"]["timestamp"] if records else None
+
+
+class ReportCache:
+    """
+    Cache of generated zoneLocationsReport URLs and, optionally, the downloaded files, keyed by the canonicalized
+    zone, filter, sort and format. An entry is served without any request for ttl seconds. Until max_age it is
+    served after a one record check shows that no newer record has been scanned since it was generated. Concurrent
+    requests for the same key share a single generation, and downloaded files are evicted least recently used
+    first once they exceed max_bytes.
+    """
+
+    def __init__(
+        self,
+        api: WareAPI,
+        directory: str,
+        ttl: float = DEFAULT_TTL,
+        max_age: float = DEFAULT_MAX_AGE,
+        url_ttl: float = DEFAULT_URL_TTL,
+        max_bytes: int = DEFAULT_CACHE_BYTES,
+        download: bool = True,
+    ):
+        self.api = api
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+        self.url_ttl = url_ttl
+        self.max_bytes = max_bytes
+        self.download = download
+        self.lock = threading.Lock()
+        self.in_flight: Dict[str, Future] = {}
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.entries: Dict[str, Dict] = read_json(self.index_path, {})
+        self.pending_saves = 0
+
+    def _usable(self, entry: Dict, record_filter: Optional[LocationFilterV2]) -> bool:
+        age = time.time() - entry["created"]
+        if entry.get("path"):
+            if not os.path.exists(entry["path"]):
+                return False
+        elif age > self.url_ttl:
+            return False
+        if age <= self.ttl:
+            return True
+        if age > self.max_age:
+            return False
+        return latest_record_timestamp(self.api, entry["zoneId"], record_filter) == entry["latestRecord"]
+
+    def get(
+        self,
+        zone_id: str,
+        sort: RecordSort = RecordSort.LATEST,
+        report_format: ReportFormat = ReportFormat.CSV,
+        record_filter: Optional[LocationFilterV2] = None,
+    ) -> Dict:
+        """ Return a copy of the cache entry with url, path (when downloading), created and latestRecord fields """
+        key = report_cache_key(zone_id, sort, report_format, record_filter)
+        with self.lock:
+            entry = self.entries.get(key)
+            flight = self.in_flight.get(key)
+        if flight is not None:
+            return dict(flight.result())
+
+        # The freshness check may make a request, so it runs outside the lock
+        if entry and self._usable(entry, record_filter):
+            with self.lock:
+                entry["accessed"] = time.time()
+                self.pending_saves += 1
+                if self.pending_saves >= INDEX_SAVE_INTERVAL:
+                    self._save()
+                return dict(entry)
+
+        with self.lock:
+            flight = self.in_flight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self.in_flight[key] = Future()
+        if not owner:
+            return dict(flight.result())
+
+        try:
+            entry = self._generate(key, zone_id, sort, report_format, record_filter)
+            flight.set_result(entry)
+            return dict(entry)
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def _generate(
+        self,
+        key: str,
+        zone_id: str,
+        sort: RecordSort,
+        report_format: ReportFormat,
+        record_filter: Optional[LocationFilterV2],
+    ) -> Dict:
+        # Read the freshness marker first, so records scanned during generation make the entry stale
+        latest = latest_record_timestamp(self.api, zone_id, record_filter)
+        url = request_report(self.api, zone_id, sort=sort, report_format=report_format, record_filter=record_filter)
+        entry = {
+            "zoneId": zone_id,
+            "url": url,
+            "path": None,
+            "size": 0,
+            "created": time.time(),
+            "accessed": time.time(),
+            "latestRecord": latest,
+        }
+        if self.download:
+            # Each generation gets its own file so readers of the previous one are never handed a partial download
+            path = os.path.join(self.directory, f"{key}-{uuid4().hex[:8]}.{report_format.value.lower()}")
+            download_report(url, path)
+            entry["path"] = path
+            entry["size"] = os.path.getsize(path)
+
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous and previous.get("path") and os.path.exists(previous["path"]):
+                os.unlink(previous["path"])
+            self.entries[key] = entry
+            self._evict(keep=key)
+            self._save()
+            return dict(entry)
+
+    def _evict(self, keep: str) -> None:
+        total = sum(entry["size"] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["accessed"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep or key in self.in_flight:
+                continue
+            if entry.get("path") and os.path.exists(entry["path"]):
+                os.unlink(entry["path"])
+            total -= entry["size"]
+            del self.entries[key]
+
+    def _save(self) -> None:
+        atomic_write_json(self.index_path, self.entries)
+        self.pending_saves = 0
+
+    def flush(self) -> None:
+        """ Save access times not yet written to the index """
+        with self.lock:
+            self._save()
+
+    def invalidate(self, zone_id: Optional[str] = None) -> None:
+        """ Drop every entry, or only those of one zone """
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if zone_id is None or entry["zoneId"] == zone_id:
+                    if entry.get("path") and os.path.exists(entry["path"]):
+                        os.unlink(entry["path"])
+                    del self.entries[key]
+            self._save()
@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ware_api import LocationFilterV2, RecordSort, ReportFormat, WareAPI, WareAPIError
+from spreadsheet_rows import iter_spreadsheet_rows
+
+DEFAULT_PARTS = 8
+DEFAULT_MIN_PART_BYTES = 4 * 1024 * 1024
+DEFAULT_CHUNK_BYTES = 1024 * 1024
+DEFAULT_BATCH_ROWS = 10000
+DEFAULT_TIMEOUT = 60
+CONTENT_RANGE = re.compile(r"bytes \d+-\d+/(\d+)")
+
+
+def request_report(
+    api: WareAPI,
+    zone_id: str,
+    sort: RecordSort = RecordSort.LATEST,
+    report_format: ReportFormat = ReportFormat.CSV,
+    record_filter: Optional[LocationFilterV2] = None,
+) -> str:
+    """ Ask Ware to generate a zoneLocationsReport and return its download URL. Raises WareAPIError on failure """
+    result = api.zone_locations_report(zone_id, sort=sort, report_format=report_format, record_filter=record_filter)
+    if result["status"] != "success":
+        raise WareAPIError(result)
+    return result["data"]["zoneInventoryReportUrl"]
+
+
+def _download_session(parts: int) -> requests.Session:
+    # Report URLs are pre-signed, so they are fetched without the WareAPI request signing
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=parts, pool_maxsize=parts)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _write_at(fd: int, offset: int, data: bytes, lock: threading.Lock) -> None:
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, offset)
+    else:
+        with lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, data)
+
+
+def download_report(
+    url: str,
+    path: str,
+    parts: int = DEFAULT_PARTS,
+    min_part_bytes: int = DEFAULT_MIN_PART_BYTES,
+    session: Optional[requests.Session] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> str:
+    """
+    Download a report file with up to `parts` parallel HTTP range requests, each writing its byte range straight
+    into a preallocated file. When the server does not support ranges, the probe's own response is streamed to the
+    file instead.
+    """
+    session = session or _download_session(parts)
+
+    # A one byte range request reveals both range support and the total size. Pre-signed GET URLs reject HEAD
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout) as probe:
+        if probe.status_code == 416:
+            # Not even the first byte exists: the report is empty
+            open(path, "wb").close()
+            return path
+        probe.raise_for_status()
+        match = CONTENT_RANGE.match(probe.headers.get("Content-Range", ""))
+        if probe.status_code != 206 or not match:
+            # The server ignored the range and is sending the whole file, which is streamed from this response
+            with open(path, "wb") as f:
+                for chunk in probe.iter_content(DEFAULT_CHUNK_BYTES):
+                    f.write(chunk)
+            return path
+
+    size = int(match.group(1))
+    part_count = max(1, min(parts, size // max(min_part_bytes, 1)))
+    part_size = -(-size // part_count)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    lock = threading.Lock()
+    try:
+        os.ftruncate(fd, size)
+
+        def fetch(byte_range) -> None:
+            start, end = byte_range
+            headers = {"Range": f"bytes={start}-{end}"}
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                offset = start
+                for chunk in response.iter_content(DEFAULT_CHUNK_BYTES):
+                    _write_at(fd, offset, chunk, lock)
+                    offset += len(chunk)
+                if offset != end + 1:
+                    raise IOError(f"Incomplete range {start}-{end}: received {offset - start} bytes")
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            # list() surfaces the first failed range as an exception
+            list(executor.map(fetch, ranges))
+    finally:
+        os.close(fd)
+    return path
+
+
+def iter_column_batches(rows: Iterable[Dict[str, str]], batch_rows: int = DEFAULT_BATCH_ROWS) -> Iterator[Dict[str, List]]:
+    """ Regroup a row stream into column batches: {column: [values...]} of up to batch_rows rows each """
+    batch: Dict[str, List] = {}
+    count = 0
+    for row in rows:
+        if not batch:
+            batch = {column: [] for column in row}
+        for column, values in batch.items():
+            values.append(row.get(column))
+        count += 1
+        if count >= batch_rows:
+            yield batch
+            batch, count = {}, 0
+    if count:
+        yield batch
+
+
+def fetch_report_rows(
+    api: WareAPI,
+    zone_id: str,
+    path: str,
+    sort: RecordSort = RecordSort.LATEST,
+    report_format: ReportFormat = ReportFormat.CSV,
+    record_filter: Optional[LocationFilterV2] = None,
+    parts: int = DEFAULT_PARTS,
+) -> Iterator[Dict[str, str]]:
+    """ Request a zone report, download it to path and stream its rows: a whole zone in one query and one download """
+    url = request_report(api, zone_id, sort=sort, report_format=report_format, record_filter=record_filter)
+    download_report(url, path, parts=parts)
+    return iter_spreadsheet_rows(path, report_format.value)
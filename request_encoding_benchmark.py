@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import os
+import json
+import time
+import argparse
+from typing import Callable, Dict, Tuple
+
+import requests
+from requests.adapters import BaseAdapter
+
+from mutations import create_wms_location_history_records as create_wms_location_history_records_mutation
+from queries import get_zone_locations as get_zone_locations_query
+from ware_api import AWS_SERVICE, DEFAULT_REGION, WareAPI
+
+
+class _NullAdapter(BaseAdapter):
+    # Completes every request locally, so only client side encoding and signing is measured
+    def send(self, request, **kwargs) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"data":{}}'
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def cpu_per_call(call: Callable[[], object], iterations: int) -> float:
+    """ CPU microseconds per call """
+    call()
+    started = time.process_time()
+    for _ in range(iterations):
+        call()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Measure the client CPU cost per request of the bytes-first path of WareAPI (cached document prefix, one encode,
+    # one SHA-256, SigV4Signer) against the previous json= and AWS4Auth path. Requests are completed locally.
+    # """
+    )
+
+    parser.add_argument("--records", type=int, help="Records in the WMS upload payload", default=5000)
+    parser.add_argument("--iterations", type=int, help="Requests per case", default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "secret")
+    api = WareAPI()
+    api.session.mount("https://", _NullAdapter())
+    try:
+        from requests_aws4auth import AWS4Auth
+        previous_auth = AWS4Auth(api.access_key, api.secret_key, DEFAULT_REGION, AWS_SERVICE)
+    except ImportError:
+        previous_auth = None
+
+    records = [{"Location": f"A-{index:06d}", "LPN": f"LPN{index:010d}"} for index in range(args.records)]
+    cases: Dict[str, Tuple[str, Dict]] = {
+        "zoneLocationsPageV2": (get_zone_locations_query, {"zoneId": "zone", "limit": 100, "cursor": "c" * 40}),
+        f"createWMSLocationHistoryRecords x{args.records}": (
+            create_wms_location_history_records_mutation, {"zoneId": "zone", "records": records}
+        ),
+    }
+
+    report = {}
+    for name, (document, variables) in cases.items():
+        report[name] = {"bytesFirstMicroseconds": round(cpu_per_call(
+            lambda: api._send(document, variables), args.iterations
+        ), 1)}
+        if previous_auth is not None:
+            report[name]["previousMicroseconds"] = round(cpu_per_call(
+                lambda: api.session.request(
+                    url=api.ware_api_url,
+                    method="POST",
+                    json={"query": document, "variables": variables},
+                    auth=previous_auth,
+                ),
+                args.iterations,
+            ), 1)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
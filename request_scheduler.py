@@ -0,0 +1,198 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+
+from client_metrics import ClientMetrics
+
+INTERACTIVE = "interactive"
+DEFAULT = "default"
+BULK = "bulk"
+
+# Matches the connection pool size of a requests.Session
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+class Lane:
+    """
+    A priority class of requests. Waiting lanes share free slots in proportion to their weight, a lane never runs more
+    than max_concurrency requests at once, and with a rate it starts at most rate requests per second (bursts of up
+    to burst requests).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        weight: float = 1.0,
+        max_concurrency: Optional[int] = None,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+    ):
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.tokens = float(self.burst)
+        self.refilled = time.monotonic()
+        self.running = 0
+        self.virtual_time = 0.0
+        self.waiting: Deque[Dict] = deque()
+
+    def _refill(self, now: float) -> None:
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def next_token_in(self, now: float) -> float:
+        """ Seconds until the lane may start another request under its rate, 0 when it may start one now """
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """ Blocking token bucket: at most rate acquisitions per second, in bursts of up to burst """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """ Wait for a token. Returns the seconds waited """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def default_lanes(max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> List[Lane]:
+    """
+    interactive: operator actions, highest weight. default: everything not assigned a lane. bulk: crawls and
+    ingestion, capped so the default lane keeps a slot too. The scheduler keeps one slot for the interactive lane.
+    """
+    return [
+        Lane(INTERACTIVE, weight=16),
+        Lane(DEFAULT, weight=4),
+        Lane(BULK, weight=1, max_concurrency=max(1, max_concurrency - 2)),
+    ]
+
+
+class RequestScheduler:
+    """
+    Admission control in front of the connection pool. At most max_concurrency requests run at once; when a slot
+    frees up it goes to the eligible lane with the lowest weighted virtual time, so lanes are served fairly in
+    proportion to their weights and a busy lane cannot starve the others. The other lanes together never hold more
+    than max_concurrency - 1 slots, so an interactive request always finds a free slot once one is released. Running
+    requests are never interrupted. Queue waits are recorded per lane in the ClientMetrics given.
+    """
+
+    def __init__(
+        self,
+        lanes: Optional[List[Lane]] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        metrics: Optional[ClientMetrics] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in (lanes or default_lanes(max_concurrency))}
+        if DEFAULT not in self.lanes:
+            self.lanes[DEFAULT] = Lane(DEFAULT)
+        self.metrics = metrics
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def _eligible(self, lane: Lane, now: float) -> bool:
+        if not lane.waiting:
+            return False
+        if lane.max_concurrency is not None and lane.running >= lane.max_concurrency:
+            return False
+        interactive = self.lanes.get(INTERACTIVE)
+        if interactive is not None and lane is not interactive:
+            if self.running - interactive.running >= max(1, self.max_concurrency - 1):
+                return False
+        return lane.next_token_in(now) == 0
+
+    def _dispatch(self) -> Optional[float]:
+        """ Grant free slots to waiting requests. Returns how long until a rate limited lane may be served again """
+        now = time.monotonic()
+        while self.running < self.max_concurrency:
+            eligible = [lane for lane in self.lanes.values() if self._eligible(lane, now)]
+            if not eligible:
+                break
+            lane = min(eligible, key=lambda candidate: candidate.virtual_time)
+            ticket = lane.waiting.popleft()
+            ticket["granted"] = True
+            lane.running += 1
+            self.running += 1
+            if lane.rate:
+                lane.tokens -= 1
+            lane.virtual_time += 1 / lane.weight
+        self.condition.notify_all()
+
+        delays = [
+            lane.next_token_in(now) for lane in self.lanes.values()
+            if lane.waiting and lane.rate and lane.tokens < 1
+        ]
+        return min(delays) if delays else None
+
+    def _activate(self, lane: Lane) -> None:
+        # A lane that was idle rejoins at the current virtual time instead of claiming the share it did not use
+        active = [other.virtual_time for other in self.lanes.values() if other.waiting or other.running]
+        if not lane.waiting and not lane.running and active:
+            lane.virtual_time = max(lane.virtual_time, min(active))
+
+    @contextmanager
+    def slot(self, lane_name: Optional[str] = None) -> Iterator[float]:
+        """ Wait for a slot in a lane (the default lane when unknown) and hold it for the block. Yields the wait """
+        lane = self.lanes.get(lane_name or DEFAULT) or self.lanes[DEFAULT]
+        ticket = {"granted": False}
+        queued = time.perf_counter()
+        with self.condition:
+            self._activate(lane)
+            lane.waiting.append(ticket)
+            try:
+                delay = self._dispatch()
+                while not ticket["granted"]:
+                    self.condition.wait(timeout=delay)
+                    if not ticket["granted"]:
+                        delay = self._dispatch()
+            except BaseException:
+                # An interrupted waiter must not leave its ticket queued or keep a slot granted to it
+                if ticket["granted"]:
+                    lane.running -= 1
+                    self.running -= 1
+                else:
+                    lane.waiting.remove(ticket)
+                self._dispatch()
+                raise
+        wait = time.perf_counter() - queued
+        if self.metrics is not None:
+            self.metrics.record_queue_wait(lane.name, wait)
+
+        try:
+            yield wait
+        finally:
+            with self.condition:
+                lane.running -= 1
+                self.running -= 1
+                self._dispatch()
+
+    def snapshot(self) -> Dict:
+        with self.condition:
+            return {
+                name: {"running": lane.running, "waiting": len(lane.waiting)}
+                for name, lane in self.lanes.items()
+            }
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from ware_api import WareAPI
+
+DEFAULT_FRESHNESS_WINDOW = timedelta(hours=1)
+DEFAULT_BINS_PER_REQUEST = 25
+OPEN_ORDER_STATUSES = ["QUEUED", "IN_PROGRESS"]
+
+SKIP_RECENTLY_SCANNED = "RECENTLY_SCANNED"
+SKIP_OPEN_ORDER = "OPEN_ORDER"
+
+
+def parse_record_timestamp(timestamp: str, zone_timezone: Optional[str] = None) -> datetime:
+    """ Parse a record timestamp. Timestamps without an offset are in the zone's IANA timezone (or UTC) """
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=ZoneInfo(zone_timezone) if zone_timezone else timezone.utc)
+    return parsed
+
+
+class RecordTimestampCache:
+    """ In-memory map of bin name to the timestamp of its latest known location record """
+
+    def __init__(self):
+        self.timestamps: Dict[str, datetime] = {}
+
+    def get(self, bin_name: str) -> Optional[datetime]:
+        return self.timestamps.get(bin_name)
+
+    def update(self, bin_name: str, timestamp: datetime) -> None:
+        current = self.timestamps.get(bin_name)
+        if current is None or timestamp > current:
+            self.timestamps[bin_name] = timestamp
+
+    def update_from_records(self, records: Iterable[Dict], zone_timezone: Optional[str] = None) -> None:
+        """ Add zoneLocationsPageV2 page items or bare location records, e.g. from a crawl or a page result """
+        for item in records:
+            record = item.get("record", item)
+            if record and record.get("binName") and record.get("timestamp"):
+                self.update(record["binName"], parse_record_timestamp(record["timestamp"], zone_timezone))
+
+
+class ScanOrderFilterResult:
+    def __init__(self, bins: List[str], skipped: List[Dict]):
+        # Bins that still need to be scanned, in the requested order
+        self.bins = bins
+        # One {"bin", "reason", ...} entry per dropped bin. Reason is SKIP_RECENTLY_SCANNED or SKIP_OPEN_ORDER
+        self.skipped = skipped
+
+    def skipped_by_reason(self) -> Dict[str, List[str]]:
+        by_reason: Dict[str, List[str]] = {}
+        for entry in self.skipped:
+            by_reason.setdefault(entry["reason"], []).append(entry["bin"])
+        return by_reason
+
+
+def open_order_bins(api: WareAPI, zone_id: str) -> Dict[str, Dict]:
+    """ Map each bin that is queued or being scanned by an open location scan order to that order's id and status """
+    result = api.get_location_scan_orders(zone_id, status=OPEN_ORDER_STATUSES)
+    if result["status"] != "success":
+        raise Exception(f"Error calling getLocationScanOrders: {result['message']}")
+
+    bins = {}
+    for order in (result["data"] or {}).get("orders") or []:
+        summary = order.get("summary") or {}
+        for key, status in (("queuedBinNames", "QUEUED"), ("inProgressBinNames", "IN_PROGRESS")):
+            for bin_name in summary.get(key) or []:
+                bins[bin_name] = {"orderId": order["id"], "status": status}
+    return bins
+
+
+def lookup_bin_timestamps(
+    api: WareAPI,
+    zone_id: str,
+    bins: List[str],
+    cache: RecordTimestampCache,
+    bins_per_request: int = DEFAULT_BINS_PER_REQUEST,
+) -> None:
+    """ Fill the cache with the latest record timestamp of bins it does not know about yet """
+    missing = [bin_name for bin_name in bins if cache.get(bin_name) is None]
+    for start in range(0, len(missing), bins_per_request):
+        chunk = missing[start:start + bins_per_request]
+        for result in api.get_bin_timestamps(zone_id, chunk):
+            if result["status"] != "success":
+                # Bins without a known timestamp are simply kept in the order
+                continue
+            page = result["data"] or {}
+            cache.update_from_records(page.get("records") or [], page.get("timezone"))
+
+
+def filter_scan_order_bins(
+    api: WareAPI,
+    zone_id: str,
+    bins: List[str],
+    freshness_window: timedelta = DEFAULT_FRESHNESS_WINDOW,
+    cache: Optional[RecordTimestampCache] = None,
+    skip_open_orders: bool = True,
+    now: Optional[datetime] = None,
+) -> ScanOrderFilterResult:
+    """
+    Drop bins that do not need a new scan before calling create_location_scan_order: bins whose latest record is
+    newer than freshness_window, and bins already QUEUED or IN_PROGRESS in an open order for the zone.
+    Timestamps come from the cache when known and from batched zoneLocationsPageV2 lookups otherwise.
+    """
+    cache = cache if cache is not None else RecordTimestampCache()
+    now = now or datetime.now(timezone.utc)
+    open_bins = open_order_bins(api, zone_id) if skip_open_orders else {}
+
+    lookup_bin_timestamps(api, zone_id, [bin_name for bin_name in bins if bin_name not in open_bins], cache)
+
+    kept = []
+    skipped = []
+    for bin_name in dict.fromkeys(bins):
+        if bin_name in open_bins:
+            skipped.append(dict(open_bins[bin_name], bin=bin_name, reason=SKIP_OPEN_ORDER))
+            continue
+
+        timestamp = cache.get(bin_name)
+        if timestamp is not None and now - timestamp < freshness_window:
+            skipped.append({"bin": bin_name, "reason": SKIP_RECENTLY_SCANNED, "timestamp": timestamp.isoformat()})
+            continue
+
+        kept.append(bin_name)
+
+    return ScanOrderFilterResult(kept, skipped)
@@ -0,0 +1,184 @@
+from uuid import uuid4
+from typing import Dict, Iterable, List, Optional
+
+from ware_api import WareAPI
+
+DEFAULT_MAX_BINS_PER_ORDER = 200
+DEFAULT_ORDERS_PER_REQUEST = 10
+UNKNOWN_AISLE = ""
+
+
+def zone_aisles(my_info_data: Dict, zone_id: str) -> List[str]:
+    """ Return the ordered aisle names of a zone from the data returned by WareAPI.my_info() """
+    for organization in my_info_data.get("organizations") or []:
+        for warehouse in organization.get("warehouses") or []:
+            for zone in warehouse.get("zones") or []:
+                if zone["id"] == zone_id:
+                    return list(zone["aisles"])
+
+    raise ValueError(f"Zone {zone_id} not found in myInfo")
+
+
+def bin_aisles_from_records(records: Iterable[Dict]) -> Dict[str, str]:
+    """
+    Map bin names to aisles from a local record snapshot. Accepts zoneLocationsPageV2 page items
+    ({"cursor", "record"}) as well as bare location records.
+    """
+    bin_aisles = {}
+    for item in records:
+        record = item.get("record", item)
+        if record and record.get("binName"):
+            bin_aisles[record["binName"]] = record["aisle"]
+    return bin_aisles
+
+
+def _aisle_for_bin(bin_name: str, aisles: List[str], bin_aisles: Dict[str, str]) -> str:
+    if bin_name in bin_aisles:
+        return bin_aisles[bin_name]
+
+    # Without a snapshot entry fall back to the longest aisle name the bin name starts with
+    matches = [aisle for aisle in aisles if aisle and bin_name.startswith(aisle)]
+    return max(matches, key=len) if matches else UNKNOWN_AISLE
+
+
+def plan_scan_orders(
+    bins: List[str],
+    aisles: List[str],
+    bin_aisles: Optional[Dict[str, str]] = None,
+    max_bins_per_order: int = DEFAULT_MAX_BINS_PER_ORDER,
+) -> List[Dict]:
+    """
+    Group bins by aisle and split them into orders of at most max_bins_per_order bins, in the zone's aisle order.
+    Whole aisles are packed together while they fit so an order never needlessly spans an aisle boundary.
+    Bins whose aisle cannot be determined are planned last. Returns a list of {"aisles": [...], "bins": [...]}.
+    """
+    if max_bins_per_order < 1:
+        raise ValueError("max_bins_per_order must be at least 1")
+
+    bin_aisles = bin_aisles or {}
+    grouped: Dict[str, List[str]] = {}
+    seen = set()
+    for bin_name in bins:
+        if bin_name in seen:
+            continue
+        seen.add(bin_name)
+        grouped.setdefault(_aisle_for_bin(bin_name, aisles, bin_aisles), []).append(bin_name)
+
+    aisle_order = {aisle: index for index, aisle in enumerate(aisles)}
+    ordered_aisles = sorted(
+        grouped,
+        key=lambda aisle: (aisle == UNKNOWN_AISLE, aisle_order.get(aisle, len(aisle_order)), aisle),
+    )
+
+    orders: List[Dict] = []
+    current: Dict = {"aisles": [], "bins": []}
+    for aisle in ordered_aisles:
+        aisle_bins = grouped[aisle]
+        if current["bins"] and len(current["bins"]) + len(aisle_bins) > max_bins_per_order:
+            orders.append(current)
+            current = {"aisles": [], "bins": []}
+
+        for start in range(0, len(aisle_bins), max_bins_per_order):
+            chunk = aisle_bins[start:start + max_bins_per_order]
+            if len(current["bins"]) + len(chunk) > max_bins_per_order:
+                orders.append(current)
+                current = {"aisles": [], "bins": []}
+            current["aisles"].append(aisle)
+            current["bins"].extend(chunk)
+
+    if current["bins"]:
+        orders.append(current)
+
+    return orders
+
+
+class ScanOrderBatch:
+    """ Handle for a group of location scan orders created together by create_planned_scan_orders """
+
+    def __init__(self, zone_id: str, base_token: str, orders: List[Dict]):
+        self.zone_id = zone_id
+        self.base_token = base_token
+        # One entry per planned order: aisles, bins, userTrackingToken and either id/createdAt or error
+        self.orders = orders
+        self.statuses: Dict[str, Dict] = {}
+
+    @property
+    def order_ids(self) -> List[str]:
+        return [order["id"] for order in self.orders if order.get("id")]
+
+    @property
+    def failed_orders(self) -> List[Dict]:
+        return [order for order in self.orders if order.get("error")]
+
+    def refresh(self, api: WareAPI, orders_per_request: int = DEFAULT_ORDERS_PER_REQUEST) -> Dict[str, Dict]:
+        """ Fetch the current status of every created order, batching the lookups """
+        order_ids = self.order_ids
+        for start in range(0, len(order_ids), orders_per_request):
+            chunk = order_ids[start:start + orders_per_request]
+            for order_id, result in zip(chunk, api.get_location_scan_order_statuses(chunk)):
+                if result["status"] == "success":
+                    self.statuses[order_id] = result["data"]
+        return self.statuses
+
+    def summary(self) -> Dict[str, int]:
+        """ Aggregate the bin counts of the last refresh across all orders """
+        totals = {
+            "orders": len(self.orders),
+            "failedOrders": len(self.failed_orders),
+            "totalBins": 0,
+            "queuedBinCount": 0,
+            "inProgressBinCount": 0,
+            "succeededBinCount": 0,
+            "errorBinCount": 0,
+            "canceledBinCount": 0,
+        }
+        for status in self.statuses.values():
+            for key, value in (status.get("summary") or {}).items():
+                if key in totals and value:
+                    totals[key] += value
+        return totals
+
+    def is_complete(self) -> bool:
+        """ True once every created order has finished, successfully or not """
+        return all(
+            self.statuses.get(order_id, {}).get("status") in ("SUCCEEDED", "ERROR") for order_id in self.order_ids
+        )
+
+    def error_bins(self) -> Dict[str, List[str]]:
+        """ Bins that failed (e.g. NO_VALID_PATH), keyed by the order they belong to """
+        return {
+            order_id: status["summary"]["errorBinNames"]
+            for order_id, status in self.statuses.items()
+            if (status.get("summary") or {}).get("errorBinNames")
+        }
+
+
+def create_planned_scan_orders(
+    api: WareAPI,
+    zone_id: str,
+    planned_orders: List[Dict],
+    base_token: Optional[str] = None,
+    orders_per_request: int = DEFAULT_ORDERS_PER_REQUEST,
+) -> ScanOrderBatch:
+    """
+    Create the orders produced by plan_scan_orders, several per request. Each order is tagged with a
+    userTrackingToken derived from base_token so the whole batch can be found again later.
+    """
+    base_token = base_token or f"bulk-{uuid4().hex[:12]}"
+    orders = [
+        dict(planned, userTrackingToken=f"{base_token}-{index:04d}") for index, planned in enumerate(planned_orders)
+    ]
+
+    for start in range(0, len(orders), orders_per_request):
+        chunk = orders[start:start + orders_per_request]
+        results = api.create_location_scan_orders(
+            zone_id, [(order["bins"], order["userTrackingToken"]) for order in chunk]
+        )
+        for order, result in zip(chunk, results):
+            if result["status"] == "success":
+                order["id"] = result["data"]["id"]
+                order["createdAt"] = result["data"]["createdAt"]
+            else:
+                order["error"] = result["message"]
+
+    return ScanOrderBatch(zone_id, base_token, orders)
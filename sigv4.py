@@ -0,0 +1,129 @@
+import hmac
+import time
+import hashlib
+from urllib.parse import parse_qsl, quote, urlsplit
+from typing import Dict, Optional, Tuple
+
+from requests.auth import AuthBase
+from requests.models import PreparedRequest
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+PAYLOAD_HASH_HEADER = "x-amz-content-sha256"
+# Headers covered by the signature, besides host and the x-amz-* headers added here
+SIGNED_HEADERS = ("content-type", "content-encoding")
+
+
+def payload_hash(body: Optional[bytes]) -> str:
+    return hashlib.sha256(body or b"").hexdigest()
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+class SigV4Signer(AuthBase):
+    """
+    AWS Signature Version 4 request signing for requests, over the exact body bytes that are sent. When the request
+    already carries an x-amz-content-sha256 header (see WareAPI.query) its payload hash is used as is, so a body is
+    hashed once however many times it is signed. Signing keys are derived once per day. Credentials can be replaced
+    with rotate() while other threads sign.
+    """
+
+    def __init__(
+        self,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        service: str,
+        session_token: Optional[str] = None,
+    ):
+        self.region = region
+        self.service = service
+        # Replaced as a whole, so a signature never mixes two credential sets
+        self.credentials: Tuple[str, str, Optional[str]] = (access_key, secret_key, session_token)
+        self.signing_key: Tuple[str, str, bytes] = ("", "", b"")
+
+    @property
+    def access_key(self) -> str:
+        return self.credentials[0]
+
+    @property
+    def secret_key(self) -> str:
+        return self.credentials[1]
+
+    @property
+    def session_token(self) -> Optional[str]:
+        return self.credentials[2]
+
+    def rotate(self, access_key: str, secret_key: str, session_token: Optional[str] = None) -> None:
+        """ Sign later requests with new credentials, e.g. refreshed temporary ones """
+        self.credentials = (access_key, secret_key, session_token)
+
+    def _signing_key(self, secret_key: str, date_stamp: str) -> bytes:
+        cached_secret, cached_date, key = self.signing_key
+        if cached_date != date_stamp or cached_secret != secret_key:
+            key = _hmac(("AWS4" + secret_key).encode("utf-8"), date_stamp)
+            for part in (self.region, self.service, "aws4_request"):
+                key = _hmac(key, part)
+            # A single tuple assignment keeps the cache consistent across threads
+            self.signing_key = (secret_key, date_stamp, key)
+        return key
+
+    def sign(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+        amz_date: Optional[str] = None,
+    ) -> Dict[str, str]:
+        """
+        Add the x-amz-* and Authorization headers for a request to headers, and return them. amz_date signs at a
+        given time instead of now, which lets a receiver recompute the signature of a request (see local_stand_in.py)
+        """
+        access_key, secret_key, session_token = self.credentials
+        parts = urlsplit(url)
+        amz_date = amz_date or time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        date_stamp = amz_date[:8]
+
+        headers["x-amz-date"] = amz_date
+        if PAYLOAD_HASH_HEADER not in headers:
+            headers[PAYLOAD_HASH_HEADER] = payload_hash(body)
+        if session_token:
+            headers["x-amz-security-token"] = session_token
+
+        signed = {"host": parts.netloc}
+        for name, value in headers.items():
+            lower = name.lower()
+            if lower.startswith("x-amz-") or lower in SIGNED_HEADERS:
+                signed[lower] = " ".join(str(value).split())
+        signed_names = ";".join(sorted(signed))
+        canonical_query = "&".join(
+            f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for key, value in sorted(parse_qsl(parts.query, keep_blank_values=True))
+        )
+        canonical_request = "\n".join([
+            method.upper(),
+            quote(parts.path or "/", safe="/-_.~%"),
+            canonical_query,
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names,
+            headers[PAYLOAD_HASH_HEADER],
+        ])
+
+        scope = f"{date_stamp}/{self.region}/{self.service}/aws4_request"
+        string_to_sign = "\n".join([
+            ALGORITHM, amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ])
+        signature = hmac.new(
+            self._signing_key(secret_key, date_stamp), string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+        headers["Authorization"] = (
+            f"{ALGORITHM} Credential={access_key}/{scope}, SignedHeaders={signed_names}, Signature={signature}"
+        )
+        return headers
+
+    def __call__(self, request: PreparedRequest) -> PreparedRequest:
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else request.body
+        self.sign(request.method, request.url, request.headers, body)
+        return request
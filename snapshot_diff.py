@@ -0,0 +1,248 @@
+import os
+import json
+import heapq
+import shutil
+import tempfile
+from enum import Enum
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from spreadsheet_rows import iter_spreadsheet_rows
+
+# Number of rows sorted in memory before a sorted run is written to disk
+DEFAULT_RUN_ROWS = 200_000
+
+# Column names of a zoneLocationsReport file, override with column_map if a report uses different headers
+DEFAULT_REPORT_COLUMNS = {
+    "binName": "Location",
+    "lpn": "LPN",
+    "exception": "Exception",
+    "userStatus": "Status",
+}
+
+LPN_FACT = "lpn"
+EXCEPTION_FACT = "exception"
+STATUS_FACT = "userStatus"
+PRESENT_FACT = "present"
+
+
+class DiffEventType(str, Enum):
+    BIN_ADDED = "BIN_ADDED"
+    BIN_REMOVED = "BIN_REMOVED"
+    LPN_ADDED = "LPN_ADDED"
+    LPN_REMOVED = "LPN_REMOVED"
+    LPN_MOVED = "LPN_MOVED"
+    EXCEPTION_APPEARED = "EXCEPTION_APPEARED"
+    EXCEPTION_CLEARED = "EXCEPTION_CLEARED"
+    USER_STATUS_CHANGED = "USER_STATUS_CHANGED"
+
+
+def external_sort(rows: Iterable[list], directory: str, run_rows: int = DEFAULT_RUN_ROWS) -> Iterator[list]:
+    """
+    Sort JSON serializable list rows of any volume: sorted runs of run_rows rows are written to directory and
+    merged back in a single streaming pass.
+    """
+    runs: List[str] = []
+    buffer: List[list] = []
+
+    def write_run() -> None:
+        buffer.sort()
+        path = os.path.join(directory, f"run-{len(runs)}.ndjson")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(row, separators=(",", ":")) + "\n" for row in buffer)
+        runs.append(path)
+        buffer.clear()
+
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= run_rows:
+            write_run()
+
+    if not runs:
+        buffer.sort()
+        yield from buffer
+        return
+    if buffer:
+        write_run()
+
+    files = [open(path, encoding="utf-8") for path in runs]
+    try:
+        yield from heapq.merge(*((json.loads(line) for line in f) for f in files))
+    finally:
+        for f in files:
+            f.close()
+        for path in runs:
+            os.unlink(path)
+
+
+def _latest_user_status(exceptions: List[Dict]) -> Optional[str]:
+    history = [entry for exception in exceptions for entry in exception.get("exceptionHistory") or []]
+    history = [entry for entry in history if entry.get("timestamp")]
+    return max(history, key=lambda entry: entry["timestamp"]).get("userStatus") if history else None
+
+
+def snapshot_facts(items: Iterable[Dict]) -> Iterator[list]:
+    """
+    [binName, fact, value] rows for zoneLocationsPageV2 page items or records: the LPNs, exception types and user
+    status of every bin.
+    """
+    for item in items:
+        record = item.get("record", item)
+        if not record:
+            continue
+        bin_name = record["binName"]
+        yield [bin_name, PRESENT_FACT, ""]
+        exceptions = list(record.get("exceptions") or [])
+        for inventory in record.get("inventory") or []:
+            exceptions.extend(inventory.get("exceptions") or [])
+            if inventory.get("type", "LPN") == "LPN" and inventory.get("text"):
+                yield [bin_name, LPN_FACT, inventory["text"]]
+        for exception in exceptions:
+            yield [bin_name, EXCEPTION_FACT, exception["type"]]
+        if user_status := (record.get("userStatus") or _latest_user_status(exceptions)):
+            yield [bin_name, STATUS_FACT, user_status]
+
+
+def report_facts(rows: Iterable[Dict], column_map: Optional[Dict[str, str]] = None) -> Iterator[list]:
+    """ [binName, fact, value] rows for a zoneLocationsReport file, which may hold several rows per bin """
+    columns = dict(DEFAULT_REPORT_COLUMNS, **(column_map or {}))
+    for row in rows:
+        bin_name = (row.get(columns["binName"]) or "").strip()
+        if not bin_name:
+            continue
+        yield [bin_name, PRESENT_FACT, ""]
+        if lpn := (row.get(columns["lpn"]) or "").strip():
+            yield [bin_name, LPN_FACT, lpn]
+        # A report cell may list several exceptions
+        for exception in (row.get(columns["exception"]) or "").replace(";", ",").split(","):
+            if exception.strip():
+                yield [bin_name, EXCEPTION_FACT, exception.strip()]
+        if status := (row.get(columns["userStatus"]) or "").strip():
+            yield [bin_name, STATUS_FACT, status]
+
+
+def read_snapshot(path: str, column_map: Optional[Dict[str, str]] = None) -> Iterator[list]:
+    """ Facts of a snapshot file: NDJSON of page items (e.g. from crawl_to_ndjson) or a CSV/XLSX report """
+    if path.lower().endswith((".ndjson", ".jsonl")):
+        def items():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        return snapshot_facts(items())
+    return report_facts(iter_spreadsheet_rows(path), column_map)
+
+
+def _bin_states(sorted_facts: Iterator[list]) -> Iterator[Tuple[str, Dict]]:
+    for bin_name, facts in groupby(sorted_facts, key=lambda fact: fact[0]):
+        state = {LPN_FACT: set(), EXCEPTION_FACT: set(), STATUS_FACT: None}
+        for _, fact, value in facts:
+            if fact == STATUS_FACT:
+                state[STATUS_FACT] = value
+            elif fact != PRESENT_FACT:
+                state[fact].add(value)
+        yield bin_name, state
+
+
+def _merge_join(before: Iterator[Tuple[str, Dict]], after: Iterator[Tuple[str, Dict]]):
+    # Full outer join of two streams sorted by bin name
+    empty = (None, None)
+    left, right = next(before, empty), next(after, empty)
+    while left[0] is not None or right[0] is not None:
+        if right[0] is None or (left[0] is not None and left[0] < right[0]):
+            yield left[0], left[1], None
+            left = next(before, empty)
+        elif left[0] is None or right[0] < left[0]:
+            yield right[0], None, right[1]
+            right = next(after, empty)
+        else:
+            yield left[0], left[1], right[1]
+            left, right = next(before, empty), next(after, empty)
+
+
+def _read_rows(path: str) -> Iterator[list]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _lpn_events(sorted_changes: Iterator[list]) -> Iterator[Dict]:
+    # Changes sorted by LPN: an LPN removed from one bin and added to another in the same diff has moved
+    for lpn, changes in groupby(sorted_changes, key=lambda change: change[0]):
+        removed: List[str] = []
+        added: List[str] = []
+        for _, change, bin_name in changes:
+            (removed if change == "removed" else added).append(bin_name)
+        for source, target in zip(removed, added):
+            yield {"type": DiffEventType.LPN_MOVED.value, "lpn": lpn, "from": source, "to": target}
+        for source in removed[len(added):]:
+            yield {"type": DiffEventType.LPN_REMOVED.value, "lpn": lpn, "binName": source}
+        for target in added[len(removed):]:
+            yield {"type": DiffEventType.LPN_ADDED.value, "lpn": lpn, "binName": target}
+
+
+def diff_snapshots(
+    before_facts: Iterable[list],
+    after_facts: Iterable[list],
+    run_rows: int = DEFAULT_RUN_ROWS,
+    work_directory: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    Stream the differences between two snapshots given as facts (see read_snapshot). Both inputs are sorted by bin
+    name on disk and merged, emitting bins added or removed, exceptions that appeared or cleared and userStatus
+    changes as it goes. LPN changes are spilled to disk and sorted by LPN afterwards, so an LPN that left one bin and
+    appeared in another is reported once as LPN_MOVED instead of a removal and an addition.
+    Memory use is bounded by run_rows rather than the snapshot size.
+    """
+    directory = tempfile.mkdtemp(prefix="ware-diff-", dir=work_directory)
+    try:
+        for name in ("before", "after", "lpn"):
+            os.mkdir(os.path.join(directory, name))
+        before = _bin_states(external_sort(before_facts, os.path.join(directory, "before"), run_rows))
+        after = _bin_states(external_sort(after_facts, os.path.join(directory, "after"), run_rows))
+        empty = {LPN_FACT: set(), EXCEPTION_FACT: set(), STATUS_FACT: None}
+        lpn_path = os.path.join(directory, "lpn-changes.ndjson")
+
+        with open(lpn_path, "w", encoding="utf-8") as lpn_changes:
+            for bin_name, old, new in _merge_join(before, after):
+                if old is None:
+                    yield {"type": DiffEventType.BIN_ADDED.value, "binName": bin_name}
+                if new is None:
+                    yield {"type": DiffEventType.BIN_REMOVED.value, "binName": bin_name}
+                old, new = old or empty, new or empty
+
+                for lpn in old[LPN_FACT] - new[LPN_FACT]:
+                    lpn_changes.write(json.dumps([lpn, "removed", bin_name]) + "\n")
+                for lpn in new[LPN_FACT] - old[LPN_FACT]:
+                    lpn_changes.write(json.dumps([lpn, "added", bin_name]) + "\n")
+                for exception in sorted(new[EXCEPTION_FACT] - old[EXCEPTION_FACT]):
+                    yield {"type": DiffEventType.EXCEPTION_APPEARED.value, "binName": bin_name, "exception": exception}
+                for exception in sorted(old[EXCEPTION_FACT] - new[EXCEPTION_FACT]):
+                    yield {"type": DiffEventType.EXCEPTION_CLEARED.value, "binName": bin_name, "exception": exception}
+                if old[STATUS_FACT] != new[STATUS_FACT]:
+                    yield {
+                        "type": DiffEventType.USER_STATUS_CHANGED.value,
+                        "binName": bin_name,
+                        "before": old[STATUS_FACT],
+                        "after": new[STATUS_FACT],
+                    }
+
+        yield from _lpn_events(external_sort(_read_rows(lpn_path), os.path.join(directory, "lpn"), run_rows))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def diff_snapshot_files(
+    before_path: str,
+    after_path: str,
+    column_map: Optional[Dict[str, str]] = None,
+    run_rows: int = DEFAULT_RUN_ROWS,
+    work_directory: Optional[str] = None,
+) -> Iterator[Dict]:
+    """ diff_snapshots for two files, each an NDJSON snapshot or a CSV/XLSX report """
+    return diff_snapshots(
+        read_snapshot(before_path, column_map),
+        read_snapshot(after_path, column_map),
+        run_rows=run_rows,
+        work_directory=work_directory,
+    )
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+import sys
+import json
+import argparse
+from collections import Counter
+from snapshot_diff import DEFAULT_REPORT_COLUMNS, diff_snapshot_files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Compare two snapshots of a zone and print what changed between them as NDJSON.
+    # Each snapshot is either a zoneLocationsReport file (CSV or XLSX) or an NDJSON file of zoneLocationsPageV2
+    # page items, e.g. written by zone_fanout_example.py. No Ware credentials are needed.
+    # """
+    )
+
+    parser.add_argument("--before", type=str, help="Earlier snapshot file", required=True)
+    parser.add_argument("--after", type=str, help="Later snapshot file", required=True)
+    parser.add_argument("--output", type=str, help="Optional NDJSON output file, defaults to stdout", default=None)
+    parser.add_argument("--work-dir", type=str, help="Optional directory for sorted runs", default=None)
+    for field, column in DEFAULT_REPORT_COLUMNS.items():
+        parser.add_argument(
+            f"--{field.lower()}-column", type=str, help=f"Report column holding the {field}", default=column
+        )
+    args = parser.parse_args()
+
+    column_map = {field: getattr(args, f"{field.lower()}_column") for field in DEFAULT_REPORT_COLUMNS}
+    counts = Counter()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for event in diff_snapshot_files(args.before, args.after, column_map, work_directory=args.work_dir):
+            counts[event["type"]] += 1
+            output.write(json.dumps(event) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    print(json.dumps(counts, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
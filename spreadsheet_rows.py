@@ -0,0 +1,99 @@
+import csv
+import posixpath
+import zipfile
+from typing import Dict, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_RELATIONSHIP_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def iter_csv_rows(path: str, encoding: str = "utf-8-sig") -> Iterator[Dict[str, str]]:
+    """ Stream the rows of a CSV file with a header row as dicts """
+    with open(path, newline="", encoding=encoding) as f:
+        yield from csv.DictReader(f)
+
+
+def _column_index(cell_reference: str) -> int:
+    index = 0
+    for character in cell_reference:
+        if not character.isalpha():
+            break
+        index = index * 26 + ord(character.upper()) - ord("A") + 1
+    return index - 1
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{SPREADSHEET_NS}si":
+                strings.append("".join(text.text or "" for text in element.iter(f"{SPREADSHEET_NS}t")))
+                element.clear()
+    return strings
+
+
+def _first_sheet_path(archive: zipfile.ZipFile) -> str:
+    with archive.open("xl/workbook.xml") as f:
+        sheet = next(element for _, element in iterparse(f) if element.tag == f"{SPREADSHEET_NS}sheet")
+        relationship_id = sheet.get(f"{RELATIONSHIP_NS}id")
+    with archive.open("xl/_rels/workbook.xml.rels") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{PACKAGE_RELATIONSHIP_NS}Relationship" and element.get("Id") == relationship_id:
+                target = element.get("Target")
+                return target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+    raise ValueError("Workbook has no worksheet")
+
+
+def iter_xlsx_values(path: str) -> Iterator[List[Optional[str]]]:
+    """
+    Stream the cell values of the first worksheet of an XLSX file row by row, without loading the workbook.
+    Only the shared string table is held in memory.
+    """
+    with zipfile.ZipFile(path) as archive:
+        strings = _shared_strings(archive)
+        with archive.open(_first_sheet_path(archive)) as f:
+            row: List[Optional[str]] = []
+            for _, element in iterparse(f):
+                if element.tag == f"{SPREADSHEET_NS}c":
+                    index = _column_index(element.get("r", "")) if element.get("r") else len(row)
+                    cell_type = element.get("t")
+                    if cell_type == "inlineStr":
+                        value = "".join(text.text or "" for text in element.iter(f"{SPREADSHEET_NS}t"))
+                    else:
+                        value_element = element.find(f"{SPREADSHEET_NS}v")
+                        value = value_element.text if value_element is not None else None
+                        if cell_type == "s" and value is not None:
+                            value = strings[int(value)]
+                    row.extend([None] * (index + 1 - len(row)))
+                    row[index] = value
+                elif element.tag == f"{SPREADSHEET_NS}row":
+                    yield row
+                    row = []
+                    element.clear()
+
+
+def iter_xlsx_rows(path: str) -> Iterator[Dict[str, str]]:
+    """ Stream the rows of the first worksheet of an XLSX file with a header row as dicts """
+    values = iter_xlsx_values(path)
+    header = next(values, None)
+    if header is None:
+        return
+    header = [name or "" for name in header]
+    for row in values:
+        yield {
+            name: (row[index] if index < len(row) and row[index] is not None else "")
+            for index, name in enumerate(header)
+        }
+
+
+def iter_spreadsheet_rows(path: str, file_format: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """ Stream a CSV or XLSX file as dicts. The format is taken from the file extension unless given """
+    file_format = (file_format or ("XLSX" if path.lower().endswith("xlsx") else "CSV")).upper()
+    if file_format == "XLSX":
+        return iter_xlsx_rows(path)
+    return iter_csv_rows(path)
+
@@ -0,0 +1,204 @@
+import json
+import codecs
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Small reads keep the time to the first record low, read() blocks until a whole chunk has arrived
+DEFAULT_CHUNK_BYTES = 16 * 1024
+# Consumed text is dropped from the buffer once this much of it has accumulated
+COMPACT_CHARS = 256 * 1024
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """ Character level access to a JSON document arriving as byte chunks """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def fill(self) -> bool:
+        """ Append the next chunk to the buffer. Returns False at the end of the input """
+        if self.eof:
+            return False
+        if self.position > COMPACT_CHARS:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        for chunk in self.chunks:
+            if chunk:
+                self.bytes_read += len(chunk)
+                self.buffer += self.text_decoder.decode(chunk)
+                return True
+        self.buffer += self.text_decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        """ Next non-whitespace character, without consuming it """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, character: str) -> None:
+        if (found := self.peek()) != character:
+            raise ValueError(f"Expected {character!r} at offset {self.position}, found {found!r}")
+        self.position += 1
+
+    def value(self) -> Any:
+        """ Decode the next complete JSON value, reading more input until it is complete """
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def members(self) -> Iterator[str]:
+        """ Iterate the keys of an object, leaving the reader at each value """
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.position += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' at offset {self.position - 1}")
+
+    def elements(self) -> Iterator[Any]:
+        """ Decode the elements of an array one at a time """
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {self.position - 1}")
+
+
+class PageStream:
+    """
+    Incremental decode of a paged GraphQL response such as {"data": {"zoneLocationsPageV2": {"pageInfo": ...,
+    "records": [...]}}}. Iterating yields each element of the list field as soon as it is complete, without holding
+    the whole body or the earlier elements. The other fields of the page (pageInfo, timezone, ...) are available in
+    `fields` once they have been read, and GraphQL errors in `errors`; both are complete after iteration ends.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        data_key: str,
+        list_field: str = "records",
+        on_complete: Optional[Callable[["PageStream"], None]] = None,
+    ):
+        self.reader = _Reader(chunks)
+        self.data_key = data_key
+        self.list_field = list_field
+        self.on_complete = on_complete
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[Dict] = []
+        self.extra: Dict[str, Any] = {}
+        self.has_data = False
+        self.count = 0
+        self.complete = False
+        self.closed = False
+
+    @property
+    def page_info(self) -> Optional[Dict]:
+        return self.fields.get("pageInfo")
+
+    @property
+    def bytes_read(self) -> int:
+        return self.reader.bytes_read
+
+    def __iter__(self) -> Iterator[Any]:
+        reader = self.reader
+        try:
+            for key in reader.members():
+                if key == "data" and reader.peek() == "{":
+                    for data_key in reader.members():
+                        if data_key == self.data_key and reader.peek() == "{":
+                            self.has_data = True
+                            yield from self._page()
+                        else:
+                            reader.value()
+                elif key == "errors":
+                    self.errors = reader.value() or []
+                else:
+                    # Top level error responses carry a message instead of data
+                    self.extra[key] = reader.value()
+            self.complete = True
+        finally:
+            self.close()
+
+    def _page(self) -> Iterator[Any]:
+        reader = self.reader
+        for field in reader.members():
+            if field == self.list_field and reader.peek() == "[":
+                for element in reader.elements():
+                    self.count += 1
+                    yield element
+            else:
+                self.fields[field] = reader.value()
+
+    def close(self) -> None:
+        """ Release the underlying response. Called when iteration ends, or by the caller when it stops early """
+        if not self.closed:
+            self.closed = True
+            if self.on_complete is not None:
+                self.on_complete(self)
+
+    def __enter__(self) -> "PageStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def result(self) -> Dict:
+        """ Result dict in the WareAPI.query format, without the list field. Only meaningful after iteration """
+        if self.has_data:
+            return {"status": "success", "data": dict(self.fields), "errors": self.errors}
+        return {
+            "status": "error",
+            "message": self.extra.get("message") or "; ".join(error.get("message", "") for error in self.errors),
+            "response": dict(self.extra, errors=self.errors),
+        }
+
+
+
+def leading_page_info(body: bytes, data_key: str = "zoneLocationsPageV2") -> Optional[Dict]:
+    """
+    pageInfo of a complete response body, decoding only the part before it. Ware returns pageInfo ahead of the
+    records, so the next cursor is known without decoding the page. None when the response has no page.
+    """
+    stream = PageStream([body], data_key)
+    for _ in stream:
+        if stream.page_info is not None:
+            break
+    stream.close()
+    return stream.page_info
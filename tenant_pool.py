@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from client_metrics import ClientMetrics
+from request_scheduler import RateLimiter, RequestScheduler
+from transport import TransportConfig
+from ware_api import DEFAULT_HOST, DEFAULT_REGION, WareAPI
+
+# Temporary credentials are fetched again this often
+DEFAULT_REFRESH_SECONDS = 15 * 60
+
+# (access key, secret key, session token or None)
+Credentials = Tuple[str, str, Optional[str]]
+# Returns credentials as a tuple, a dict with accessKey/secretKey/sessionToken, or an object with access_key,
+# secret_key and token attributes such as boto3's frozen credentials
+CredentialProvider = Callable[[], Any]
+
+
+def resolve_credentials(value: Any) -> Credentials:
+    """ Normalise what a CredentialProvider returned """
+    if isinstance(value, (tuple, list)):
+        access_key, secret_key, *rest = value
+        return access_key, secret_key, rest[0] if rest else None
+    if isinstance(value, dict):
+        return value["accessKey"], value["secretKey"], value.get("sessionToken")
+    return value.access_key, value.secret_key, getattr(value, "token", None)
+
+
+def static_credentials(access_key: str, secret_key: str, session_token: Optional[str] = None) -> CredentialProvider:
+    return lambda: (access_key, secret_key, session_token)
+
+
+def environment_credentials(prefix: str) -> CredentialProvider:
+    """ Credentials from {prefix}AWS_ACCESS_KEY_ID, {prefix}AWS_SECRET_ACCESS_KEY and {prefix}AWS_SESSION_TOKEN """
+    def provider() -> Credentials:
+        access_key = os.environ.get(f"{prefix}AWS_ACCESS_KEY_ID")
+        secret_key = os.environ.get(f"{prefix}AWS_SECRET_ACCESS_KEY")
+        if access_key is None or secret_key is None:
+            raise Exception(f"Must define {prefix}AWS_ACCESS_KEY_ID and {prefix}AWS_SECRET_ACCESS_KEY")
+        return access_key, secret_key, os.environ.get(f"{prefix}AWS_SESSION_TOKEN")
+    return provider
+
+
+def boto3_credentials(profile_name: Optional[str] = None, role_arn: Optional[str] = None) -> CredentialProvider:
+    """ Credentials of a boto3 profile, or of a role assumed with it. boto3 is imported when first called """
+    def provider() -> Any:
+        import boto3
+        session = boto3.Session(profile_name=profile_name)
+        if role_arn is None:
+            return session.get_credentials().get_frozen_credentials()
+        assumed = session.client("sts").assume_role(RoleArn=role_arn, RoleSessionName="ware-tenant-pool")["Credentials"]
+        return assumed["AccessKeyId"], assumed["SecretAccessKey"], assumed["SessionToken"]
+    return provider
+
+
+class _Tenant:
+    def __init__(self, api: WareAPI, provider: CredentialProvider, refresh_seconds: Optional[float]):
+        self.api = api
+        self.provider = provider
+        self.refresh_seconds = refresh_seconds
+        self.refreshed = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refresh_if_due(self) -> None:
+        if self.refresh_seconds is None or time.monotonic() - self.refreshed < self.refresh_seconds:
+            return
+        with self.lock:
+            if time.monotonic() - self.refreshed >= self.refresh_seconds:
+                self.api.set_credentials(*resolve_credentials(self.provider()))
+                self.refreshed = time.monotonic()
+
+
+class TenantPool:
+    """
+    WareAPI clients for many tenants, each with its own credentials, in one process. The clients share one
+    connection pool (a shared TransportConfig) and one RequestScheduler, so the total concurrency is bounded across
+    tenants. Each tenant keeps its own signer and signing key cache, metrics and optional rate limit. Credentials
+    come from a provider per tenant and are fetched again every refresh_seconds.
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        region: str = DEFAULT_REGION,
+        transport: Optional[TransportConfig] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        refresh_seconds: Optional[float] = DEFAULT_REFRESH_SECONDS,
+        **client_options,
+    ):
+        self.host = host
+        self.region = region
+        self.transport = transport or TransportConfig()
+        self.transport.shared = True
+        # Queue waits of the shared scheduler are recorded here rather than in any one tenant's metrics
+        self.metrics = ClientMetrics()
+        self.scheduler = scheduler or RequestScheduler(max_concurrency=self.transport.pool_size)
+        if self.scheduler.metrics is None:
+            self.scheduler.metrics = self.metrics
+        self.refresh_seconds = refresh_seconds
+        self.client_options = {"thread_safe": True, **client_options}
+        self.lock = threading.Lock()
+        self.tenants: Dict[str, _Tenant] = {}
+
+    def add(
+        self,
+        tenant_id: str,
+        credentials: CredentialProvider,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        **client_options,
+    ) -> WareAPI:
+        """
+        Register a tenant. credentials is called now and again every refresh_seconds. rate caps the tenant's
+        requests per second. client_options override the pool's WareAPI options for this tenant
+        """
+        access_key, secret_key, session_token = resolve_credentials(credentials())
+        api = WareAPI(
+            host=self.host,
+            region=self.region,
+            scheduler=self.scheduler,
+            transport=self.transport,
+            access_key=access_key,
+            secret_key=secret_key,
+            session_token=session_token,
+            rate_limiter=RateLimiter(rate, burst) if rate else None,
+            **{**self.client_options, **client_options},
+        )
+        with self.lock:
+            if tenant_id in self.tenants:
+                raise ValueError(f"Tenant already added: {tenant_id}")
+            self.tenants[tenant_id] = _Tenant(api, credentials, self.refresh_seconds)
+        return api
+
+    def get(self, tenant_id: str) -> WareAPI:
+        """ The client of a tenant, with its credentials refreshed first when due. Raises KeyError when unknown """
+        with self.lock:
+            tenant = self.tenants[tenant_id]
+        tenant.refresh_if_due()
+        return tenant.api
+
+    __getitem__ = get
+
+    def remove(self, tenant_id: str) -> None:
+        with self.lock:
+            self.tenants.pop(tenant_id, None)
+
+    def tenant_ids(self) -> List[str]:
+        with self.lock:
+            return list(self.tenants)
+
+    def snapshot(self) -> Dict:
+        """ Metrics per tenant, plus the shared scheduler's state and queue waits """
+        with self.lock:
+            tenants = dict(self.tenants)
+        return {
+            "tenants": {tenant_id: tenant.api.metrics.snapshot() for tenant_id, tenant in tenants.items()},
+            "scheduler": self.scheduler.snapshot(),
+            "lanes": self.metrics.snapshot()["lanes"],
+        }
+
+    def close(self) -> None:
+        """ Close the shared connection pool """
+        if self.transport.shared_adapter is not None:
+            self.transport.shared_adapter.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+import sys
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from local_stand_in import LocalStandIn
+from transport import TransportConfig
+from ware_api import WareAPI
+
+ZONE_ID = "zone-1"
+
+
+def operations(api: WareAPI, stand_in: LocalStandIn, worker: int) -> List[Callable[[], None]]:
+    """
+    One round of every WareAPI operation for a worker. Each check compares the result with what this worker asked
+    for (its own bins, tokens and ids), so a response delivered to the wrong caller fails the round.
+    """
+    bin_index = worker % stand_in.zones[ZONE_ID]
+    bin_name = stand_in.bin_name(bin_index)
+    token = f"worker-{worker}-{uuid.uuid4()}"
+
+    def check(condition: bool, operation: str) -> None:
+        if not condition:
+            raise AssertionError(f"{operation} returned another caller's result or failed")
+
+    def my_info() -> None:
+        check(api.my_info()["data"]["organizations"][0]["warehouses"][0]["zones"][0]["id"] == ZONE_ID, "my_info")
+
+    def zone_page() -> None:
+        page = api.zone_locations_page(ZONE_ID, limit=1, cursor=str(bin_index))["data"]
+        check(page["records"][0]["record"]["binName"] == bin_name, "zone_locations_page")
+
+    def zone_page_stream() -> None:
+        with api.zone_locations_page_stream(ZONE_ID, limit=1, cursor=str(bin_index)) as page:
+            records = list(page)
+        check(records[0]["record"]["binName"] == bin_name, "zone_locations_page_stream")
+
+    def zone_page_body() -> None:
+        body = json.loads(api.zone_locations_page_body(ZONE_ID, limit=1, cursor=str(bin_index)))
+        check(body["data"]["zoneLocationsPageV2"]["records"][0]["record"]["binName"] == bin_name, "zone_locations_page_body")
+
+    def report() -> None:
+        url = api.zone_locations_report(ZONE_ID)["data"]["zoneInventoryReportUrl"]
+        check(url.endswith(f"/reports/{ZONE_ID}.csv"), "zone_locations_report")
+
+    def wms_upload() -> None:
+        records = [{"Location": bin_name, "LPN": f"LPN{worker:010d}"}] * (worker % 5 + 1)
+        upload = api.create_wms_location_history_records(ZONE_ID, records)["data"]
+        record = api.get_wms_location_history_upload_record(upload["id"])["data"]
+        check(record["id"] == upload["id"] and record["totalRecords"] == len(records), "wms upload")
+        check(api.create_wms_location_history_upload(ZONE_ID)["status"] == "success", "create_wms_location_history_upload")
+
+    def required_action() -> None:
+        check(api.reset_drone_required_action(token)["status"] == "success", "reset_drone_required_action")
+
+    def scan_orders() -> None:
+        order = api.create_location_scan_order(ZONE_ID, [bin_name], token)["data"]
+        check(order["userTrackingToken"] == token, "create_location_scan_order")
+        check(api.get_location_scan_order(order["id"])["data"]["summary"]["totalBins"] == 1, "get_location_scan_order")
+        orders = api.get_location_scan_orders(ZONE_ID, token)["data"]["orders"]
+        check([listed["id"] for listed in orders] == [order["id"]], "get_location_scan_orders")
+
+    def batched() -> None:
+        created = api.create_location_scan_orders(ZONE_ID, [([bin_name], token), ([bin_name], None)])
+        ids = [result["data"]["id"] for result in created]
+        statuses = api.get_location_scan_order_statuses(ids)
+        check([result["data"]["id"] for result in statuses] == ids, "get_location_scan_order_statuses")
+        timestamps = api.get_bin_timestamps(ZONE_ID, [bin_name])
+        check(timestamps[0]["data"]["records"][0]["record"]["binName"] == bin_name, "get_bin_timestamps")
+
+    return [my_info, zone_page, zone_page_stream, zone_page_body, report, wms_upload, required_action, scan_orders,
+            batched]
+
+
+def run_worker(api: WareAPI, stand_in: LocalStandIn, worker: int, rounds: int) -> Dict[str, int]:
+    outcome = {"operations": 0, "failures": 0}
+    for _ in range(rounds):
+        for operation in operations(api, stand_in, worker):
+            outcome["operations"] += 1
+            try:
+                operation()
+            except Exception as error:
+                outcome["failures"] += 1
+                print(f"worker {worker}: {operation.__name__}: {error!r}", file=sys.stderr)
+    return outcome
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Push many threads through every WareAPI operation on one shared thread-safe client against the local stand-in
+    # (local_stand_in.py). Every result is checked against what its thread asked for. Prints throughput, failures and
+    # the connections opened, and exits non-zero on any failure or when more connections were opened than pooled.
+    # """
+    )
+
+    parser.add_argument("--threads", type=int, help="Worker threads sharing the client", default=32)
+    parser.add_argument("--rounds", type=int, help="Rounds of every operation per thread", default=5)
+    parser.add_argument("--pool-size", type=int, help="Connections pooled per host", default=8)
+    parser.add_argument("--latency", type=float, help="Stand-in seconds per GraphQL request", default=0.002)
+    parser.add_argument("--http2", action="store_true", help="Use the HTTP/2 transport (needs httpx)")
+    args = parser.parse_args()
+
+    with LocalStandIn(zones={ZONE_ID: 1000}, latency=args.latency) as stand_in:
+        api = stand_in.client(thread_safe=True, transport=TransportConfig(pool_size=args.pool_size, http2=args.http2))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            outcomes = list(executor.map(
+                lambda worker: run_worker(api, stand_in, worker, args.rounds), range(args.threads)
+            ))
+        elapsed = time.perf_counter() - started
+
+    adapter = api.session.get_adapter(api.ware_api_url)
+    pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+    connections = sum(pool.num_connections for pool in pools._container.values()) if pools is not None else None
+    report = {
+        "threads": args.threads,
+        "operations": sum(outcome["operations"] for outcome in outcomes),
+        "failures": sum(outcome["failures"] for outcome in outcomes),
+        "seconds": round(elapsed, 2),
+        "operationsPerSecond": round(sum(outcome["operations"] for outcome in outcomes) / elapsed, 1),
+        "connectionsOpened": connections,
+        "requests": stand_in.stats["requests"],
+        "rejected": stand_in.stats["rejected"],
+    }
+    print(json.dumps(report, indent=2))
+
+    if report["failures"] or report["rejected"] or (connections is not None and connections > args.pool_size):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry, connection as urllib3_connection
+
+# Connections kept open per host. The scheduler's default concurrency (request_scheduler.py) matches it
+DEFAULT_POOL_SIZE = 10
+# Distinct hosts whose pools are kept
+DEFAULT_POOL_HOSTS = 4
+# Only failures to connect are retried: a request that reached the server may have run
+DEFAULT_CONNECT_RETRIES = 2
+# Idle seconds before TCP keepalive probes start, so NAT and load balancer idle timeouts do not drop pooled connections
+DEFAULT_KEEPALIVE_SECONDS = 30
+DEFAULT_DNS_TTL = 60.0
+
+# Connection specific headers are not allowed in HTTP/2
+HOP_BY_HOP_HEADERS = ("connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade")
+
+
+def keepalive_socket_options(idle_seconds: int) -> List[Tuple[int, int, int]]:
+    """ urllib3 socket options enabling TCP keepalive after idle_seconds, where the platform allows tuning it """
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", idle_seconds), ("TCP_KEEPINTVL", max(1, idle_seconds // 3)), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class DNSCache:
+    """
+    Caches address lookups for ttl seconds. Installed, it wraps urllib3's create_connection, so every requests
+    based connection in the process resolves through it; TLS still verifies and sends SNI for the host name. When no
+    cached address accepts a connection the entry is dropped, so the next attempt resolves again.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_DNS_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+
+        family = urllib3_connection.allowed_gai_family()
+        addresses = []
+        for *_, address in socket.getaddrinfo(host, port, family, socket.SOCK_STREAM):
+            if address[0] not in addresses:
+                addresses.append(address[0])
+        with self.lock:
+            self.lookups += 1
+            self.entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def forget(self, host: str, port: int) -> None:
+        with self.lock:
+            self.entries.pop((host, port), None)
+
+    def create_connection(self, address: Tuple[str, int], *args, **kwargs) -> socket.socket:
+        host, port = address
+        error = None
+        for ip_address in self.resolve(host.strip("[]"), port):
+            try:
+                return _original_create_connection((ip_address, port), *args, **kwargs)
+            except OSError as connect_error:
+                error = connect_error
+        self.forget(host.strip("[]"), port)
+        raise error or OSError(f"No addresses for {host}")
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {"hosts": len(self.entries), "lookups": self.lookups, "hits": self.hits}
+
+
+_original_create_connection = urllib3_connection.create_connection
+_dns_cache: Optional[DNSCache] = None
+_dns_cache_lock = threading.Lock()
+
+
+def install_dns_cache(ttl: float = DEFAULT_DNS_TTL) -> DNSCache:
+    """ Route urllib3 connections in this process through one shared DNSCache. Later calls return the same cache """
+    global _dns_cache
+    with _dns_cache_lock:
+        if _dns_cache is None:
+            _dns_cache = DNSCache(ttl)
+            urllib3_connection.create_connection = _dns_cache.create_connection
+        return _dns_cache
+
+
+class PooledAdapter(HTTPAdapter):
+    """ HTTPAdapter with TCP keepalive on its connections and warm() to open pooled connections in advance """
+
+    def __init__(self, keepalive_seconds: Optional[int] = DEFAULT_KEEPALIVE_SECONDS, **kwargs):
+        self.socket_options = keepalive_socket_options(keepalive_seconds) if keepalive_seconds else None
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        if self.socket_options is not None:
+            kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+    def warm(self, url: str, connections: int, verify=True, cert=None, proxies=None) -> int:
+        """ Open up to connections connections to the host of url (TCP and TLS) and leave them in its pool """
+        request = requests.Request("POST", url).prepare()
+        pool = self.get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+        # Connections are taken out of the pool so each one is new, then connected in parallel and returned
+        idle = [pool._get_conn() for _ in range(min(connections, self._pool_maxsize))]
+        try:
+            with ThreadPoolExecutor(max_workers=len(idle) or 1) as executor:
+                list(executor.map(lambda conn: getattr(conn, "is_connected", False) or conn.connect(), idle))
+        finally:
+            for conn in idle:
+                pool._put_conn(conn)
+        return len(idle)
+
+
+class _HTTPXBody:
+    # The file-like raw body requests expects, over a streamed httpx response
+    def __init__(self, response):
+        self.response = response
+        self.chunks: Optional[Iterator[bytes]] = None
+
+    def stream(self, amount: Optional[int] = None, decode_content: bool = True) -> Iterator[bytes]:
+        try:
+            yield from self.response.iter_bytes(amount)
+        finally:
+            self.close()
+
+    def read(self, amount: Optional[int] = None) -> bytes:
+        if amount is None:
+            return b"".join(self.stream())
+        if self.chunks is None:
+            self.chunks = self.stream(amount)
+        return next(self.chunks, b"")
+
+    def tell(self) -> int:
+        # Bytes received before content decoding, as urllib3 reports them
+        return self.response.num_bytes_downloaded
+
+    def close(self) -> None:
+        self.response.close()
+
+    release_conn = close
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    Transport adapter sending requests over HTTP/2 with httpx (pip install "httpx[http2]"), so concurrent requests
+    to a host are multiplexed over one connection instead of taking one each. Servers without HTTP/2 are spoken to
+    over HTTP/1.1. Idle connections are kept for keepalive_seconds. TLS verification and proxies are fixed when the
+    adapter is created, not per request.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_retries: int = DEFAULT_CONNECT_RETRIES,
+        keepalive_seconds: Optional[int] = DEFAULT_KEEPALIVE_SECONDS,
+        verify: bool = True,
+    ):
+        super().__init__()
+        import httpx
+        self.httpx = httpx
+        limits = httpx.Limits(
+            max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=keepalive_seconds
+        )
+        self.client = httpx.Client(
+            transport=httpx.HTTPTransport(http2=True, limits=limits, retries=connect_retries, verify=verify),
+            timeout=None,
+        )
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self.httpx.Timeout(None, connect=connect, read=read)
+        return self.httpx.Timeout(timeout)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None) -> requests.Response:
+        headers = [(name, value) for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS]
+        outgoing = self.client.build_request(
+            request.method, request.url, headers=headers, content=request.body, timeout=self._timeout(timeout)
+        )
+        try:
+            incoming = self.client.send(outgoing, stream=True)
+        except self.httpx.TimeoutException as error:
+            raise requests.Timeout(error, request=request)
+        except self.httpx.TransportError as error:
+            raise requests.ConnectionError(error, request=request)
+
+        response = requests.Response()
+        response.status_code = incoming.status_code
+        response.reason = incoming.reason_phrase
+        response.headers = CaseInsensitiveDict(incoming.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _HTTPXBody(incoming)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def warm(self, url: str, connections: int, verify=True, cert=None, proxies=None) -> int:
+        """ HTTP/2 needs a single connection per host; an unsigned HEAD request opens it """
+        try:
+            self.client.head(url)
+        except self.httpx.TransportError:
+            return 0
+        return 1
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class TransportConfig:
+    """
+    Connection settings for WareAPI.session. pool_size connections are kept per host; with pool_block callers wait
+    for a pooled connection rather than opening throwaway ones beyond it. Failed connects are retried, idle
+    connections are kept alive with TCP keepalive, and with dns_ttl host lookups are cached for the whole process
+    (see DNSCache). http2 swaps in HTTP2Adapter. With shared, every session the config is mounted on uses the same
+    adapter and so the same connection pool, e.g. the clients of all tenants in a TenantPool (see tenant_pool.py).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        pool_hosts: int = DEFAULT_POOL_HOSTS,
+        pool_block: bool = True,
+        connect_retries: int = DEFAULT_CONNECT_RETRIES,
+        keepalive_seconds: Optional[int] = DEFAULT_KEEPALIVE_SECONDS,
+        dns_ttl: Optional[float] = None,
+        http2: bool = False,
+        shared: bool = False,
+    ):
+        self.pool_size = pool_size
+        self.pool_hosts = pool_hosts
+        self.pool_block = pool_block
+        self.connect_retries = connect_retries
+        self.keepalive_seconds = keepalive_seconds
+        self.dns_ttl = dns_ttl
+        self.http2 = http2
+        self.shared = shared
+        self.shared_adapter: Optional[BaseAdapter] = None
+        self.lock = threading.Lock()
+
+    def adapter(self) -> BaseAdapter:
+        if self.http2:
+            return HTTP2Adapter(self.pool_size, self.connect_retries, self.keepalive_seconds)
+        return PooledAdapter(
+            keepalive_seconds=self.keepalive_seconds,
+            pool_connections=self.pool_hosts,
+            pool_maxsize=self.pool_size,
+            pool_block=self.pool_block,
+            max_retries=Retry(
+                total=self.connect_retries, connect=self.connect_retries, read=0, status=0, other=0, redirect=0,
+                backoff_factor=0.1, raise_on_status=False,
+            ),
+        )
+
+    def mount(self, session: requests.Session) -> BaseAdapter:
+        """ Install the configured adapter on session for http and https URLs, and return it """
+        if self.dns_ttl:
+            install_dns_cache(self.dns_ttl)
+        if self.shared:
+            with self.lock:
+                if self.shared_adapter is None:
+                    self.shared_adapter = self.adapter()
+                adapter = self.shared_adapter
+        else:
+            adapter = self.adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return adapter
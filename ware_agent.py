@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import hashlib
+import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+from typing import Any, Dict, Optional
+
+# Only the standard library is imported at module level: CLI processes that talk to a running agent never load
+# ware_api, requests or the signing stack.
+
+DEFAULT_IDLE_TIMEOUT = 3600
+DEFAULT_CONNECT_TIMEOUT = 0.5
+DEFAULT_START_TIMEOUT = 10.0
+
+# WareAPI methods the agent will run, with the parameters that must be converted to ware_api enums.
+# Anything else, including private attributes, is rejected.
+ALLOWED_METHODS: Dict[str, Dict[str, str]] = {
+    "my_info": {},
+    "zone_locations_page": {"paginate": "Pagination", "sort": "RecordSort"},
+    "zone_locations_report": {"sort": "RecordSort", "report_format": "ReportFormat"},
+    "get_wms_location_history_upload_record": {},
+    "create_wms_location_history_upload": {},
+    "create_wms_location_history_records": {},
+    "reset_drone_required_action": {},
+    "create_location_scan_order": {},
+    "create_location_scan_orders": {},
+    "get_location_scan_order_statuses": {},
+    "get_bin_timestamps": {},
+    "get_location_scan_order": {},
+    "get_location_scan_orders": {},
+}
+
+
+class AgentError(Exception):
+    pass
+
+
+def default_socket_path() -> str:
+    """ WARE_AGENT_SOCKET, or a per-user socket in the temporary directory """
+    if path := os.environ.get("WARE_AGENT_SOCKET"):
+        return path
+    return os.path.join(tempfile.gettempdir(), f"ware-agent-{os.getuid()}.sock")
+
+
+def key_fingerprint(access_key: Optional[str]) -> Optional[str]:
+    """ A short digest identifying an access key without revealing it """
+    if access_key is None:
+        return None
+    return hashlib.sha256(access_key.encode("utf-8")).hexdigest()[:16]
+
+
+def invoke(api, method: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    """ Run an allowed WareAPI method with JSON parameters. Used by the agent and by the in-process fallback alike """
+    if method not in ALLOWED_METHODS:
+        raise AgentError(f"Method not allowed: {method}")
+
+    import ware_api
+    params = dict(params or {})
+    for name, enum_name in ALLOWED_METHODS[method].items():
+        if params.get(name) is not None:
+            params[name] = getattr(ware_api, enum_name)(params[name])
+    return getattr(api, method)(**params)
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, api, idle_timeout: Optional[float]):
+        self.api = api
+        self.idle_timeout = idle_timeout
+        self.started = time.time()
+        self.last_request = time.time()
+        self.requests_served = 0
+        self.counter_lock = threading.Lock()
+        self.stopping = False
+        super().__init__(socket_path, _AgentHandler)
+
+    def service_actions(self) -> None:
+        # Called between polls of serve_forever: exit once nothing has been asked for idle_timeout seconds
+        if self.idle_timeout and time.time() - self.last_request > self.idle_timeout:
+            self.stop()
+
+    def stop(self) -> None:
+        # shutdown() blocks until serve_forever returns, so it must not run on the serving thread
+        with self.counter_lock:
+            if self.stopping:
+                return
+            self.stopping = True
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def status(self) -> Dict:
+        from ware_api import DEFAULT_HOST
+        return {
+            "pid": os.getpid(),
+            "host": self.api.host,
+            "defaultHost": self.api.host == DEFAULT_HOST,
+            "accessKey": key_fingerprint(self.api.access_key),
+            "uptime": time.time() - self.started,
+            "requests": self.requests_served,
+        }
+
+    def handle_request_message(self, message: Dict) -> Dict:
+        with self.counter_lock:
+            self.last_request = time.time()
+            self.requests_served += 1
+
+        method = message.get("method")
+        if method == "ping":
+            return self.status()
+        if method == "metrics":
+            return self.api.metrics.snapshot()
+        if method == "shutdown":
+            self.stop()
+            return {"pid": os.getpid()}
+        return invoke(self.api, method, message.get("params"))
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    # One JSON object per line in both directions: {"id", "method", "params"} -> {"id", "result"} or {"id", "error"}
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            message: Dict = {}
+            try:
+                message = json.loads(line)
+                reply = {"id": message.get("id"), "result": self.server.handle_request_message(message)}
+            except Exception as e:
+                reply = {"id": message.get("id"), "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def serve(
+    host: Optional[str] = None,
+    socket_path: Optional[str] = None,
+    idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+    warm: bool = True,
+) -> None:
+    """
+    Run the agent in the current process until it is shut down or idle for idle_timeout seconds. The socket is
+    only accessible to the current user.
+    """
+    from ware_api import WareAPI, DEFAULT_HOST
+
+    socket_path = socket_path or default_socket_path()
+    # Client connections are served on their own threads, so each one gets its own Session
+    api = WareAPI(host=host or DEFAULT_HOST, thread_safe=True)
+    if warm:
+        # Open the pooled TLS connection and verify the credentials before the first client arrives
+        result = api.my_info()
+        if result["status"] != "success":
+            raise AgentError(f"Warm-up myInfo failed: {result.get('message')}")
+
+    if os.path.exists(socket_path):
+        if AgentClient(socket_path).available(api.host):
+            raise AgentError(f"An agent is already listening on {socket_path}")
+        os.unlink(socket_path)
+
+    previous_umask = os.umask(0o177)
+    try:
+        server = _AgentServer(socket_path, api, idle_timeout)
+    finally:
+        os.umask(previous_umask)
+    try:
+        server.serve_forever(poll_interval=1.0)
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+class AgentClient:
+    """ Client for a running agent. One connection is kept open and reused for every call """
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self.connection: Optional[socket.socket] = None
+        self.reader = None
+        self.next_id = 0
+
+    def _connect(self) -> None:
+        if self.connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(DEFAULT_CONNECT_TIMEOUT)
+            connection.connect(self.socket_path)
+            connection.settimeout(self.timeout)
+            self.connection = connection
+            self.reader = connection.makefile("rb")
+
+    def call(self, method: str, **params) -> Any:
+        """ Run a method on the agent. Raises AgentError when the agent reports an error """
+        self._connect()
+        self.next_id += 1
+        message = {"id": self.next_id, "method": method, "params": params}
+        self.connection.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        line = self.reader.readline()
+        if not line:
+            self.close()
+            raise ConnectionError("Agent closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise AgentError(reply["error"])
+        return reply["result"]
+
+    def available(self, host: Optional[str] = None, access_key: Optional[str] = None) -> bool:
+        """
+        Whether an agent is listening and serving host, or the default host when host is None. When access_key is
+        given, the agent must also be signing with that key
+        """
+        try:
+            status = self.call("ping")
+        except (OSError, ValueError, AgentError):
+            self.close()
+            return False
+        if access_key is not None and status.get("accessKey") != key_fingerprint(access_key):
+            return False
+        return status["host"] == host if host else status["defaultHost"]
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.reader.close()
+            self.connection.close()
+            self.connection = self.reader = None
+
+
+class LocalClient:
+    """ Same interface as AgentClient, running the methods on an in-process WareAPI """
+
+    def __init__(self, host: Optional[str] = None):
+        from ware_api import WareAPI, DEFAULT_HOST
+        self.api = WareAPI(host=host or DEFAULT_HOST)
+
+    def call(self, method: str, **params) -> Any:
+        if method == "metrics":
+            return self.api.metrics.snapshot()
+        return invoke(self.api, method, params)
+
+    def close(self) -> None:
+        self.api.session.close()
+
+
+def connect(host: Optional[str] = None, socket_path: Optional[str] = None, use_agent: bool = True):
+    """
+    An AgentClient when an agent for host is running with the caller's AWS_ACCESS_KEY_ID, otherwise a LocalClient
+    """
+    if use_agent:
+        client = AgentClient(socket_path)
+        if client.available(host, os.environ.get("AWS_ACCESS_KEY_ID")):
+            return client
+        client.close()
+    return LocalClient(host)
+
+
+def start_background(
+    host: Optional[str] = None,
+    socket_path: Optional[str] = None,
+    idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+    timeout: float = DEFAULT_START_TIMEOUT,
+) -> Dict:
+    """ Start a detached agent process and wait until it answers. Returns its status """
+    import subprocess
+
+    socket_path = socket_path or default_socket_path()
+    command = [sys.executable, os.path.abspath(__file__), "--socket", socket_path]
+    if host:
+        command += ["--endpoint", host]
+    if idle_timeout is not None:
+        command += ["--idle-timeout", str(idle_timeout)]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+    )
+
+    client = AgentClient(socket_path)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if client.available(host):
+            status = client.call("ping")
+            client.close()
+            return status
+        if process.poll() is not None:
+            raise AgentError(f"Agent exited: {process.stderr.read().decode('utf-8', 'replace').strip()}")
+        time.sleep(0.1)
+    raise AgentError(f"Agent did not start within {timeout} seconds")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Run a local agent that keeps a warmed WareAPI (pooled connections, signing setup) and serves ware_cli.py
+    # requests over a Unix domain socket.
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+
+    parser.add_argument("--endpoint", type=str, help="Optional endpoint value to override the default", default=None)
+    parser.add_argument("--socket", type=str, help="Unix socket path", default=None)
+    parser.add_argument(
+        "--idle-timeout", type=float, help="Exit after this many idle seconds, 0 to run forever",
+        default=DEFAULT_IDLE_TIMEOUT,
+    )
+    parser.add_argument("--no-warm", action="store_true", help="Skip the myInfo warm-up request")
+    args = parser.parse_args()
+
+    serve(host=args.endpoint, socket_path=args.socket, idle_timeout=args.idle_timeout or None, warm=not args.no_warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,30 @@
 import os
+import re
+import gzip
 import json
+import time
+import hashlib
+import weakref
+import threading
 import requests
 from enum import Enum
+from contextlib import ExitStack, contextmanager, nullcontext
+from functools import lru_cache
 from typing_extensions import NotRequired
-from typing import Dict, Optional, Callable, List, TypedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Callable, List, Tuple, TypedDict
 
-import websocket
-from requests_aws4auth import AWS4Auth
 from requests import Response
 
-from ware_subscription_client import subscribe, unsubscribe
+from client_metrics import ClientMetrics
+from sigv4 import PAYLOAD_HASH_HEADER, SigV4Signer
+from streaming_decode import DEFAULT_CHUNK_BYTES, PageStream
+from transport import TransportConfig
+if TYPE_CHECKING:
+    # Realtime dependencies (boto3, websocket-client) are only imported once a subscription is used
+    import websocket
+    from hedging import HedgingPolicy
+    from page_size_controller import AdaptivePageSize
+    from request_scheduler import RateLimiter, RequestScheduler
 from queries import (
     my_info as my_info_query,
     get_zone_locations as get_zone_locations_query,
@@ -17,12 +32,15 @@ from queries import (
     get_location_scan_order as get_location_scan_order_query,
     get_location_scan_orders as get_location_scan_orders_query,
     get_wms_location_history_upload_record as get_wms_location_history_upload_record_query,
+    location_scan_order_status_fields,
+    zone_location_timestamp_fields,
 )
 from mutations import (
     create_wms_location_history_records as create_wms_location_history_records_mutation,
     create_wms_location_history_upload as create_wms_location_history_upload_mutation,
     reset_drone_required_action as reset_drone_required_action_mutation,
     create_location_scan_order as create_location_scan_order_mutation,
+    location_scan_order_creation_fields,
 )
 from subscriptions import (
     wms_location_history_upload_status_change as wms_location_history_upload_status_change_subscription,
@@ -33,6 +51,22 @@ AWS_SERVICE = "appsync"
 JSON_CONTENT_TYPE = "application/json"
 DEFAULT_REGION = "us-east-1"
 DEFAULT_HOST = "iqiurguobbaotjtnrffqnx7zmu.appsync-api.us-east-1.amazonaws.com"
+# Fast levels already shrink repetitive JSON by an order of magnitude
+REQUEST_GZIP_LEVEL = 5
+# Pages of a partial name search followed by get_bin_timestamps before a bin is given up on
+DEFAULT_BIN_SEARCH_PAGES = 5
+
+# Operations made on behalf of an operator run in the interactive scheduler lane unless the thread chose a lane
+OPERATION_LANES = {
+    "myInfo": "interactive",
+    "getLocationScanOrder": "interactive",
+    "resetDroneRequiredAction": "interactive",
+    "createLocationScanOrder": "interactive",
+}
+
+# alias: field(arguments) at the top level of an operation's selection set
+_FIELD = re.compile(r"\s*(?:(\w+)\s*:\s*)?(\w+)\s*(?:\(([^)]*)\))?\s*")
+_BINDING = re.compile(r"(\w+)\s*:\s*\$(\w+)")
 
 
 class Pagination(str, Enum):  # same as graphql enum
@@ -61,6 +95,16 @@ class ReportFormat(str, Enum):
     XLSX = "XLSX"
 
 
+class RecordExceptionType(str, Enum):
+    MISSING_LPN = "MISSING_LPN"
+    UNREADABLE_LPN = "UNREADABLE_LPN"
+    DETECTED_UNEXPECTED_PALLET_LPN = "DETECTED_UNEXPECTED_PALLET_LPN"
+    LPN_MULTI_ASSIGNMENT = "LPN_MULTI_ASSIGNMENT"
+    DID_NOT_DETECT_PALLET_LPN = "DID_NOT_DETECT_PALLET_LPN"
+    SKU_UNEXPECTED = "SKU_UNEXPECTED"
+    SKU_NOT_DETECTED = "SKU_NOT_DETECTED"
+
+
 class LocationFilterV2(TypedDict):
     searchString: NotRequired[str]
     searchType: NotRequired[RecordSearchType]
@@ -71,35 +115,335 @@ class LocationFilterV2(TypedDict):
     statusFilter: List[StatusFilter]
 
 
+@lru_cache(maxsize=256)
+def _document_prefix(query: str) -> bytes:
+    # Operation documents are module constants, so their JSON encoding is computed once per document
+    return b'{"query":' + json.dumps(query).encode("utf-8") + b',"variables":'
+
+
+def encode_operation(query: str, variables: Optional[Dict] = None) -> bytes:
+    """ The JSON request body of a GraphQL operation, encoded once and sent as is """
+    return _document_prefix(query) + json.dumps(variables or {}, separators=(",", ":")).encode("utf-8") + b"}"
+
+
+def root_fields(document: str) -> List[Tuple[str, str, Dict[str, str]]]:
+    """ (alias, field, {argument: variable}) for each top level field of a GraphQL operation """
+    depth = 0
+    start = None
+    for position, character in enumerate(document):
+        if character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif character == "{" and depth == 0:
+            start = position + 1
+            break
+    if start is None:
+        return []
+
+    fields = []
+    position = start
+    while (match := _FIELD.match(document, position)) and match.group(2):
+        alias, field, arguments = match.groups()
+        fields.append((alias or field, field, dict(_BINDING.findall(arguments or ""))))
+        position = match.end()
+        if document.startswith("{", position):
+            position = _skip_selection(document, position)
+    return fields
+
+
+def _skip_selection(document: str, position: int) -> int:
+    depth = 0
+    for index in range(position, len(document)):
+        if document[index] == "{":
+            depth += 1
+        elif document[index] == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(document)
+
+
+def transient_error(result: Dict) -> bool:
+    """ Whether a failed result is worth retrying: throttling and server errors. Anything else rejected is final """
+    message = result.get("message") or ""
+    return message.startswith("HTTP error: 5") or message.startswith("HTTP error: 429")
+
+
+class WareAPIError(Exception):
+    """ Raised by the iterating helpers, which cannot hand back an error result. result is the failed query result """
+
+    def __init__(self, result: Dict):
+        super().__init__(result.get("message"))
+        self.result = result
+
+    def __reduce__(self):
+        # Keeps the error intact when it is raised in a worker process
+        return WareAPIError, (self.result,)
+
+
+def batched_operation(
+    operation: str,
+    name: str,
+    field: str,
+    selection: str,
+    shared_variables: Dict[str, Tuple[str, Any]],
+    item_variables: Dict[str, str],
+    items: List[Dict[str, Any]],
+) -> Tuple[str, Dict]:
+    """
+    Build a single GraphQL document that runs `field` once per item, each under its own alias (item0, item1, ...).
+    shared_variables maps argument names to a (GraphQL type, value) pair used by every item, item_variables maps
+    the per-item argument names to their GraphQL type. Returns the document and its variables.
+    """
+    declarations = [f"${arg}: {graphql_type}" for arg, (graphql_type, _) in shared_variables.items()]
+    variables = {arg: value for arg, (_, value) in shared_variables.items()}
+    fields = []
+
+    for index, item in enumerate(items):
+        arguments = [f"{arg}: ${arg}" for arg in shared_variables]
+        for arg, graphql_type in item_variables.items():
+            declarations.append(f"${arg}{index}: {graphql_type}")
+            arguments.append(f"{arg}: ${arg}{index}")
+            variables[f"{arg}{index}"] = item.get(arg)
+        fields.append(f"item{index}: {field}({', '.join(arguments)}) {{ {selection} }}")
+
+    document = f"{operation} {name}({', '.join(declarations)}) {{\n  " + "\n  ".join(fields) + "\n}"
+    return document, variables
+
+
+def batched_results(result: Dict, count: int) -> List[Dict]:
+    """ Split the result of a batched_operation query back into one result per item, in item order """
+    if result["status"] != "success":
+        return [result] * count
+
+    messages = {}
+    for error in result.get("errors", []):
+        path = error.get("path") or []
+        if path:
+            messages[path[0]] = error.get("message")
+
+    results = []
+    for index in range(count):
+        alias = f"item{index}"
+        if (data := result["data"].get(alias)) is not None:
+            results.append({"status": "success", "data": data})
+        else:
+            results.append({"status": "error", "message": messages.get(alias, "No data returned"), "response": result})
+    return results
+
+
 class WareAPI:
-    def __init__(self, host: str = DEFAULT_HOST, region: str = DEFAULT_REGION):
+    """
+    Client for the Ware GraphQL API. One instance can be shared by worker threads: the metrics, scheduler, signing
+    key cache and connection pools are thread-safe, and with thread_safe=True each thread also sends through its own
+    requests.Session (see session). thread_safety_stress.py exercises every operation this way.
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        region: str = DEFAULT_REGION,
+        scheduler: Optional["RequestScheduler"] = None,
+        compress_requests_above: Optional[int] = None,
+        transport: Optional[TransportConfig] = None,
+        thread_safe: bool = False,
+        hedging: Optional["HedgingPolicy"] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        session_token: Optional[str] = None,
+        rate_limiter: Optional["RateLimiter"] = None,
+    ):
         self.host = host
         self.region = region
         self.amz_target = ""
         self.ware_api_url = f"https://{self.host}/graphql"
 
-        # Retrieve access keys
-        self.access_key = os.environ.get("AWS_ACCESS_KEY_ID")
-        self.secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+        # Retrieve access keys, from the environment unless given
+        if access_key is None and secret_key is None:
+            access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+            secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+            session_token = session_token or os.environ.get("AWS_SESSION_TOKEN")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
         if self.access_key is None or self.secret_key is None:
             raise Exception("Must define access key and secret key")
 
-        self.session = requests.Session()
-        self.session.auth = AWS4Auth(self.access_key, self.secret_key, region, AWS_SERVICE)
+        self.shared_session = requests.Session()
+        # Pool size, connect retries, keepalive, DNS caching and HTTP/2 (see transport.py)
+        self.transport = transport or TransportConfig()
+        self.transport.mount(self.shared_session)
+        self.shared_session.auth = SigV4Signer(self.access_key, self.secret_key, region, AWS_SERVICE, session_token)
+        self.thread_safe = thread_safe
+        self.environment_settings: Dict[str, Dict] = {}
+        # Request bodies larger than this many bytes are sent gzip encoded. Responses are always negotiated
+        self.compress_requests_above = compress_requests_above
+        self.metrics = ClientMetrics()
+        # Optional admission control in front of the connection pool (see request_scheduler.py)
+        self.scheduler = scheduler
+        if scheduler is not None and scheduler.metrics is None:
+            scheduler.metrics = self.metrics
+        self.local = threading.local()
+        # Optional duplicate requests for slow read-only operations (see hedging.py). Attempts are sent from other
+        # threads, which must not share a requests.Session
+        if hedging is not None and not thread_safe:
+            raise ValueError("hedging requires thread_safe=True")
+        self.hedging = hedging
+        # Optional cap on the request rate of this client, applied before a scheduler slot is taken
+        self.rate_limiter = rate_limiter
+
+
+    def set_credentials(self, access_key: str, secret_key: str, session_token: Optional[str] = None) -> None:
+        """ Sign later requests with new credentials, e.g. refreshed temporary ones. Safe while other threads send """
+        self.shared_session.auth.rotate(access_key, secret_key, session_token)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        The Session requests are sent through. With thread_safe=True every thread gets its own Session, so no
+        per-session state (cookies, request preparation) is shared between threads, while the adapters with their
+        bounded connection pools, the signer with its key cache, headers and proxy settings are those of
+        shared_session. Adapters mounted on any of them apply to all threads.
+        """
+        if not self.thread_safe:
+            return self.shared_session
+        if (session := getattr(self.local, "session", None)) is None:
+            session = requests.Session()
+            session.adapters = self.shared_session.adapters
+            session.auth = self.shared_session.auth
+            session.headers = self.shared_session.headers
+            session.proxies = self.shared_session.proxies
+            session.verify = self.shared_session.verify
+            session.cert = self.shared_session.cert
+            self.local.session = session
+        return session
+
+
+    @contextmanager
+    def lane(self, name: str) -> Iterator[None]:
+        """ Run the requests made by the calling thread inside the block in a scheduler lane, e.g. "bulk" """
+        previous = getattr(self.local, "lane", None)
+        self.local.lane = name
+        try:
+            yield
+        finally:
+            self.local.lane = previous
+
+
+    def _slot(self, data_key: Optional[str], lane: Optional[str] = None):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(lane or getattr(self.local, "lane", None) or OPERATION_LANES.get(data_key))
+
+
+    def _throttle(self) -> None:
+        # Waits out the client's rate limit. Outside the scheduler slot, so a throttled client holds no slot
+        if self.rate_limiter is not None:
+            self.metrics.record_queue_wait("rateLimit", self.rate_limiter.acquire())
+
+
+    def _send(self, query: str, variables: Optional[Dict], stream: bool = False) -> Tuple[Response, Dict]:
+        # The body is encoded and hashed once here; the signer reuses the hash and the same bytes go on the wire.
+        # Returns the response and the request sizes for the metrics
+        body = encode_operation(query, variables)
+        sizes = {"request_bytes": len(body), "compression_seconds": 0.0}
+        headers = {"Content-Type": JSON_CONTENT_TYPE}
+        if self.compress_requests_above is not None and len(body) > self.compress_requests_above:
+            started = time.perf_counter()
+            body = gzip.compress(body, compresslevel=REQUEST_GZIP_LEVEL, mtime=0)
+            sizes["compression_seconds"] = time.perf_counter() - started
+            # Content-Encoding is signed and the payload hash covers the compressed bytes that are sent
+            headers["Content-Encoding"] = "gzip"
+        sizes["wire_request_bytes"] = len(body)
+        headers[PAYLOAD_HASH_HEADER] = hashlib.sha256(body).hexdigest()
+
+        request = self.session.prepare_request(requests.Request(
+            method="POST",
+            url=self.ware_api_url,
+            data=body,
+            headers=headers,
+        ))
+
+        return self.session.send(request, stream=stream, **self._environment_settings()), sizes
+
+
+    def _environment_settings(self) -> Dict:
+        # Session.request resolves proxies and CA bundles from os.environ on every call, which costs more CPU than
+        # encoding and signing. They are resolved once per URL instead
+        if (settings := self.environment_settings.get(self.ware_api_url)) is None:
+            settings = self.session.merge_environment_settings(self.ware_api_url, {}, None, None, None)
+            settings.pop("stream", None)
+            self.environment_settings[self.ware_api_url] = settings
+        return settings
+
+
+    def warm(self, connections: Optional[int] = None) -> int:
+        """
+        Open connections to the API in advance (DNS, TCP and TLS), so the first requests and bursts run on
+        established ones. Opens the pool size by default. Returns the number of connections opened.
+        """
+        settings = self._environment_settings()
+        adapter = self.session.get_adapter(self.ware_api_url)
+        if not hasattr(adapter, "warm"):
+            return 0
+        return adapter.warm(
+            self.ware_api_url,
+            connections or self.transport.pool_size,
+            verify=settings["verify"],
+            cert=settings["cert"],
+            proxies=settings["proxies"],
+        )
+
 
+    @staticmethod
+    def _wire_response_bytes(response: Response, decoded_bytes: int) -> int:
+        # Bytes read from the connection before content decoding, when the transport reports them
+        raw_bytes = getattr(response.raw, "tell", lambda: 0)()
+        return raw_bytes if isinstance(raw_bytes, int) and raw_bytes > 0 else decoded_bytes
 
-    def query(self, query: str, data_key: str, variables: Optional[Dict] = None) -> Response:
-        """ Generic GraphQL query method. Does an HTTP POST with the query and variables as parameters """
-        variables = variables or {}
 
-        response: Response = self.session.request(
-            url=self.ware_api_url,
-            method="POST",
-            json={
-                "query": query,
-                "variables": variables
-            },
+    def _post(self, query: str, data_key: Optional[str], variables: Optional[Dict] = None) -> Response:
+        # Send a GraphQL document and record the exchange in the metrics. Read-only operations may be hedged
+        if self.hedging is not None and self.hedging.applies(data_key):
+            return self.hedging.post(self, query, data_key, variables)
+        return self._attempt(query, data_key, variables)
+
+
+    def _attempt(
+        self,
+        query: str,
+        data_key: Optional[str],
+        variables: Optional[Dict] = None,
+        lane: Optional[str] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Optional[Response]:
+        # One request. Returns None without sending when cancelled is set by the time a scheduler slot is granted
+        self._throttle()
+        with self._slot(data_key, lane):
+            if cancelled is not None and cancelled.is_set():
+                return None
+            started = time.perf_counter()
+            response, sizes = self._send(query, variables)
+            elapsed = time.perf_counter() - started
+        self.metrics.record(
+            data_key or "batch",
+            elapsed=elapsed,
+            response_bytes=len(response.content),
+            wire_response_bytes=self._wire_response_bytes(response, len(response.content)),
+            error=not response.ok,
+            **sizes,
         )
+        return response
+
+
+    def query(self, query: str, data_key: Optional[str], variables: Optional[Dict] = None) -> Response:
+        """ Generic GraphQL query method. Does an HTTP POST with the query and variables as parameters """
+        response = self._post(query, data_key, variables)
 
         try:
             response.raise_for_status()
@@ -113,6 +457,14 @@ class WareAPI:
         response = response.json()
 
         if (data := response.get("data")) is not None:
+            if data_key is None:
+                # Multi-field documents (see batched_operation) return every field, along with any partial errors
+                return {
+                    "status": "success",
+                    "data": data,
+                    "errors": response.get("errors") or [],
+                }
+
             return {
                 "status": "success",
                 "data": data[data_key],
@@ -125,18 +477,35 @@ class WareAPI:
         }
 
 
+    def raw_query(self, query: str, data_key: Optional[str], variables: Optional[Dict] = None) -> bytes:
+        """
+        Same request as query, returning the undecoded response body so decoding can happen elsewhere, e.g. in
+        another process (see page_processing.py). Raises WareAPIError on HTTP errors.
+        """
+        response = self._post(query, data_key, variables)
+        if not response.ok:
+            raise WareAPIError({
+                "status": "error",
+                "message": f"HTTP error: {response.status_code}",
+                "response": response.json(),
+            })
+        return response.content
+
+
     def my_info(self) -> Dict:
         return self.query(my_info_query, "myInfo")
 
 
-    def zone_locations_page(
-            self,
+    @staticmethod
+    def _zone_locations_variables(
             zone_id: str,
-            limit: int = 10,
-            cursor: Optional[str] = None,
-            paginate: Pagination = Pagination.NEXT,
-            sort: RecordSort = RecordSort.LATEST,
-            record_filter: Optional[LocationFilterV2] = None
+            limit: int,
+            cursor: Optional[str],
+            paginate: Pagination,
+            sort: RecordSort,
+            record_filter: Optional[LocationFilterV2],
+            include_images: bool,
+            include_inventory: bool,
     ) -> Dict:
         variables = {
             "zoneId": zone_id,
@@ -144,14 +513,186 @@ class WareAPI:
             "paginate": paginate.value,
             "limit": limit,
             "cursor": cursor,
+            "includeImages": include_images,
+            "includeInventory": include_inventory,
         }
 
         if record_filter:
             variables["filter"] = record_filter
 
+        return variables
+
+
+    def zone_locations_page(
+            self,
+            zone_id: str,
+            limit: int = 10,
+            cursor: Optional[str] = None,
+            paginate: Pagination = Pagination.NEXT,
+            sort: RecordSort = RecordSort.LATEST,
+            record_filter: Optional[LocationFilterV2] = None,
+            include_images: bool = False,
+            include_inventory: bool = True,
+    ) -> Dict:
+        variables = self._zone_locations_variables(
+            zone_id, limit, cursor, paginate, sort, record_filter, include_images, include_inventory
+        )
         return self.query(get_zone_locations_query, "zoneLocationsPageV2", variables=variables)
 
 
+    def zone_locations_page_body(
+            self,
+            zone_id: str,
+            limit: int = 10,
+            cursor: Optional[str] = None,
+            paginate: Pagination = Pagination.NEXT,
+            sort: RecordSort = RecordSort.LATEST,
+            record_filter: Optional[LocationFilterV2] = None,
+            include_images: bool = False,
+            include_inventory: bool = True,
+    ) -> bytes:
+        """ Same query as zone_locations_page, returning the raw response body """
+        variables = self._zone_locations_variables(
+            zone_id, limit, cursor, paginate, sort, record_filter, include_images, include_inventory
+        )
+        return self.raw_query(get_zone_locations_query, "zoneLocationsPageV2", variables=variables)
+
+
+    def zone_locations_page_stream(
+            self,
+            zone_id: str,
+            limit: int = 10,
+            cursor: Optional[str] = None,
+            paginate: Pagination = Pagination.NEXT,
+            sort: RecordSort = RecordSort.LATEST,
+            record_filter: Optional[LocationFilterV2] = None,
+            include_images: bool = False,
+            include_inventory: bool = True,
+    ) -> PageStream:
+        """
+        Same query as zone_locations_page, decoded while the body arrives: iterating the returned PageStream yields
+        each LocationPageItemV2 as soon as it is complete, and pageInfo is in its fields once read. The connection is
+        released when iteration ends, the stream is closed (use it as a context manager) or it is garbage collected.
+        Raises WareAPIError on HTTP errors.
+        """
+        variables = self._zone_locations_variables(
+            zone_id, limit, cursor, paginate, sort, record_filter, include_images, include_inventory
+        )
+        self._throttle()
+        resources = ExitStack()
+        resources.enter_context(self._slot("zoneLocationsPageV2"))
+        started = time.perf_counter()
+        try:
+            response, sizes = self._send(get_zone_locations_query, variables, stream=True)
+        except BaseException:
+            resources.close()
+            raise
+        resources.callback(response.close)
+
+        if not response.ok:
+            resources.close()
+            self.metrics.record(
+                "zoneLocationsPageV2",
+                elapsed=time.perf_counter() - started,
+                response_bytes=len(response.content),
+                wire_response_bytes=self._wire_response_bytes(response, len(response.content)),
+                error=True,
+                **sizes,
+            )
+            raise WareAPIError({
+                "status": "error",
+                "message": f"HTTP error: {response.status_code}",
+                "response": response.json(),
+            })
+
+        def complete(stream: PageStream) -> None:
+            resources.close()
+            self.metrics.record(
+                "zoneLocationsPageV2",
+                elapsed=time.perf_counter() - started,
+                response_bytes=stream.bytes_read,
+                wire_response_bytes=self._wire_response_bytes(response, stream.bytes_read),
+                error=not stream.has_data,
+                **sizes,
+            )
+
+        stream = PageStream(response.iter_content(DEFAULT_CHUNK_BYTES), "zoneLocationsPageV2", on_complete=complete)
+        # A stream dropped without being iterated to the end or closed still gives back its connection and slot
+        weakref.finalize(stream, resources.close)
+        return stream
+
+
+    def _stream_zone_locations_page(self, zone_id: str, **kwargs) -> Iterator[Dict]:
+        # Yields the records of one page while it is decoded, then returns the page result without them
+        with self.zone_locations_page_stream(zone_id, **kwargs) as page:
+            yield from page
+        return page.result()
+
+
+    def iter_zone_locations(
+            self,
+            zone_id: str,
+            limit: int = 100,
+            sort: RecordSort = RecordSort.LATEST,
+            record_filter: Optional[LocationFilterV2] = None,
+            include_images: bool = False,
+            include_inventory: bool = True,
+            page_size: Optional["AdaptivePageSize"] = None,
+            stream: bool = False,
+    ) -> Iterator[Dict]:
+        """
+        Page through every record of a zone, yielding each LocationPageItemV2. Raises WareAPIError on failure.
+        With an AdaptivePageSize (see page_size_controller.py) the limit is tuned between pages instead of fixed,
+        and failed pages are retried with a smaller limit. With stream=True (and no page_size) each page is decoded
+        while it arrives (see zone_locations_page_stream), so records are yielded before their page is complete.
+        """
+        cursor = None
+        while True:
+            if stream and page_size is None:
+                result = yield from self._stream_zone_locations_page(
+                    zone_id,
+                    limit=limit,
+                    cursor=cursor,
+                    sort=sort,
+                    record_filter=record_filter,
+                    include_images=include_images,
+                    include_inventory=include_inventory,
+                )
+            elif page_size is not None:
+                result = page_size.fetch(
+                    self,
+                    lambda page_limit: self.zone_locations_page(
+                        zone_id,
+                        limit=page_limit,
+                        cursor=cursor,
+                        sort=sort,
+                        record_filter=record_filter,
+                        include_images=include_images,
+                        include_inventory=include_inventory,
+                    ),
+                )
+            else:
+                result = self.zone_locations_page(
+                    zone_id,
+                    limit=limit,
+                    cursor=cursor,
+                    sort=sort,
+                    record_filter=record_filter,
+                    include_images=include_images,
+                    include_inventory=include_inventory,
+                )
+            if result["status"] != "success":
+                raise WareAPIError(result)
+
+            # Streamed pages have already yielded their records
+            yield from result["data"].get("records") or []
+
+            page_info = result["data"]["pageInfo"]
+            if not page_info["hasNextPage"]:
+                return
+            cursor = page_info["endCursor"]
+
+
     def zone_locations_report(
         self,
         zone_id: str,
@@ -169,7 +710,7 @@ class WareAPI:
         if record_filter:
             variables["filter"] = record_filter
 
-        return self.query(zone_locations_report_query, "zoneLocationsReport", variables=variables)
+        return self.query(get_zone_locations_report_query, "zoneLocationsReport", variables=variables)
 
 
     def create_wms_location_history_upload(self, zone_id: str, file_format: Optional[str]="csv") -> Dict:
@@ -213,20 +754,28 @@ class WareAPI:
 
 
     def subscribe_wms_location_history_upload_status_change(self, record_id: str, data_handler: Callable) -> None:
+        from ware_subscription_client import subscribe
+        # Read together, so a concurrent set_credentials cannot mix two credential sets
+        access_key, secret_key, session_token = self.shared_session.auth.credentials
         subscribe(
-            aws_access_key=self.access_key,
-            aws_secret_key=self.secret_key,
+            aws_access_key=access_key,
+            aws_secret_key=secret_key,
+            aws_session_token=session_token,
             api_url=self.ware_api_url,
             subscription=wms_location_history_upload_status_change_subscription,
-            subscription_variables={ "id", record_id },
+            subscription_variables={ "id": record_id },
             data_handler=data_handler,
         )
 
 
     def subscribe_location_scan_orders(self, zone_id: str, data_handler: Callable):
+        from ware_subscription_client import subscribe
+        # Read together, so a concurrent set_credentials cannot mix two credential sets
+        access_key, secret_key, session_token = self.shared_session.auth.credentials
         subscribe(
-            aws_access_key=self.access_key,
-            aws_secret_key=self.secret_key,
+            aws_access_key=access_key,
+            aws_secret_key=secret_key,
+            aws_session_token=session_token,
             api_url=self.ware_api_url,
             subscription=location_scan_orders_subscription,
             subscription_variables={ "zoneId": zone_id },
@@ -235,7 +784,8 @@ class WareAPI:
 
 
     @staticmethod
-    def unsubscribe(subscription_id: str, web_socket: websocket.WebSocket) -> None:
+    def unsubscribe(subscription_id: str, web_socket: "websocket.WebSocket") -> None:
+        from ware_subscription_client import unsubscribe
         unsubscribe(subscription_id, web_socket)
 
 
@@ -258,8 +808,101 @@ class WareAPI:
         )
 
 
-    def get_location_scan_order(self, location_scan_order_id: str) -> Dict:
-        variables = { "id": location_scan_order_id }
+    def create_location_scan_orders(
+        self, zone_id: str, orders: List[Tuple[List[str], Optional[str]]]
+    ) -> List[Dict]:
+        """ Create several location scan orders in a single request. Each order is a (bins, user_tracking_token) pair """
+        if not orders:
+            return []
+
+        document, variables = batched_operation(
+            "mutation",
+            "CreateLocationScanOrders",
+            "createLocationScanOrder",
+            location_scan_order_creation_fields,
+            shared_variables={"zoneId": ("String!", zone_id)},
+            item_variables={"bins": "[String!]!", "userTrackingToken": "String"},
+            items=[{"bins": bins, "userTrackingToken": token} for bins, token in orders],
+        )
+
+        return batched_results(self.query(document, None, variables=variables), len(orders))
+
+
+    def get_location_scan_order_statuses(self, location_scan_order_ids: List[str]) -> List[Dict]:
+        """ Fetch the status and summary of several location scan orders in a single request """
+        if not location_scan_order_ids:
+            return []
+
+        document, variables = batched_operation(
+            "query",
+            "GetLocationScanOrderStatuses",
+            "getLocationScanOrder",
+            location_scan_order_status_fields,
+            shared_variables={},
+            item_variables={"id": "String!"},
+            items=[{"id": order_id} for order_id in location_scan_order_ids],
+        )
+
+        return batched_results(self.query(document, None, variables=variables), len(location_scan_order_ids))
+
+
+    def get_bin_timestamps(
+            self, zone_id: str, bins: List[str], limit: int = 5, max_pages: int = DEFAULT_BIN_SEARCH_PAGES
+    ) -> List[Dict]:
+        """
+        Look up the latest records of several bins in a single request, one location search per bin. Searches match
+        partial names, so each result only keeps the records whose binName is exactly the bin, and the searches that
+        have not found their bin yet are followed to their next page, together in one request, up to max_pages times.
+        """
+        results: List[Optional[Dict]] = [None] * len(bins)
+        cursors: Dict[int, Optional[str]] = {index: None for index in range(len(bins))}
+        for _ in range(max_pages):
+            if not cursors:
+                break
+            indexes = list(cursors)
+            document, variables = batched_operation(
+                "query",
+                "GetBinTimestamps",
+                "zoneLocationsPageV2",
+                zone_location_timestamp_fields,
+                shared_variables={"zoneId": ("String!", zone_id), "limit": ("Int", limit)},
+                item_variables={"filter": "LocationFilterV2", "cursor": "String"},
+                items=[
+                    {
+                        "filter": {
+                            "searchString": bins[index],
+                            "searchType": RecordSearchType.LOCATION.value,
+                            "statusFilter": [],
+                        },
+                        "cursor": cursors[index],
+                    }
+                    for index in indexes
+                ],
+            )
+
+            page_results = batched_results(self.query(document, None, variables=variables), len(indexes))
+            cursors = {}
+            for index, result in zip(indexes, page_results):
+                if result["status"] != "success":
+                    results[index] = result
+                    continue
+                page = result["data"]
+                records = [
+                    item for item in page.get("records") or []
+                    if (item.get("record") or {}).get("binName") == bins[index]
+                ]
+                if results[index] is None:
+                    results[index] = {"status": "success", "data": dict(page, records=records)}
+                else:
+                    results[index]["data"]["records"].extend(records)
+                page_info = page.get("pageInfo") or {}
+                if not records and page_info.get("hasNextPage"):
+                    cursors[index] = page_info["endCursor"]
+        return results
+
+
+    def get_location_scan_order(self, location_scan_order_id: str, include_images: bool = False) -> Dict:
+        variables = { "id": location_scan_order_id, "includeImages": include_images }
         return self.query(get_location_scan_order_query, "getLocationScanOrder", variables=variables)
 
 
@@ -270,4 +913,4 @@ class WareAPI:
             "userTrackingToken": user_tracking_token,
         }
 
-        self.query(get_location_scan_orders_query, "getLocationScanOrders", variables=variables)
+        return self.query(get_location_scan_orders_query, "getLocationScanOrders", variables=variables)
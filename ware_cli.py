@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import sys
+import json
+import argparse
+from typing import Any, Dict
+
+from ware_agent import DEFAULT_IDLE_TIMEOUT, AgentClient, AgentError, connect, start_background
+
+
+def _add_command(subparsers, name: str, method: str, help_text: str) -> argparse.ArgumentParser:
+    parser = subparsers.add_parser(name, help=help_text)
+    parser.set_defaults(method=method)
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Interact with the Ware GraphQL API. Requests go through a running ware agent (see `agent start`) when there is
+    # one, and are made in-process otherwise.
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+    parser.add_argument("--endpoint", type=str, help="Optional endpoint value to override the default", default=None)
+    parser.add_argument("--socket", type=str, help="Agent Unix socket path", default=None)
+    parser.add_argument("--no-agent", action="store_true", help="Always run requests in-process")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    _add_command(subparsers, "my-info", "my_info", "Organizations, warehouses and zones of the user")
+
+    command = _add_command(subparsers, "zone-page", "zone_locations_page", "One page of zone locations")
+    command.add_argument("--zone-id", type=str, required=True)
+    command.add_argument("--limit", type=int, default=10)
+    command.add_argument("--cursor", type=str, default=None)
+    command.add_argument("--sort", type=str, default="LATEST")
+    command.add_argument("--include-images", action="store_true")
+
+    command = _add_command(subparsers, "report", "zone_locations_report", "Generate a zone report and print its URL")
+    command.add_argument("--zone-id", type=str, required=True)
+    command.add_argument("--sort", type=str, default="LATEST")
+    command.add_argument("--format", dest="report_format", type=str, default="CSV")
+
+    command = _add_command(subparsers, "scan-order", "get_location_scan_order", "Get a location scan order")
+    command.add_argument("id", help="LocationScanOrder UUID")
+    command.add_argument("--include-images", action="store_true")
+
+    command = _add_command(subparsers, "scan-orders", "get_location_scan_orders", "List location scan orders")
+    command.add_argument("--zone-id", type=str, required=True)
+    command.add_argument("--user-tracking-token", type=str, default=None)
+    command.add_argument("--status", type=str, default=None)
+
+    command = _add_command(subparsers, "create-scan-order", "create_location_scan_order", "Create a location scan order")
+    command.add_argument("--zone-id", type=str, required=True)
+    command.add_argument("--bins", type=str, nargs="+", required=True)
+    command.add_argument("--user-tracking-token", type=str, default=None)
+
+    command = _add_command(subparsers, "clear-required-action", "reset_drone_required_action", "Clear a required action")
+    command.add_argument("required_action_id")
+
+    command = _add_command(
+        subparsers, "upload-status", "get_wms_location_history_upload_record", "Status of a WMS data upload"
+    )
+    command.add_argument("record_id")
+
+    _add_command(subparsers, "metrics", "metrics", "Request metrics of the agent, or of this process")
+
+    agent = subparsers.add_parser("agent", help="Manage the local agent")
+    agent.set_defaults(method=None)
+    agent.add_argument("action", choices=["start", "stop", "status"])
+    agent.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT)
+    return parser
+
+
+# Parser destinations that are not WareAPI parameters
+GLOBAL_OPTIONS = {"endpoint", "socket", "no_agent", "command", "method", "id"}
+
+
+def _params(args: argparse.Namespace) -> Dict[str, Any]:
+    params = {key: value for key, value in vars(args).items() if key not in GLOBAL_OPTIONS}
+    if args.method == "get_location_scan_order":
+        params["location_scan_order_id"] = args.id
+    return params
+
+
+def _agent_command(args: argparse.Namespace) -> Dict:
+    client = AgentClient(args.socket)
+    running = client.available(args.endpoint)
+    if args.action == "status":
+        return client.call("ping") if running else {"running": False}
+    if args.action == "stop":
+        return client.call("shutdown") if running else {"running": False}
+    if running:
+        return client.call("ping")
+    return start_background(host=args.endpoint, socket_path=args.socket, idle_timeout=args.idle_timeout or None)
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+
+    try:
+        if args.command == "agent":
+            result = _agent_command(args)
+        else:
+            client = connect(host=args.endpoint, socket_path=args.socket, use_agent=not args.no_agent)
+            try:
+                result = client.call(args.method, **_params(args))
+            finally:
+                client.close()
+    except AgentError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2))
+    if isinstance(result, dict) and result.get("status") == "error":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@ import hashlib
 import hmac
 
 from base64 import b64encode
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from uuid import uuid4
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, Optional
 
 import boto3
 import websocket
@@ -13,18 +14,18 @@ import json
 
 AWS_SERVICE = "appsync"
 DEFAULT_REGION = "us-east-1"
-SUBSCRIPTION_ID = str(uuid4())  # Client generated subscription ID
+DEFAULT_TIMEOUT_INTERVAL = 10
+# STS session credentials are shared until this long before they expire
+STS_REFRESH_MARGIN = timedelta(minutes=5)
 
-# Set up Timeout Globals
-timeout_timer: threading.Timer = None
-timeout_interval = 10
-graphql_subscription: Dict = {}
-sts_credentials: Dict = {}
-host: str = ""
-data_handler_function: Callable
-websocket_app: websocket.WebSocketApp
+_sts_credentials: Dict[str, Dict] = {}
+_sts_lock = threading.Lock()
+# Running clients by subscription id, so unsubscribe() can find the connection of a subscription
+_clients: Dict[str, "SubscriptionClient"] = {}
+_clients_lock = threading.Lock()
 
 
+@lru_cache(maxsize=32)
 def _get_signature_key(key, date_stamp, region_name, service_name):
     # Key derivation functions. See:
     # http://docs.aws.amazon.com/general/latest/gr/signature-v4-examples.html#signature-v4-examples-python
@@ -51,6 +52,7 @@ def _canonical_headers(headers: Dict[str, Any]) -> str:
 
 
 def _generate_authorization_header(
+    host: str,
     security_token: str,
     aws_access_key: str,
     aws_secret_key: str,
@@ -59,8 +61,6 @@ def _generate_authorization_header(
     request_parameters: str,
 ) -> str:
     # Create a date for headers and the credential string
-    global host
-
     t = datetime.utcnow()
     amz_date = t.strftime("%Y-%m-%dT%H:%M:%SZ")
     header_date = t.strftime("%Y%m%dT%H%M%SZ")
@@ -121,6 +121,7 @@ def _generate_authorization_header(
 
 
 def _generate_iam_header(
+    host: str,
     canonical_uri: str,
     request_parameters: str,
     security_token: str,
@@ -128,8 +129,8 @@ def _generate_iam_header(
     aws_secret_key: str,
 ) -> Dict:
     # Create the AWS IAM header for request signing
-    global host
     iam_signature = _generate_authorization_header(
+        host=host,
         security_token=security_token,
         aws_access_key=aws_access_key,
         aws_secret_key=aws_secret_key,
@@ -160,81 +161,178 @@ def _header_encode(header_obj: Dict) -> str:
     return b64encode(json.dumps(header_obj).encode("utf-8")).decode("utf-8")
 
 
-def reset_timer(ws: websocket.WebSocket) -> None:
-    # reset the keep alive timeout daemon thread
-    global timeout_timer
-    global timeout_interval
-
-    if timeout_timer:
-        timeout_timer.cancel()
-
-    timeout_timer = threading.Timer(timeout_interval, lambda: ws.close())
-    timeout_timer.daemon = True
-    timeout_timer.start()
-
-
-def on_message(ws: websocket.WebSocket, message: str) -> None:
-    # Socket Event Callbacks, used in WebSocketApp Constructor
-    global timeout_timer
-    global timeout_interval
-    global graphql_subscription
-    global sts_credentials
-    global host
-    global data_handler_function
-
-    print("### message ###")
-    print("<< " + message)
+def session_credentials(aws_access_key: str, aws_secret_key: str) -> Dict:
+    """ STS session credentials for an access key, shared by every subscription until shortly before they expire """
+    with _sts_lock:
+        cached = _sts_credentials.get(aws_access_key)
+        if cached is None or cached["Credentials"]["Expiration"] - STS_REFRESH_MARGIN <= datetime.now(timezone.utc):
+            # Use Boto to get our security token from AWS STS
+            sts = boto3.client("sts", aws_access_key_id=aws_access_key, aws_secret_access_key=aws_secret_key)
+            cached = sts.get_session_token()
+            _sts_credentials[aws_access_key] = cached
+        return cached
 
-    message_object = json.loads(message)
-    message_type = message_object["type"]
 
-    if message_type == "ka":
-        reset_timer(ws)
-
-    elif message_type == "connection_ack":
-        timeout_interval = int(json.dumps(message_object["payload"]["connectionTimeoutMs"]))
+class SubscriptionClient:
+    """
+    One realtime subscription over its own websocket. All connection state lives on the instance, so any number of
+    clients can run at once, each blocking the thread that calls run(). STS credentials and signing keys are cached
+    per access key and shared between clients.
+    """
 
-        iam_header = _generate_iam_header(
-            canonical_uri="/graphql",
-            request_parameters=json.dumps(graphql_subscription),
-            security_token=sts_credentials["Credentials"]["SessionToken"],
-            aws_access_key=sts_credentials["Credentials"]["AccessKeyId"],
-            aws_secret_key=sts_credentials["Credentials"]["SecretAccessKey"],
+    def __init__(
+        self,
+        aws_access_key: str,
+        aws_secret_key: str,
+        api_url: str,
+        subscription: str,
+        subscription_variables: Dict,
+        data_handler: Callable,
+        subscription_id: Optional[str] = None,
+        aws_session_token: Optional[str] = None,
+    ):
+        self.aws_access_key = aws_access_key
+        self.aws_secret_key = aws_secret_key
+        # Temporary credentials already carry a session token and are used as they are
+        self.aws_session_token = aws_session_token
+        # Derived values from the AppSync endpoint (api_url)
+        self.wss_url = api_url.replace("https", "wss").replace("appsync-api", "appsync-realtime-api")
+        self.host = api_url.replace("https://", "").replace("/graphql", "")
+        # GraphQL subscription Registration object
+        self.graphql_subscription = {"query": subscription, "variables": subscription_variables}
+        self.data_handler = data_handler
+        self.subscription_id = subscription_id or str(uuid4())
+        self.timeout_interval = DEFAULT_TIMEOUT_INTERVAL
+        self.timeout_timer: Optional[threading.Timer] = None
+        self.lock = threading.Lock()
+        self.sts_credentials: Dict = {}
+        self.websocket_app: Optional[websocket.WebSocketApp] = None
+
+    def _iam_header(self, canonical_uri: str, request_parameters: str) -> Dict:
+        credentials = self.sts_credentials["Credentials"]
+        return _generate_iam_header(
+            host=self.host,
+            canonical_uri=canonical_uri,
+            request_parameters=request_parameters,
+            security_token=credentials["SessionToken"],
+            aws_access_key=credentials["AccessKeyId"],
+            aws_secret_key=credentials["SecretAccessKey"],
         )
-        register = {
-            "id": SUBSCRIPTION_ID,
-            "type": "start",
-            "payload": {
-                "data": json.dumps(graphql_subscription),
-                "extensions": {"authorization": iam_header},
-            },
-        }
-        start_sub = json.dumps(register)
-        print(">> " + start_sub)
-        ws.send(start_sub)
-
-    elif message_type == "data":
-        data_handler_function(ws, message)
-
-    elif message_object["type"] == "error":
-        print("Error from AppSync: " + message_object["payload"])
-
-
-def on_error(ws: websocket.WebSocket, error: str) -> None:
-    print("### error ###")
-    print(error)
 
+    def reset_timer(self, ws: websocket.WebSocket) -> None:
+        # reset the keep alive timeout daemon thread
+        with self.lock:
+            if self.timeout_timer:
+                self.timeout_timer.cancel()
+
+            self.timeout_timer = threading.Timer(self.timeout_interval, lambda: ws.close())
+            self.timeout_timer.daemon = True
+            self.timeout_timer.start()
+
+    def on_message(self, ws: websocket.WebSocket, message: str) -> None:
+        # Socket Event Callbacks, used in WebSocketApp Constructor
+        print("### message ###")
+        print("<< " + message)
+
+        message_object = json.loads(message)
+        message_type = message_object["type"]
+
+        if message_type == "ka":
+            self.reset_timer(ws)
+
+        elif message_type == "connection_ack":
+            self.timeout_interval = int(json.dumps(message_object["payload"]["connectionTimeoutMs"]))
+
+            # The signature covers the exact payload string, so it is serialized once and sent as signed
+            subscription_data = json.dumps(self.graphql_subscription)
+            iam_header = self._iam_header("/graphql", subscription_data)
+            register = {
+                "id": self.subscription_id,
+                "type": "start",
+                "payload": {
+                    "data": subscription_data,
+                    "extensions": {"authorization": iam_header},
+                },
+            }
+            start_sub = json.dumps(register)
+            print(">> " + start_sub)
+            ws.send(start_sub)
+
+        elif message_type == "data":
+            self.data_handler(ws, message)
+
+        elif message_object["type"] == "error":
+            print("Error from AppSync: " + str(message_object["payload"]))
+
+    def on_error(self, ws: websocket.WebSocket, error: str) -> None:
+        print("### error ###")
+        print(error)
+
+    def on_close(self, ws: websocket.WebSocket, *args) -> None:
+        with self.lock:
+            if self.timeout_timer:
+                self.timeout_timer.cancel()
+        print("### closed ###")
+
+    def on_open(self, ws: websocket.WebSocket) -> None:
+        print("### opened ###")
+        init = {"type": "connection_init"}
+        init_conn = json.dumps(init)
+        print(">> " + init_conn)
+        ws.send(init_conn)
+
+    def run(self) -> None:
+        """ Connect and deliver subscription data to the handler until the connection closes """
+        if self.aws_session_token:
+            self.sts_credentials = {"Credentials": {
+                "AccessKeyId": self.aws_access_key,
+                "SecretAccessKey": self.aws_secret_key,
+                "SessionToken": self.aws_session_token,
+            }}
+        else:
+            self.sts_credentials = session_credentials(self.aws_access_key, self.aws_secret_key)
+        iam_header = self._iam_header("/graphql/connect", "{}")
+        # Uncomment to see socket byte streams
+        # websocket.enableTrace(True)
+
+        # Set up the connection URL, which includes the Authentication Header
+        #   and a payload of '{}'.  All info is base 64 encoded
+        connection_url = self.wss_url + "?header=" + _header_encode(iam_header) + "&payload=e30="
+
+        # Create the websocket connection to AppSync's real-time endpoint
+        #  also defines callback functions for websocket events
+        #  NOTE: The connection requires a sub protocol 'graphql-ws'
+        print("Connecting to: " + connection_url)
+
+        self.websocket_app = websocket.WebSocketApp(
+            connection_url,
+            subprotocols=["graphql-ws"],
+            on_open=self.on_open,
+            on_message=self.on_message,
+            on_error=self.on_error,
+            on_close=self.on_close,
+        )
 
-def on_close(ws: websocket.WebSocket) -> None:
-    print("### closed ###")
+        with _clients_lock:
+            _clients[self.subscription_id] = self
+        try:
+            self.websocket_app.run_forever()
+        finally:
+            with _clients_lock:
+                if _clients.get(self.subscription_id) is self:
+                    del _clients[self.subscription_id]
 
+    def stop(self, web_socket: Optional[websocket.WebSocket] = None) -> None:
+        """ Send the stop message for the subscription and close its connection """
+        # Send the close messaging through the websocket
+        deregister = {"type": "stop", "id": self.subscription_id}
+        end_sub = json.dumps(deregister)
+        print(">> " + end_sub)
+        (web_socket or self.websocket_app.sock).send(end_sub)
 
-def on_open(ws: websocket.WebSocket) -> None:
-    print("### opened ###")
-    init = {"type": "connection_init"}
-    init_conn = json.dumps(init)
-    print(">> " + init_conn)
-    ws.send(init_conn)
+        if self.websocket_app is not None:
+            self.websocket_app.keep_running = False
+            self.websocket_app.close()
 
 
 def subscribe(
@@ -244,64 +342,32 @@ def subscribe(
     subscription: str,
     subscription_variables: Dict,
     data_handler: Callable,
+    subscription_id: Optional[str] = None,
+    aws_session_token: Optional[str] = None,
 ) -> None:
-
-    global graphql_subscription
-    global sts_credentials
-    global host
-    global data_handler_function
-    global websocket_app
-
-    # Derived values from the AppSync endpoint (api_url)
-    wss_url = api_url.replace("https", "wss").replace("appsync-api", "appsync-realtime-api")
-    host = api_url.replace("https://", "").replace("/graphql", "")
-    data_handler_function = data_handler
-
-    # Use Boto to get our security token from AWS STS
-    sts = boto3.client("sts", aws_access_key_id=aws_access_key, aws_secret_access_key=aws_secret_key)
-    sts_credentials = sts.get_session_token()
-
-    # GraphQL subscription Registration object
-    graphql_subscription = {"query": subscription, "variables": subscription_variables}
-    iam_header = _generate_iam_header(
-        canonical_uri="/graphql/connect",
-        request_parameters="{}",
-        security_token=sts_credentials["Credentials"]["SessionToken"],
-        aws_access_key=sts_credentials["Credentials"]["AccessKeyId"],
-        aws_secret_key=sts_credentials["Credentials"]["SecretAccessKey"],
-    )
-    # Uncomment to see socket byte streams
-    # websocket.enableTrace(True)
-
-    # Set up the connection URL, which includes the Authentication Header
-    #   and a payload of '{}'.  All info is base 64 encoded
-    connection_url = wss_url + "?header=" + _header_encode(iam_header) + "&payload=e30="
-
-    # Create the websocket connection to AppSync's real-time endpoint
-    #  also defines callback functions for websocket events
-    #  NOTE: The connection requires a sub protocol 'graphql-ws'
-    print("Connecting to: " + connection_url)
-
-    websocket_app = websocket.WebSocketApp(
-        connection_url,
-        subprotocols=["graphql-ws"],
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close,
-    )
-
-    websocket_app.run_forever()
+    """
+    Run a SubscriptionClient in the calling thread until its connection closes. Without aws_session_token, STS
+    session credentials are fetched for the long-term keys
+    """
+    SubscriptionClient(
+        aws_access_key=aws_access_key,
+        aws_secret_key=aws_secret_key,
+        api_url=api_url,
+        subscription=subscription,
+        subscription_variables=subscription_variables,
+        data_handler=data_handler,
+        subscription_id=subscription_id,
+        aws_session_token=aws_session_token,
+    ).run()
 
 
 def unsubscribe(subscription_id: str, web_socket: websocket.WebSocket) -> None:
-    global websocket_app
-
-    # Send the close messaging through the websocket
-    deregister = {"type": "stop", "id": subscription_id}
-    end_sub = json.dumps(deregister)
-    print(">> " + end_sub)
-    web_socket.send(end_sub)
-
-    websocket_app.close()
-    websocket_app.keep_running = False
+    with _clients_lock:
+        client = _clients.get(subscription_id)
+
+    if client is None:
+        # Not started by this process: only the stop message can be sent
+        web_socket.send(json.dumps({"type": "stop", "id": subscription_id}))
+        web_socket.close()
+        return
+    client.stop(web_socket)
@@ -0,0 +1,221 @@
+import os
+import json
+import shutil
+import tempfile
+import zlib
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ware_api import RecordExceptionType
+
+DEFAULT_PARTITIONS = 64
+# Number of buffered partition rows after which every partition is spilled to disk
+DEFAULT_MEMORY_ROWS = 500_000
+# How many times a partition larger than memory_rows is split again before it is read whole
+MAX_PARTITION_DEPTH = 4
+
+WMS_SOURCE = "wms"
+SCAN_SOURCE = "scan"
+
+
+class _Partitions:
+    """
+    Rows hashed by their key column into a fixed number of partitions. Rows are buffered in memory and once more than
+    memory_rows are buffered, all buffers are appended to one spill file per partition. A partition that holds more
+    than memory_rows rows when it is read is split again with a differently seeded hash, so at most about memory_rows
+    rows are held at once unless a single key has more rows than that.
+    """
+
+    def __init__(self, count: int, memory_rows: int, directory: str, name: str, key_column: int = 1, depth: int = 0):
+        self.count = count
+        self.memory_rows = memory_rows
+        self.directory = directory
+        self.name = name
+        self.key_column = key_column
+        self.depth = depth
+        self.paths = [os.path.join(directory, f"{name}-{index}.ndjson") for index in range(count)]
+        self.buffers: List[List] = [[] for _ in range(count)]
+        self.sizes = [0] * count
+        self.buffered = 0
+
+    def _partition(self, key: str) -> int:
+        # crc32 is fast but linear, so reseeding it would keep rows that collided together; deeper levels use a salt
+        if self.depth == 0:
+            return zlib.crc32(key.encode("utf-8")) % self.count
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4, salt=self.depth.to_bytes(8, "little")).digest()
+        return int.from_bytes(digest, "little") % self.count
+
+    def add(self, row: List) -> None:
+        index = self._partition(row[self.key_column])
+        self.buffers[index].append(row)
+        self.sizes[index] += 1
+        self.buffered += 1
+        if self.buffered >= self.memory_rows:
+            self.spill()
+
+    def spill(self) -> None:
+        for path, buffer in zip(self.paths, self.buffers):
+            if buffer:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(row, separators=(",", ":")) + "\n" for row in buffer)
+                buffer.clear()
+        self.buffered = 0
+
+    def _spilled_rows(self, path: str) -> Iterator[List]:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def __iter__(self) -> Iterator[List[List]]:
+        """ Yield the rows of one partition at a time. Every row of a key is in the same partition """
+        for index, (path, buffer) in enumerate(zip(self.paths, self.buffers)):
+            if self.sizes[index] <= self.memory_rows or self.depth >= MAX_PARTITION_DEPTH:
+                rows = list(self._spilled_rows(path))
+                rows.extend(buffer)
+                yield rows
+            else:
+                split = _Partitions(
+                    self.count, self.memory_rows, self.directory, f"{self.name}-{index}", self.key_column, self.depth + 1
+                )
+                for row in self._spilled_rows(path):
+                    split.add(row)
+                for row in buffer:
+                    split.add(row)
+                buffer.clear()
+                os.remove(path)
+                yield from split
+            self.buffers[index] = []
+
+
+def _clean(value) -> str:
+    return str(value).strip() if value is not None else ""
+
+
+def scanned_inventory(records: Iterable[Dict]) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Flatten crawled zoneLocationsPageV2 page items (or bare records) into (location, LPN) pairs.
+    Scanned locations without LPN inventory yield (location, None) so empty bins still take part in the join.
+    """
+    for item in records:
+        record = item.get("record", item)
+        if not record:
+            continue
+        lpns = [
+            inventory["text"]
+            for inventory in record.get("inventory") or []
+            if inventory.get("type", "LPN") == "LPN" and inventory.get("text")
+        ]
+        for lpn in lpns or [None]:
+            yield record["binName"], lpn
+
+
+def wms_inventory(
+    rows: Iterable[Dict], location_column: str = "Location", lpn_column: str = "LPN"
+) -> Iterator[Tuple[str, Optional[str]]]:
+    """ (location, LPN) pairs from WMS rows in the WMSLocationHistoryRecord shape, e.g. from spreadsheet_rows """
+    for row in rows:
+        location = _clean(row.get(location_column))
+        if location:
+            yield location, _clean(row.get(lpn_column)) or None
+
+
+def _mismatch(exception_type: RecordExceptionType, location: Optional[str], lpns: List[str], **parameters) -> Dict:
+    # Same field names as RecordExceptionParameters
+    return dict(type=exception_type.value, binLocation=location, lpn=lpns, **parameters)
+
+
+def reconcile(
+    wms_pairs: Iterable[Tuple[str, Optional[str]]],
+    scan_pairs: Iterable[Tuple[str, Optional[str]]],
+    partitions: int = DEFAULT_PARTITIONS,
+    memory_rows: int = DEFAULT_MEMORY_ROWS,
+    work_directory: Optional[str] = None,
+) -> Iterator[Dict]:
+    """
+    Compare live WMS inventory against scanned inventory and yield one mismatch per discrepancy, categorized like
+    RecordExceptionType with RecordExceptionParameters style fields:
+
+    - DETECTED_UNEXPECTED_PALLET_LPN: an LPN was scanned at a location where the WMS does not have it
+    - MISSING_LPN: the WMS has an LPN at a scanned location where it was not seen
+    - LPN_MULTI_ASSIGNMENT: an LPN was scanned at, or is assigned by the WMS to, more than one location
+
+    Only locations that were scanned are checked against the WMS. Both inputs are streamed through a partitioned
+    hash join, first by location and then by LPN, spilling partitions to work_directory for large zones.
+    """
+    directory = tempfile.mkdtemp(prefix="ware-reconcile-", dir=work_directory)
+    try:
+        by_location = _Partitions(partitions, memory_rows, directory, "location")
+        for source, pairs in ((WMS_SOURCE, wms_pairs), (SCAN_SOURCE, scan_pairs)):
+            for location, lpn in pairs:
+                by_location.add([source, location, lpn])
+
+        by_lpn = _Partitions(partitions, memory_rows, directory, "lpn")
+        for rows in by_location:
+            locations: Dict[str, Dict[str, set]] = {}
+            for source, location, lpn in rows:
+                entry = locations.setdefault(location, {WMS_SOURCE: set(), SCAN_SOURCE: set(), "present": set()})
+                entry["present"].add(source)
+                if lpn:
+                    entry[source].add(lpn)
+
+            for location, entry in locations.items():
+                for source in (WMS_SOURCE, SCAN_SOURCE):
+                    for lpn in entry[source]:
+                        by_lpn.add([source, lpn, location])
+
+                if SCAN_SOURCE not in entry["present"]:
+                    continue
+                location_in_wms = WMS_SOURCE in entry["present"]
+                wms_lpns = sorted(entry[WMS_SOURCE])
+                for lpn in entry[SCAN_SOURCE] - entry[WMS_SOURCE]:
+                    by_lpn.add(["unexpected", lpn, location, wms_lpns, location_in_wms])
+                for lpn in entry[WMS_SOURCE] - entry[SCAN_SOURCE]:
+                    by_lpn.add(["missing", lpn, location, wms_lpns, location_in_wms])
+
+        # The LPN pass adds what only a join across locations knows: where else the WMS and the scans put each LPN
+        for rows in by_lpn:
+            lpns: Dict[str, Dict[str, set]] = {}
+            candidates = []
+            for row in rows:
+                if row[0] in (WMS_SOURCE, SCAN_SOURCE):
+                    lpns.setdefault(row[1], {WMS_SOURCE: set(), SCAN_SOURCE: set()})[row[0]].add(row[2])
+                else:
+                    candidates.append(row)
+
+            for kind, lpn, location, wms_lpns, location_in_wms in candidates:
+                seen = lpns.get(lpn, {WMS_SOURCE: set(), SCAN_SOURCE: set()})
+                if kind == "unexpected":
+                    yield _mismatch(
+                        RecordExceptionType.DETECTED_UNEXPECTED_PALLET_LPN,
+                        location,
+                        [lpn],
+                        wmsReportedLpns=wms_lpns,
+                        wmsReportedBinLocation=sorted(seen[WMS_SOURCE]),
+                        lpnPresentInWms=bool(seen[WMS_SOURCE]),
+                        locationPresentInWms=location_in_wms,
+                    )
+                else:
+                    yield _mismatch(
+                        RecordExceptionType.MISSING_LPN,
+                        location,
+                        [lpn],
+                        wmsReportedLpns=wms_lpns,
+                        wmsReportedBinLocation=[location],
+                        binLocations=sorted(seen[SCAN_SOURCE]),
+                        lpnPresentInWms=True,
+                        locationPresentInWms=location_in_wms,
+                    )
+
+            for lpn, seen in lpns.items():
+                if len(seen[SCAN_SOURCE]) > 1 or len(seen[WMS_SOURCE]) > 1:
+                    yield _mismatch(
+                        RecordExceptionType.LPN_MULTI_ASSIGNMENT,
+                        None,
+                        [lpn],
+                        binLocations=sorted(seen[SCAN_SOURCE]),
+                        wmsReportedBinLocation=sorted(seen[WMS_SOURCE]),
+                        lpnPresentInWms=bool(seen[WMS_SOURCE]),
+                    )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
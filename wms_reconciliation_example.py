@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import sys
+import json
+import argparse
+from collections import Counter
+from ware_api import WareAPI, DEFAULT_HOST
+from spreadsheet_rows import iter_spreadsheet_rows
+from wms_reconciliation import reconcile, scanned_inventory, wms_inventory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Compare a local WMS export against the latest scanned inventory of a zone without uploading it to Ware
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+
+    parser.add_argument(
+        "--endpoint", type=str, help="Optional endpoint value to override the default", default=DEFAULT_HOST
+    )
+    parser.add_argument("--zone-id", type=str, help="Zone ID that the WMS export pertains to", required=True)
+    parser.add_argument("--file", type=str, help="WMS export (CSV or XLSX) with Location and LPN columns", required=True)
+    parser.add_argument("--output", type=str, help="Optional NDJSON output file, defaults to stdout", default=None)
+    parser.add_argument("--work-dir", type=str, help="Optional directory for spilled join partitions", default=None)
+    args = parser.parse_args()
+
+    api = WareAPI(host=args.endpoint)
+
+    mismatches = reconcile(
+        wms_inventory(iter_spreadsheet_rows(args.file)),
+        scanned_inventory(api.iter_zone_locations(args.zone_id, limit=100)),
+        work_directory=args.work_dir,
+    )
+
+    counts = Counter()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for mismatch in mismatches:
+            counts[mismatch["type"]] += 1
+            output.write(json.dumps(mismatch) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+    print(json.dumps(counts, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
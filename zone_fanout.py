@@ -0,0 +1,176 @@
+import os
+import json
+import time
+from fnmatch import fnmatchcase
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from ware_api import WareAPI, WareAPIError
+from local_storage import atomic_write_json, read_json
+
+DEFAULT_WORKERS = 8
+DEFAULT_TOPOLOGY_MAX_AGE = 3600
+
+
+class ZoneTopology:
+    """
+    Flattened organizations -> warehouses -> zones view of myInfo. Each zone is a dict with id, name, aisles,
+    warehouseId, warehouseName and organizationName.
+    """
+
+    def __init__(self, my_info_data: Dict):
+        self.zones: List[Dict] = []
+        for organization in my_info_data.get("organizations") or []:
+            for warehouse in organization.get("warehouses") or []:
+                for zone in warehouse.get("zones") or []:
+                    self.zones.append({
+                        "id": zone["id"],
+                        "name": zone["name"],
+                        "aisles": zone.get("aisles") or [],
+                        "warehouseId": warehouse["id"],
+                        "warehouseName": warehouse["name"],
+                        "organizationName": organization["name"],
+                    })
+
+    @classmethod
+    def load(
+        cls, api: WareAPI, cache_path: Optional[str] = None, max_age: float = DEFAULT_TOPOLOGY_MAX_AGE
+    ) -> "ZoneTopology":
+        """ Build the topology from myInfo, reusing a copy cached at cache_path while it is younger than max_age """
+        if cache_path and (cached := read_json(cache_path)) and time.time() - cached["fetched"] < max_age:
+            return cls(cached["myInfo"])
+
+        result = api.my_info()
+        if result["status"] != "success":
+            raise WareAPIError(result)
+        if cache_path:
+            atomic_write_json(cache_path, {"fetched": time.time(), "myInfo": result["data"]})
+        return cls(result["data"])
+
+    def select(self, selectors: Union[str, Iterable[str]]) -> List[Dict]:
+        """
+        Zones matching any of the selectors, in topology order:
+
+        - "all" or "*": every zone
+        - "warehouse:<id or name glob>" / "org:<name glob>": every zone of the matching warehouses or organizations
+        - anything else: a zone id, or a glob matched against zone names
+        """
+        if isinstance(selectors, str):
+            selectors = [selectors]
+        selectors = list(selectors)
+
+        def matches(zone: Dict, selector: str) -> bool:
+            if selector in ("all", "*"):
+                return True
+            if selector.startswith("warehouse:"):
+                pattern = selector[len("warehouse:"):]
+                return zone["warehouseId"] == pattern or fnmatchcase(zone["warehouseName"], pattern)
+            if selector.startswith("org:"):
+                return fnmatchcase(zone["organizationName"], selector[len("org:"):])
+            return zone["id"] == selector or fnmatchcase(zone["name"], selector)
+
+        return [zone for zone in self.zones if any(matches(zone, selector) for selector in selectors)]
+
+
+class ZoneResult:
+    def __init__(self, zone: Dict, result: Any = None, error: Optional[BaseException] = None, elapsed: float = 0.0):
+        self.zone = zone
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        if self.error is not None:
+            return False
+        return not (isinstance(self.result, dict) and self.result.get("status") == "error")
+
+
+def fan_out(
+    api: WareAPI,
+    zones: List[Dict],
+    operation: Callable[[WareAPI, Dict], Any],
+    max_workers: int = DEFAULT_WORKERS,
+    max_per_warehouse: Optional[int] = None,
+    lane: Optional[str] = "bulk",
+) -> Iterator[ZoneResult]:
+    """
+    Run operation(api, zone) for every zone on a bounded pool of worker threads and yield a ZoneResult as each
+    zone finishes. Zones are scheduled round-robin across warehouses, optionally at most max_per_warehouse at a
+    time, so one large warehouse cannot hold every worker. An exception only fails its own zone. Requests are made
+    in the given scheduler lane, so a fan-out does not delay interactive requests of a WareAPI with a scheduler.
+    """
+    # Validated here rather than in the generator, so a bad argument fails the call instead of the first next()
+    if max_per_warehouse is not None and max_per_warehouse < 1:
+        raise ValueError("max_per_warehouse must be at least 1")
+    return _fan_out(api, zones, operation, max_workers, max_per_warehouse, lane)
+
+
+def _fan_out(
+    api: WareAPI,
+    zones: List[Dict],
+    operation: Callable[[WareAPI, Dict], Any],
+    max_workers: int,
+    max_per_warehouse: Optional[int],
+    lane: Optional[str],
+) -> Iterator[ZoneResult]:
+    pending: Dict[str, List[Dict]] = {}
+    for zone in zones:
+        pending.setdefault(zone["warehouseId"], []).append(zone)
+    warehouses = list(pending)
+    running: Dict[str, int] = {warehouse: 0 for warehouse in warehouses}
+    futures: Dict[Future, Dict] = {}
+    turn = 0
+
+    def run(zone: Dict) -> ZoneResult:
+        started = time.perf_counter()
+        try:
+            with api.lane(lane):
+                return ZoneResult(zone, operation(api, zone), elapsed=time.perf_counter() - started)
+        except Exception as e:
+            return ZoneResult(zone, error=e, elapsed=time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or futures:
+            # Fill free workers, taking one zone from each warehouse in turn
+            while len(futures) < max_workers and pending:
+                eligible = [
+                    warehouse for warehouse in warehouses
+                    if warehouse in pending and (max_per_warehouse is None or running[warehouse] < max_per_warehouse)
+                ]
+                if not eligible:
+                    break
+                warehouse = eligible[turn % len(eligible)]
+                turn += 1
+                zone = pending[warehouse].pop(0)
+                if not pending[warehouse]:
+                    del pending[warehouse]
+                running[warehouse] += 1
+                futures[executor.submit(run, zone)] = zone
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                zone = futures.pop(future)
+                running[zone["warehouseId"]] -= 1
+                yield future.result()
+
+
+def crawl_to_ndjson(directory: str, **crawl_options) -> Callable[[WareAPI, Dict], Dict]:
+    """ Operation that crawls a zone into <directory>/<zone id>.ndjson and returns the number of records written """
+    os.makedirs(directory, exist_ok=True)
+
+    def crawl(api: WareAPI, zone: Dict) -> Dict:
+        path = os.path.join(directory, f"{zone['id']}.ndjson")
+        count = 0
+        with open(path, "w", encoding="utf-8") as f:
+            for item in api.iter_zone_locations(zone["id"], **crawl_options):
+                f.write(json.dumps(item, separators=(",", ":")) + "\n")
+                count += 1
+        return {"status": "success", "data": {"path": path, "records": count}}
+
+    return crawl
+
+
+def zone_method(method: str, **kwargs) -> Callable[[WareAPI, Dict], Any]:
+    """ Operation calling a zone scoped WareAPI method, e.g. zone_method("zone_locations_report") """
+    return lambda api, zone: getattr(api, method)(zone["id"], **kwargs)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+import json
+import argparse
+from ware_api import WareAPI, DEFAULT_HOST
+from zone_fanout import DEFAULT_WORKERS, ZoneTopology, crawl_to_ndjson, fan_out, zone_method
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="""
+    # Run a zone scoped Ware GraphQL API operation across many zones at once
+    # To use this tool you must define 2 environment variables (AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY).
+    # You can get these values from your Ware service representative.
+    # """
+    )
+
+    parser.add_argument(
+        "--endpoint", type=str, help="Optional endpoint value to override the default", default=DEFAULT_HOST
+    )
+    parser.add_argument(
+        "--zones",
+        nargs="+",
+        default=["all"],
+        help='Zone selectors: "all", "warehouse:<id or name glob>", "org:<name glob>", a zone id or a zone name glob',
+    )
+    parser.add_argument("--operation", choices=["report", "scan-orders", "crawl"], default="scan-orders")
+    parser.add_argument("--output-dir", type=str, help="Directory for crawl output", default="zone_crawls")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--topology-cache", type=str, help="Optional file used to cache myInfo", default=None)
+    args = parser.parse_args()
+
+    api = WareAPI(host=args.endpoint)
+    zones = ZoneTopology.load(api, cache_path=args.topology_cache).select(args.zones)
+
+    if args.operation == "report":
+        operation = zone_method("zone_locations_report")
+    elif args.operation == "crawl":
+        operation = crawl_to_ndjson(args.output_dir, limit=100)
+    else:
+        operation = zone_method("get_location_scan_orders")
+
+    for zone_result in fan_out(api, zones, operation, max_workers=args.workers):
+        print(json.dumps({
+            "zoneId": zone_result.zone["id"],
+            "zoneName": zone_result.zone["name"],
+            "ok": zone_result.ok,
+            "seconds": round(zone_result.elapsed, 3),
+            "result": zone_result.result if zone_result.error is None else str(zone_result.error),
+        }))
+
+
+if __name__ == "__main__":
+    main()
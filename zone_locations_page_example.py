@@ -3,6 +3,7 @@ import uuid
 import json
 import argparse
 from ware_api import Pagination, RecordSort, WareAPI, DEFAULT_HOST
+from crawl_checkpoint import ResumableCrawl
 
 
 def main() -> None:
@@ -18,6 +19,9 @@ def main() -> None:
         "--endpoint", type=str, help="Optional endpoint value to override the default", default=DEFAULT_HOST
     )
     parser.add_argument("--zone_id", type=str, help="Zone ID that the query pertains to")
+    parser.add_argument(
+        "--checkpoint-dir", type=str, help="Optional directory used to resume an interrupted crawl", default=None
+    )
     args = parser.parse_args()
 
     api = WareAPI(host=args.endpoint)
@@ -26,6 +30,16 @@ def main() -> None:
     try:
         # zone_id should be a valid UUID4
         zone_uuid = uuid.UUID(f"urn:uuid:{args.zone_id}")
+
+        if args.checkpoint_dir:
+            # Progress is saved after every page, so rerunning the same command continues where it stopped
+            crawl = ResumableCrawl(
+                api, str(zone_uuid), args.checkpoint_dir, sort=RecordSort.LATEST, record_filter={"statusFilter": []}
+            )
+            for item in crawl:
+                print(json.dumps(item, indent=2))
+            return
+
         more_data = True
         cursor = None
 
@@ -2,7 +2,9 @@
 import argparse
 import uuid
 
-from ware_api import DEFAULT_HOST, RecordSort, WareAPI
+from ware_api import DEFAULT_HOST, RecordSort, ReportFormat, WareAPI
+from report_pipeline import download_report
+from spreadsheet_rows import iter_spreadsheet_rows
 
 
 def main() -> None:
@@ -23,6 +25,12 @@ def main() -> None:
     parser.add_argument(
         "--zone-id", type=str, help="Zone ID that the query pertains to"
     )
+    parser.add_argument(
+        "--format", choices=[f.value for f in ReportFormat], default=ReportFormat.CSV.value
+    )
+    parser.add_argument(
+        "--download", type=str, help="Optional file to download the report to", default=None
+    )
     args = parser.parse_args()
 
     api = WareAPI(host=args.endpoint)
@@ -31,29 +39,33 @@ def main() -> None:
     try:
         # zone_id should be a valid UUID4
         zone_uuid = uuid.UUID(f"urn:uuid:{args.zone_id}")
-        more_data = True
 
-        while more_data:
-            zone_locations_report_result = api.zone_locations_report(
-                str(zone_uuid),
-                sort=RecordSort.LATEST,
-                record_filter={"statusFilter": []},
-            )
-            if zone_locations_report_result["status"] != "success":
-                print(
-                    f"Error calling zoneLocationsReport: "
-                    f"{zone_locations_report_result['message']}."
-                )
-                break
-            zone_report_data = zone_locations_report_result["data"]
+        zone_locations_report_result = api.zone_locations_report(
+            str(zone_uuid),
+            sort=RecordSort.LATEST,
+            report_format=ReportFormat(args.format),
+            record_filter={"statusFilter": []},
+        )
+        if zone_locations_report_result["status"] != "success":
             print(
-                f"zoneLocationReportFound at "
-                f"{zone_report_data['zoneInventoryReportUrl']}"
+                f"Error calling zoneLocationsReport: "
+                f"{zone_locations_report_result['message']}."
             )
+            return
+        zone_report_data = zone_locations_report_result["data"]
+        print(
+            f"zoneLocationReportFound at "
+            f"{zone_report_data['zoneInventoryReportUrl']}"
+        )
+
+        if args.download:
+            # Fetch the report with parallel range requests, then stream its rows
+            download_report(zone_report_data["zoneInventoryReportUrl"], args.download)
+            row_count = sum(1 for _ in iter_spreadsheet_rows(args.download, args.format))
+            print(f"Downloaded {row_count} rows to {args.download}")
 
     except TypeError:
         print("Invalid zone_id returned")
 
-
 if __name__ == "__main__":
     main()